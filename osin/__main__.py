@@ -30,13 +30,20 @@ def init(data):
     "--certfile", default=None, help="Path to the certificate signing request"
 )
 @click.option("--keyfile", default=None, help="Path to the key file")
+@click.option(
+    "--decode-workers",
+    default=0,
+    help="Number of threads decoding complex objects of a page of examples (0: no threads)",
+)
 def start(
     data: str,
     wsgi: bool,
     port: int,
     certfile: str,
     keyfile: str,
+    decode_workers: int,
 ):
+    OsinRepository.instance = OsinRepository(data, n_decode_workers=decode_workers)
     init_db(OsinRepository.get_instance(data).get_db_file())
 
     if certfile is None or keyfile is None:
@@ -79,6 +86,43 @@ def compare_run_parameters(data: str, runs: list[int]):
         )
 
 
+@click.command(name="blob-stats")
+@click.option("-d", "--data", required=True, help="data directory of osin")
+def blob_stats(data: str):
+    """Report the size and deduplication ratio of the blob store"""
+    stats = OsinRepository.get_instance(data).blob_store.stats()
+    print(orjson_dumps(stats, option=orjson.OPT_INDENT_2).decode())
+
+
+@click.command(name="blob-gc")
+@click.option("-d", "--data", required=True, help="data directory of osin")
+@click.option(
+    "--grace-period",
+    default=24 * 3600,
+    help="only delete unreferenced blobs that have not been used for this many seconds",
+)
+def blob_gc(data: str, grace_period: float):
+    """Delete blobs that are not referenced by any run (e.g., of replaced runs or unfinished uploads)"""
+    n_blobs = OsinRepository.get_instance(data).blob_store.gc(grace_period)
+    print(f"Deleted {n_blobs} unreferenced blobs")
+
+
+@click.command()
+@click.option("-e", "--endpoint", required=True, help="URL of the osin server")
+@click.option(
+    "-t",
+    "--tmpdir",
+    default="/tmp/osin",
+    help="directory of the runs recorded in spool mode (`tmpdir` of `Osin.remote`)",
+)
+def sync(endpoint: str, tmpdir: str):
+    """Send runs recorded in spool mode to the server"""
+    from osin.apis.remote_osin import RemoteOsin
+
+    n_ops = RemoteOsin(endpoint, tmpdir).sync()
+    print(f"Synced {n_ops} operations")
+
+
 @click.group()
 def cli():
     pass
@@ -87,6 +131,9 @@ def cli():
 cli.add_command(init)
 cli.add_command(start)
 cli.add_command(compare_run_parameters)
+cli.add_command(blob_stats)
+cli.add_command(blob_gc)
+cli.add_command(sync)
 
 
 if __name__ == "__main__":
@@ -15,6 +15,8 @@ from osin.models.exp import (
     NestedPrimitiveOutput,
     RunMetadata,
 )
+from osin.formats import RunDataFormat
+from osin.formats.base import SaveTimings
 from osin.repository import OsinRepository
 from osin.types import NestedPrimitiveOutputSchema, PyObject
 
@@ -38,10 +40,16 @@ class Osin(ABC):
         return LocalOsin(osin_dir)
 
     @staticmethod
-    def remote(endpoint: str, tmpdir: Union[Path, str] = "/tmp/osin"):
+    def remote(
+        endpoint: str,
+        tmpdir: Union[Path, str] = "/tmp/osin",
+        background_upload: bool = False,
+        **kwargs,
+    ):
+        """Connect to an osin server, see `RemoteOsin` for the options"""
         from osin.apis.remote_osin import RemoteOsin
 
-        return RemoteOsin(endpoint, tmpdir)
+        return RemoteOsin(endpoint, tmpdir, background_upload, **kwargs)
 
     def init_exp(
         self,
@@ -117,12 +125,32 @@ class Osin(ABC):
         self,
         exp: RemoteExp,
         params: Dict[str, DataClassInstance],
+        stream_batch_size: Optional[int] = None,
+        data_format: Optional[RunDataFormat] = None,
+        live: bool = False,
     ) -> RemoteExpRun:
-        """Create a new run for an experiment."""
+        """Create a new run for an experiment.
+
+        Args:
+            exp: The experiment
+            params: The parameters of the run
+            stream_batch_size: If provided, outputs of individual examples are appended to the
+                run data file in batches of this size while the run progresses instead of being
+                kept in memory until the run finishes. An example can only be updated until its
+                batch is written.
+            data_format: The format to store the run data (e.g., to configure compression of
+                complex objects). If not provided, the default format of the repository is used.
+            live: Whether outputs of individual examples can be browsed while the run is in
+                progress (streaming mode only, not supported by `RemoteOsin`). The primitive
+                outputs of individual examples are fixed by the first batch, and their complex
+                outputs are only available after the run finishes.
+        """
+        if live and stream_batch_size is None:
+            raise ValueError("Live runs require streaming mode (stream_batch_size)")
         ser_params = {}
         for ns, param in params.items():
             ser_params[ns] = param_as_dict(param)
-        exp_run = self._create_exprun(ExpRun(exp=exp.id, params=ser_params))
+        exp_run = self._start_exprun(exp, ExpRun(exp=exp.id, params=ser_params))
 
         rundir = self.osin_keeper.get_exp_run_dir(exp, exp_run)
         if rundir.exists():
@@ -139,7 +167,16 @@ class Osin(ABC):
             created_time=exp_run.created_time,
             finished_time=None,
             osin=self,
+            data_format=data_format,
         )
+        if stream_batch_size is not None:
+            remote_exp_run.stream_writer = self.osin_keeper.get_exp_run_data_format(
+                exp, remote_exp_run
+            ).open_stream_writer(
+                self.osin_keeper.get_exp_run_data_file(exp, remote_exp_run),
+                stream_batch_size,
+                live=live,
+            )
 
         atexit.register(
             self._cleanup,
@@ -151,10 +188,26 @@ class Osin(ABC):
         """Flush whatever remaining in experiment run that haven't sent to the server before stopping the experiment run."""
         exp_run.finished_time = datetime.utcnow()
 
-        self.osin_keeper.get_exp_run_data_format(exp_run.exp, exp_run).save_run_data(
-            exp_run.pending_output,
-            self.osin_keeper.get_exp_run_data_file(exp_run.exp, exp_run),
-        )
+        if exp_run.stream_writer is not None:
+            # examples have been written during the run, only need to seal the file
+            exp_run.stream_writer.close(exp_run.pending_output.aggregated)
+        else:
+            timings = SaveTimings()
+            self.osin_keeper.get_exp_run_data_format(
+                exp_run.exp, exp_run
+            ).save_run_data(
+                exp_run.pending_output,
+                self.osin_keeper.get_exp_run_data_file(exp_run.exp, exp_run),
+                timings,
+            )
+            logger.debug(
+                "Saved data of exp run {} in {:.2f}s (serialize: {:.2f}s, wait: {:.2f}s, write: {:.2f}s)",
+                exp_run.id,
+                timings.total,
+                timings.serialize,
+                timings.wait,
+                timings.write,
+            )
 
         metadata = RunMetadata.auto()
         # save metadata
@@ -179,13 +232,7 @@ class Osin(ABC):
                 )
             )
             has_invalid_agg_output_schema = False
-            self._update_exp(
-                exp_run.exp.id,
-                Exp(
-                    aggregated_primitive_outputs=exp_run.exp.aggregated_primitive_outputs
-                ),
-                ["aggregated_primitive_outputs"],
-            )
+            self._save_agg_output_schema(exp_run.exp)
         else:
             has_invalid_agg_output_schema = (
                 not exp_run.exp.aggregated_primitive_outputs.does_data_match(
@@ -194,9 +241,8 @@ class Osin(ABC):
             )
 
         self.osin_keeper.get_exp_run_success_file(exp_run.exp, exp_run).touch()
-        self._upload_exprun(exp_run)
-        self._update_exprun(
-            exp_run.id,
+        self._finish_exprun(
+            exp_run,
             ExpRun(
                 is_finished=True,
                 is_successful=is_successful,
@@ -239,7 +285,11 @@ class Osin(ABC):
         if primitive is not None:
             validate_primitive_data(primitive)
 
-        if example_id in exp_run.pending_output.individual:
+        if exp_run.stream_writer is not None:
+            exp_run.stream_writer.update_example(
+                example_id, example_name, primitive=primitive, complex=complex
+            )
+        elif example_id in exp_run.pending_output.individual:
             exp_run.pending_output.individual[example_id].name = example_name
             exp_run.pending_output.individual[example_id].data.primitive.update(
                 primitive or {}
@@ -312,3 +362,21 @@ class Osin(ABC):
     @abstractmethod
     def _upload_exprun(self, exprun: RemoteExpRun):
         pass
+
+    def _start_exprun(self, exp: RemoteExp, exprun: ExpRun) -> ExpRun:
+        """Create a new run of an experiment"""
+        return self._create_exprun(exprun)
+
+    def _save_agg_output_schema(self, exp: RemoteExp):
+        """Save the schema of the aggregated primitive outputs of an experiment, inferred from
+        its first finished run"""
+        self._update_exp(
+            exp.id,
+            Exp(aggregated_primitive_outputs=exp.aggregated_primitive_outputs),
+            ["aggregated_primitive_outputs"],
+        )
+
+    def _finish_exprun(self, exp_run: RemoteExpRun, exprun: ExpRun, fields: List[str]):
+        """Upload the files of a finished run, then update the run to mark it as finished"""
+        self._upload_exprun(exp_run)
+        self._update_exprun(exp_run.id, exprun, fields)
@@ -16,22 +16,33 @@ from osin.types import (
 
 if TYPE_CHECKING:
     from osin.apis.osin import Osin
+    from osin.formats.base import RunDataFormat
+    from osin.formats.hdf5 import Hdf5StreamWriter
 
 
 @dataclass
 class RemoteExp:
-    id: int
+    # None until the experiment is sent to the server with its first run (see `init_request`)
+    id: Optional[int]
     name: str
     version: int
     params: Dict[str, ParamSchema]
     aggregated_primitive_outputs: Optional[NestedPrimitiveOutputSchema]
     osin: Osin
+    # request getting or creating the experiment, sent with the request creating its first run
+    # (`RemoteOsin`)
+    init_request: Optional[dict] = None
 
     def new_exp_run(
         self,
         params: dict[str, DataClassInstance],
+        stream_batch_size: Optional[int] = None,
+        data_format: Optional[RunDataFormat] = None,
+        live: bool = False,
     ) -> RemoteExpRun:
-        return self.osin.new_exp_run(self, params)
+        return self.osin.new_exp_run(
+            self, params, stream_batch_size, data_format, live=live
+        )
 
 
 @dataclass
@@ -45,6 +56,10 @@ class RemoteExpRun:
     rundir: Path
     osin: Osin
     pending_output: ExpRunData = field(default_factory=ExpRunData)
+    # format to store the run data, None to use the default format of the repository
+    data_format: Optional[RunDataFormat] = None
+    # writer appending outputs of individual examples to disk during the run (streaming mode)
+    stream_writer: Optional[Hdf5StreamWriter] = None
 
     def update_output(
         self,
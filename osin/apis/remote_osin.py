@@ -1,19 +1,28 @@
 from __future__ import annotations
 
+import atexit
+import gzip
+import hashlib
 from dataclasses import asdict
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 from gena.deserializer import get_deserializer_from_type
 from loguru import logger
 from osin.apis.osin import Osin
-from osin.apis.remote_exp import RemoteExpRun
-from osin.misc import orjson_dumps
+from osin.apis.remote_exp import RemoteExp, RemoteExpRun
+from osin.apis.spool import Spool, map_id
+from osin.apis.uploader import BackgroundUploader, UploadJob
+from osin.formats import Hdf5Format, RunDataFormat
+from osin.misc import get_caller_python_script, orjson_dumps
 from osin.models.exp import Exp, ExpRun
+from osin.params_helper import DataClassInstance
 from osin.repository import OsinRepository
 from osin.types import NestedPrimitiveOutputSchema, ParamSchema
+from osin.upload import get_file_checksum
 
 ParamSchema_deser = get_deserializer_from_type(ParamSchema, {})
 NestedPrimitiveOutputSchema_deser = get_deserializer_from_type(
@@ -22,47 +31,165 @@ NestedPrimitiveOutputSchema_deser = get_deserializer_from_type(
 
 
 class RemoteOsin(Osin):
-    def __init__(self, endpoint: str, tmpdir: Path | str):
+    def __init__(
+        self,
+        endpoint: str,
+        tmpdir: Path | str,
+        background_upload: bool = False,
+        pool_size: int = 10,
+        timeout: Tuple[float, float] = (10.0, 300.0),
+        compress_min_size: int = 16 * 1024,
+        upload_chunk_size: int = 8 * 1024 * 1024,
+        spool: bool = False,
+        exit_timeout: float = 60.0,
+    ):
+        """
+        Args:
+            endpoint: URL of the osin server
+            tmpdir: Directory storing runs before they are uploaded
+            background_upload: Whether finished runs are uploaded by a background thread, so
+                `finish_exp_run` returns without waiting for the upload. Pending uploads are
+                persisted in `tmpdir` and resumed by the next `RemoteOsin` if the process exits
+                before they are done. Call `flush` to wait for them.
+            pool_size: Maximum number of keep-alive connections to the server
+            timeout: Timeouts (in seconds) of connecting to the server and of reading a response
+            compress_min_size: JSON bodies of at least this many bytes are sent gzip-compressed
+            upload_chunk_size: Files of a run are uploaded in chunks of this size (capped by the
+                server's maximum request size), an interrupted upload resumes from its last
+                received chunk
+            spool: Whether runs are only recorded in a local journal in `tmpdir` (e.g., when the
+                server cannot be reached from the machine running the experiments), and sent to
+                the server later by `sync` (`osin sync`). Experiments and runs have provisional
+                (negative) ids until they are synced.
+            exit_timeout: Maximum time (in seconds) to wait at exit for the background uploads,
+                uploads not done by then stay in the queue for the next `RemoteOsin`
+        """
         super().__init__(tmpdir)
         self.endpoint = endpoint
         if self.endpoint.endswith("/"):
             self.endpoint = self.endpoint[:-1]
         self.tmpdir = Path(tmpdir)
+        self.timeout = timeout
+        self.compress_min_size = compress_min_size
+        self.upload_chunk_size = upload_chunk_size
+        self.exit_timeout = exit_timeout
 
-    def _get(self, url: str, params: dict) -> dict:
-        resp = requests.get(f"{self.endpoint}{url}", params=params)
-        try:
-            assert resp.status_code == 200
-        except:
-            logger.error(resp.text)
-            raise
-        return resp.json()
+        # all requests go through a session, reusing connections to the server
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
-    def _post(self, url: str, data: dict) -> dict:
-        resp = requests.post(
-            f"{self.endpoint}{url}",
-            data=orjson_dumps(data).decode(),
-            headers={"Content-Type": "application/json"},
+        self.spool: Optional[Spool] = None
+        if spool:
+            if background_upload:
+                raise ValueError("Spooled runs cannot be uploaded in the background")
+            self.spool = Spool(self.tmpdir / ".spool")
+
+        self.uploader: Optional[BackgroundUploader] = None
+        if background_upload:
+            self.uploader = BackgroundUploader(
+                self._process_upload_job, self.tmpdir / ".upload_queue"
+            )
+            atexit.register(self._flush_at_exit)
+
+    def init_exp(
+        self,
+        name: str,
+        version: int,
+        description: Optional[str] = None,
+        program: Optional[str] = None,
+        params: Optional[Dict[str, DataClassInstance]] = None,
+        aggregated_primitive_outputs: Optional[NestedPrimitiveOutputSchema] = None,
+        update_param_schema: bool = False,
+    ) -> RemoteExp:
+        """Same as `Osin.init_exp`, except that the experiment is sent to the server with its
+        first run (one request for both), so errors such as creating an older version of the
+        experiment are raised when the first run is created."""
+        params = params or {}
+        exp = Exp(
+            name=name,
+            description=description,
+            version=version,
+            program=program or get_caller_python_script(),
+            params={ns: ParamSchema.get_schema(p) for ns, p in params.items()},
+            aggregated_primitive_outputs=aggregated_primitive_outputs,
+        )
+        return RemoteExp(
+            id=None,
+            name=exp.name,
+            version=exp.version,
+            params=exp.params,
+            aggregated_primitive_outputs=exp.aggregated_primitive_outputs,
+            osin=self,
+            init_request={
+                "exp": {
+                    **self._serialize_exp(exp),
+                    "update_param_schema": update_param_schema,
+                }
+            },
         )
-        try:
-            assert resp.status_code == 200
-        except:
-            logger.error(resp.text)
-            raise
-        return resp.json()
 
-    def _put(self, url: str, data: dict) -> dict:
-        resp = requests.put(
-            f"{self.endpoint}{url}",
-            data=orjson_dumps(data).decode(),
-            headers={"Content-Type": "application/json"},
+    def new_exp_run(
+        self,
+        exp: RemoteExp,
+        params: Dict[str, DataClassInstance],
+        stream_batch_size: Optional[int] = None,
+        data_format: Optional[RunDataFormat] = None,
+        live: bool = False,
+    ) -> RemoteExpRun:
+        """Same as `Osin.new_exp_run`, except that runs cannot be live as their data files are
+        written in `tmpdir`, which the server does not read."""
+        if live:
+            raise ValueError(
+                "Live runs are not supported by RemoteOsin: the run data is only sent to the server when the run finishes"
+            )
+        return super().new_exp_run(exp, params, stream_batch_size, data_format)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the runs finished by this process are uploaded (only for background
+        uploads). Returns False if the timeout expires first"""
+        if self.uploader is None:
+            return True
+        return self.uploader.wait(timeout)
+
+    def _flush_at_exit(self):
+        assert self.uploader is not None
+        if not self.uploader.wait(self.exit_timeout):
+            logger.warning(
+                "Background uploads are not done in {:.0f}s, they are left in the queue",
+                self.exit_timeout,
+            )
+        self.uploader.close(timeout=0)
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        resp = self.session.request(
+            method, f"{self.endpoint}{url}", timeout=self.timeout, **kwargs
         )
         try:
             assert resp.status_code == 200
         except:
             logger.error(resp.text)
             raise
-        return resp.json()
+        return resp
+
+    def _get(self, url: str, params: dict) -> dict:
+        return self._request("GET", url, params=params).json()
+
+    def _post(self, url: str, data: dict) -> dict:
+        return self._request("POST", url, **self._encode_json_body(data)).json()
+
+    def _put(self, url: str, data: dict) -> dict:
+        return self._request("PUT", url, **self._encode_json_body(data)).json()
+
+    def _encode_json_body(self, data: dict) -> dict:
+        """Encode the body of a JSON request, compressing it if it is large"""
+        body = orjson_dumps(data)
+        headers = {"Content-Type": "application/json"}
+        if len(body) >= self.compress_min_size:
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+        return {"data": body, "headers": headers}
 
     def _find_latest_exp(self, name: str) -> Optional[Exp]:
         exps = self._get(
@@ -75,47 +202,48 @@ class RemoteOsin(Osin):
         )["items"]
         if len(exps) == 0:
             return None
-        else:
-            exp = exps[0]
-            return Exp(
-                id=exp["id"],
-                name=exp["name"],
-                version=exp["version"],
-                description=exp["description"],
-                program=exp["program"],
-                params=[ParamSchema_deser(p) for p in exp["params"]],
-                aggregated_primitive_outputs=NestedPrimitiveOutputSchema(
-                    exp["aggregated_primitive_outputs"]
-                )
-                if exp["aggregated_primitive_outputs"] is not None
-                else None,
+        return self._deserialize_exp(exps[0])
+
+    def _deserialize_exp(self, exp: dict) -> Exp:
+        return Exp(
+            id=exp["id"],
+            name=exp["name"],
+            version=exp["version"],
+            description=exp["description"],
+            program=exp["program"],
+            params={ns: ParamSchema_deser(p) for ns, p in exp["params"].items()},
+            aggregated_primitive_outputs=NestedPrimitiveOutputSchema(
+                exp["aggregated_primitive_outputs"]
             )
+            if exp["aggregated_primitive_outputs"] is not None
+            else None,
+        )
 
     def _create_exp(self, exp: Exp) -> Exp:
         if exp.description is None or exp.params is None:
             raise ValueError(
                 "Cannot create a new experiment without description and params"
             )
-        obj = self._post(
-            "/api/exp",
-            {
-                "name": exp.name,
-                "version": exp.version,
-                "description": exp.description,
-                "program": exp.program,
-                "params": [asdict(p) for p in exp.params],
-                "aggregated_primitive_outputs": asdict(exp.aggregated_primitive_outputs)
-                if exp.aggregated_primitive_outputs is not None
-                else None,
-            },
-        )
+        obj = self._post("/api/exp", self._serialize_exp(exp))
         exp.id = obj["id"]
         return exp
 
+    def _serialize_exp(self, exp: Exp) -> dict:
+        return {
+            "name": exp.name,
+            "version": exp.version,
+            "description": exp.description,
+            "program": exp.program,
+            "params": {ns: asdict(p) for ns, p in exp.params.items()},
+            "aggregated_primitive_outputs": asdict(exp.aggregated_primitive_outputs)
+            if exp.aggregated_primitive_outputs is not None
+            else None,
+        }
+
     def _update_exp(self, exp_id: int, exp: Exp, fields: List[str]):
         data = {field: getattr(exp, field) for field in fields}
         if "params" in fields:
-            data["params"] = [asdict(p) for p in exp.params]
+            data["params"] = {ns: asdict(p) for ns, p in exp.params.items()}
         if (
             "aggregated_primitive_outputs" in fields
             and exp.aggregated_primitive_outputs is not None
@@ -127,28 +255,82 @@ class RemoteOsin(Osin):
 
     def _create_exprun(self, exprun: ExpRun) -> ExpRun:
         obj = self._post(
-            "/api/exprun",
-            {
-                "exp_id": exprun.exp_id,
-                "is_deleted": exprun.is_deleted,
-                "is_finished": exprun.is_finished,
-                "is_successful": exprun.is_successful,
-                "has_invalid_agg_output_schema": exprun.has_invalid_agg_output_schema,
-                "created_time": exprun.created_time.isoformat(),
-                "finished_time": exprun.finished_time.isoformat()
-                if exprun.finished_time is not None
-                else None,
-                "params": exprun.params,
-                "metadata": asdict(exprun.metadata)
-                if exprun.metadata is not None
-                else None,
-                "aggregated_primitive_outputs": exprun.aggregated_primitive_outputs,
-            },
+            "/api/exprun", {"exp_id": exprun.exp_id, **self._serialize_exprun(exprun)}
         )
         exprun.id = obj["id"]
         return exprun
 
+    def _serialize_exprun(self, exprun: ExpRun) -> dict:
+        return {
+            "is_deleted": exprun.is_deleted,
+            "is_finished": exprun.is_finished,
+            "is_successful": exprun.is_successful,
+            "has_invalid_agg_output_schema": exprun.has_invalid_agg_output_schema,
+            "created_time": exprun.created_time.isoformat(),
+            "finished_time": exprun.finished_time.isoformat()
+            if exprun.finished_time is not None
+            else None,
+            "params": exprun.params,
+            "metadata": asdict(exprun.metadata)
+            if exprun.metadata is not None
+            else None,
+            "aggregated_primitive_outputs": exprun.aggregated_primitive_outputs,
+        }
+
+    def _start_exprun(self, exp: RemoteExp, exprun: ExpRun) -> ExpRun:
+        """Create a new run, together with its experiment if it is the first run of the
+        experiment (one request)"""
+        if self.spool is not None:
+            if exp.id is None:
+                exp.id = self.spool.new_id()
+            exprun.id = self.spool.new_id()
+            self.spool.append(
+                {
+                    "op": "start",
+                    "exp_id": exp.id,
+                    "exprun_id": exprun.id,
+                    "init_request": exp.init_request,
+                    "exprun": self._serialize_exprun(exprun),
+                }
+            )
+            exp.init_request = None
+            return exprun
+
+        if exp.init_request is None:
+            return self._create_exprun(exprun)
+
+        resp = self._post(
+            "/api/exprun/init-and-start-run",
+            {**exp.init_request, "exprun": self._serialize_exprun(exprun)},
+        )
+        server_exp = self._deserialize_exp(resp["exp"])
+        exp.id = server_exp.id
+        exp.params = server_exp.params
+        exp.aggregated_primitive_outputs = server_exp.aggregated_primitive_outputs
+        exp.init_request = None
+        exprun.id = resp["exprun"]["id"]
+        return exprun
+
+    def _save_agg_output_schema(self, exp: RemoteExp):
+        # the server infers the schema when the run is finished (see `_finish_and_upload`)
+        pass
+
     def _update_exprun(self, exprun_id: int, exprun: ExpRun, fields: List[str]):
+        if self.spool is not None:
+            self.spool.append(
+                {
+                    "op": "update",
+                    "exprun_id": exprun_id,
+                    "update": self._serialize_exprun_update(exprun, fields),
+                }
+            )
+            return
+        self._put(
+            f"/api/exprun/{exprun_id}",
+            self._serialize_exprun_update(exprun, fields),
+        )
+
+    def _serialize_exprun_update(self, exprun: ExpRun, fields: List[str]) -> dict:
         data = {field: getattr(exprun, field) for field in fields}
         if "metadata" in fields and exprun.metadata is not None:
             data["metadata"] = asdict(exprun.metadata)
@@ -156,23 +338,180 @@ class RemoteOsin(Osin):
             data["created_time"] = exprun.created_time.isoformat()
         if "finished_time" in fields and exprun.finished_time is not None:
             data["finished_time"] = exprun.finished_time.isoformat()
+        return data
 
-        self._put(
-            f"/api/exprun/{exprun_id}",
-            data,
+    def _finish_exprun(self, exp_run: RemoteExpRun, exprun: ExpRun, fields: List[str]):
+        if self.spool is not None:
+            self.spool.append(
+                {
+                    "op": "finish",
+                    "exprun_id": exp_run.id,
+                    "rundir": str(exp_run.rundir),
+                    "update": self._serialize_exprun_update(exprun, fields),
+                }
+            )
+            return
+        if self.uploader is None:
+            return self._finish_and_upload(
+                exp_run.id,
+                exp_run.rundir,
+                self._serialize_exprun_update(exprun, fields),
+            )
+        self.uploader.submit(
+            UploadJob(
+                exp_run.id,
+                str(exp_run.rundir),
+                self._serialize_exprun_update(exprun, fields),
+            )
         )
 
-    def _upload_exprun(self, exprun: RemoteExpRun):
+    def sync(self) -> int:
+        """Replay the runs recorded in the spool (see `spool`) to the server, in order, and map
+        their provisional ids to the server's ids. The progress is saved after each operation, so
+        an interrupted sync continues where it stopped. Returns the number of replayed
+        operations."""
+        spool = self.spool or Spool(self.tmpdir / ".spool")
+        with spool.lock():
+            ops = spool.read_ops()
+            state = spool.read_state()
+            n_replayed = len(ops) - state["n_replayed"]
+            for op in ops[state["n_replayed"] :]:
+                self._replay_spooled_op(op, state)
+                state["n_replayed"] += 1
+                spool.write_state(state)
+            spool.clear_replayed(state)
+        if n_replayed > 0:
+            logger.info("Synced {} spooled operations to the server", n_replayed)
+        return n_replayed
+
+    def _replay_spooled_op(self, op: dict, state: dict):
+        if op["op"] == "start":
+            exp_id = op["exp_id"]
+            if str(exp_id) not in state["exp"] and op["init_request"] is not None:
+                resp = self._post(
+                    "/api/exprun/init-and-start-run",
+                    {**op["init_request"], "exprun": op["exprun"]},
+                )
+                state["exp"][str(exp_id)] = resp["exp"]["id"]
+            else:
+                resp = {
+                    "exprun": self._post(
+                        "/api/exprun",
+                        {"exp_id": map_id(state["exp"], exp_id), **op["exprun"]},
+                    )
+                }
+            state["exprun"][str(op["exprun_id"])] = resp["exprun"]["id"]
+        elif op["op"] == "finish":
+            self._finish_and_upload(
+                map_id(state["exprun"], op["exprun_id"]),
+                Path(op["rundir"]),
+                op["update"],
+            )
+        elif op["op"] == "update":
+            self._put(
+                f"/api/exprun/{map_id(state['exprun'], op['exprun_id'])}", op["update"]
+            )
+        else:
+            raise ValueError(f"Unknown spooled operation: {op['op']}")
+
+    def _process_upload_job(self, job: UploadJob):
+        self._finish_and_upload(job.exprun_id, Path(job.rundir), job.update)
+
+    def _finish_and_upload(self, exprun_id: int, rundir: Path, update: dict):
+        """Upload the files of a finished run and update the run in one request. Files that do
+        not fit in the request (`upload_chunk_size`) are uploaded in chunks beforehand"""
         files = {}
-        for file in exprun.rundir.iterdir():
-            if file.suffix in OsinRepository.ALLOWED_EXTENSIONS:
-                files[file.stem] = (file.name, file.read_bytes())
+        inline_size = 0
+        allowed_extensions = OsinRepository.get_allowed_extensions()
+        for file in sorted(rundir.iterdir()):
+            if file.suffix in allowed_extensions:
+                if file.suffix in Hdf5Format.extensions:
+                    self._upload_blobs(Hdf5Format().get_blob_refs(file))
+                size = file.stat().st_size
+                if inline_size + size > self.upload_chunk_size:
+                    self._upload_file(exprun_id, file)
+                else:
+                    files[file.stem] = (file.name, file.read_bytes())
+                    inline_size += size
 
-        resp = requests.post(
-            f"{self.endpoint}/api/exprun/{exprun.id}/upload", files=files
+        self._request(
+            "POST",
+            f"/api/exprun/{exprun_id}/finish-and-upload",
+            data={"exprun": orjson_dumps(update).decode()},
+            files=files,
+        )
+
+    def _upload_exprun(self, exprun: RemoteExpRun):
+        self._upload_rundir(exprun.id, exprun.rundir)
+
+    def _upload_rundir(self, exprun_id: int, rundir: Path):
+        allowed_extensions = OsinRepository.get_allowed_extensions()
+        for file in sorted(rundir.iterdir()):
+            if file.suffix in allowed_extensions:
+                if file.suffix in Hdf5Format.extensions:
+                    self._upload_blobs(Hdf5Format().get_blob_refs(file))
+                self._upload_file(exprun_id, file)
+
+    def _upload_file(self, exprun_id: int, file: Path):
+        """Upload a file of a run in chunks read from disk, continuing from the chunks the server
+        already received (from a previous, interrupted attempt)"""
+        size = file.stat().st_size
+        resp = self._post(
+            f"/api/exprun/{exprun_id}/uploads",
+            {
+                "filename": file.name,
+                "size": size,
+                "checksum": get_file_checksum(file),
+                "chunk_size": self.upload_chunk_size,
+            },
+        )
+        upload_url = f"/api/exprun/{exprun_id}/uploads/{resp['upload_id']}"
+        chunk_size = resp["chunk_size"]
+        n_chunks = (size + chunk_size - 1) // chunk_size
+        if resp["n_received"] > 0:
+            logger.debug(
+                "Resume uploading {} from chunk {} of {}",
+                file.name,
+                resp["n_received"],
+                n_chunks,
+            )
+
+        with open(file, "rb") as f:
+            f.seek(resp["n_received"] * chunk_size)
+            for index in range(resp["n_received"], n_chunks):
+                chunk = f.read(chunk_size)
+                self._request(
+                    "PUT",
+                    f"{upload_url}/{index}",
+                    params={"checksum": hashlib.sha256(chunk).hexdigest()},
+                    data=chunk,
+                    headers={"Content-Type": "application/octet-stream"},
+                )
+        self._request("POST", f"{upload_url}/commit")
+
+    def _upload_blobs(self, keys: List[str], batch_size: int = 16 * 1024 * 1024):
+        """Upload blobs referenced by a run that the server does not have, in batches of about
+        `batch_size` bytes"""
+        if len(keys) == 0:
+            return
+
+        missing_keys = self._post("/api/blob/missing", {"keys": keys})["keys"]
+        batches = [{}]
+        batch_bytes = 0
+        for key in missing_keys:
+            data = self.osin_keeper.blob_store.get(key)
+            if batch_bytes > 0 and batch_bytes + len(data) > batch_size:
+                batches.append({})
+                batch_bytes = 0
+            batches[-1][key] = (key, data)
+            batch_bytes += len(data)
+
+        for batch in batches:
+            if len(batch) == 0:
+                continue
+            self._request("POST", "/api/blob", files=batch)
+        logger.debug(
+            "Uploaded {} of {} unique blobs referenced by the run",
+            len(missing_keys),
+            len(set(keys)),
         )
-        try:
-            assert resp.status_code == 200
-        except:
-            logger.error(resp.text)
-            raise
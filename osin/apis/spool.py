@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import fcntl
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+import orjson
+from osin.misc import orjson_dumps
+
+
+class Spool:
+    """Local journal of the lifecycle operations of runs (creating, finishing, and updating runs),
+    used by `RemoteOsin` when the server cannot be reached, to be replayed later by `osin sync`.
+
+    Experiments and runs in the journal have provisional ids (negative numbers, so they never
+    collide with ids assigned by the server), which are mapped to the server's ids as the journal
+    is replayed. The mapping is kept after the journal is replayed, as runs spooled later may
+    belong to experiments already sent to the server.
+
+    The directory holds the journal (`journal.jsonl`, one operation per line), the counter of
+    provisional ids (`next_id`), and the replay state (`state.json`: the number of replayed
+    operations and the mapping of ids). Processes sharing the directory take turns through a file
+    lock.
+    """
+
+    def __init__(self, spool_dir: Path):
+        self.spool_dir = Path(spool_dir)
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self.journal_file = self.spool_dir / "journal.jsonl"
+        self.state_file = self.spool_dir / "state.json"
+
+    @staticmethod
+    def is_provisional_id(id: int) -> bool:
+        return id < 0
+
+    def new_id(self) -> int:
+        """Get a new provisional id"""
+        with self.lock():
+            counter_file = self.spool_dir / "next_id"
+            next_id = int(counter_file.read_text()) if counter_file.exists() else 1
+            _write_atomic(counter_file, str(next_id + 1).encode())
+        return -next_id
+
+    def append(self, op: dict):
+        """Append an operation to the journal"""
+        with self.lock():
+            with open(self.journal_file, "ab") as f:
+                f.write(orjson_dumps(op) + b"\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def read_ops(self) -> List[dict]:
+        """Read all operations in the journal, including replayed ones (see `read_state`)"""
+        if not self.journal_file.exists():
+            return []
+        return [
+            orjson.loads(line)
+            for line in self.journal_file.read_bytes().splitlines()
+            if len(line) > 0
+        ]
+
+    def read_state(self) -> dict:
+        """Get the number of replayed operations (`n_replayed`) and the mapping of provisional
+        ids of experiments (`exp`) and runs (`exprun`) to the server's ids"""
+        if not self.state_file.exists():
+            return {"n_replayed": 0, "exp": {}, "exprun": {}}
+        return orjson.loads(self.state_file.read_bytes())
+
+    def write_state(self, state: dict):
+        _write_atomic(self.state_file, orjson_dumps(state))
+
+    def clear_replayed(self, state: dict):
+        """Remove the replayed operations from the journal, keeping the mapping of ids"""
+        self.journal_file.unlink(missing_ok=True)
+        state["n_replayed"] = 0
+        self.write_state(state)
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        with open(self.spool_dir / ".lock", "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def map_id(ids: Dict[str, int], id: int) -> int:
+    """Map a provisional id to the server's id, ids assigned by the server are unchanged"""
+    if not Spool.is_provisional_id(id):
+        return id
+    if str(id) not in ids:
+        raise KeyError(f"Provisional id {id} is not synced to the server")
+    return ids[str(id)]
+
+
+def _write_atomic(path: Path, data: bytes):
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
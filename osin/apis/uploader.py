@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Set
+
+import orjson
+from loguru import logger
+from osin.misc import orjson_dumps
+
+# suffix of a job claimed by a process (`<job>.<pid>.uploading`) while the process uploads it
+CLAIM_SUFFIX = ".uploading"
+
+
+@dataclass
+class UploadJob:
+    """Upload of a finished run: its files, then the final update of the run"""
+
+    exprun_id: int
+    rundir: str
+    # payload of the final update of the run (see `RemoteOsin._serialize_exprun_update`)
+    update: dict
+    n_attempts: int = 0
+
+
+class BackgroundUploader:
+    """Upload finished runs in a background thread, so the process can continue with its next job.
+
+    Jobs are persisted in a directory (one JSON file per job, named by the time they are submitted)
+    before being uploaded, so jobs left by a process that exits before they are uploaded are resumed
+    by the next uploader using the same directory. Jobs are uploaded in order. A failed upload is
+    retried with an exponential backoff (`retry_delay`, doubled after each attempt up to
+    `max_retry_delay`), and a job failing more than `max_retries` times is moved to the `failed`
+    subdirectory. Processes sharing the directory claim a job by renaming it (under a file lock)
+    before uploading it, claims of processes that no longer exist are put back in the queue.
+    """
+
+    def __init__(
+        self,
+        upload: Callable[[UploadJob], None],
+        queue_dir: Path,
+        max_retries: int = 8,
+        retry_delay: float = 1.0,
+        max_retry_delay: float = 300.0,
+    ):
+        self.upload = upload
+        self.queue_dir = Path(queue_dir)
+        self.queue_dir.mkdir(parents=True, exist_ok=True)
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+        with self._lock_queue():
+            self._requeue_stale_claims()
+
+        self.cond = threading.Condition()
+        # names of the jobs this uploader is responsible for, including jobs left by previous
+        # processes
+        self.pending: Set[str] = {path.name for path in self.list_jobs()}
+        self.is_closed = False
+        self.thread = threading.Thread(
+            target=self._run, name="osin-uploader", daemon=True
+        )
+        self.thread.start()
+
+    def list_jobs(self) -> List[Path]:
+        """Files of the jobs in the queue, in order"""
+        return sorted(self.queue_dir.glob("*.json"))
+
+    def submit(self, job: UploadJob):
+        """Persist the job then schedule it for upload"""
+        path = self.queue_dir / f"{time.time_ns():020d}-{job.exprun_id}.json"
+        _write_job(path, job)
+        with self.cond:
+            self.pending.add(path.name)
+            self.cond.notify_all()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the jobs of this uploader are done (uploaded or given up). Returns False if
+        the timeout expires first"""
+        with self.cond:
+            return self.cond.wait_for(lambda: len(self.pending) == 0, timeout)
+
+    def close(self, timeout: Optional[float] = None):
+        """Stop the background thread after the current attempt, remaining jobs stay in the queue"""
+        with self.cond:
+            self.is_closed = True
+            self.cond.notify_all()
+        self.thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.is_closed or len(self.pending) > 0)
+                if self.is_closed:
+                    return
+                name = min(self.pending)
+
+            delay = self._process(self.queue_dir / name)
+            if delay is None:
+                with self.cond:
+                    self.pending.discard(name)
+                    self.cond.notify_all()
+            else:
+                with self.cond:
+                    self.cond.wait_for(lambda: self.is_closed, delay)
+
+    def _process(self, path: Path) -> Optional[float]:
+        """Make an attempt to upload the job, returning the delay before retrying it, or None if
+        the job is done"""
+        claim_path = path.with_name(f"{path.name}.{os.getpid()}{CLAIM_SUFFIX}")
+        with self._lock_queue():
+            if not path.exists():
+                if any(self.queue_dir.glob(f"{path.name}.*{CLAIM_SUFFIX}")):
+                    # being uploaded by another process sharing the queue, check it again later
+                    return self.retry_delay
+                # uploaded by another process sharing the queue
+                return None
+            os.replace(path, claim_path)
+
+        # the lock is released during the upload, so other processes can claim the next jobs
+        job = UploadJob(**orjson.loads(claim_path.read_bytes()))
+        try:
+            self.upload(job)
+        except Exception as e:
+            job.n_attempts += 1
+            if job.n_attempts > self.max_retries:
+                logger.error(
+                    "Give up uploading exp run {} after {} attempts: {}",
+                    job.exprun_id,
+                    job.n_attempts,
+                    e,
+                )
+                (self.queue_dir / "failed").mkdir(exist_ok=True)
+                os.replace(claim_path, self.queue_dir / "failed" / path.name)
+                return None
+
+            delay = min(
+                self.max_retry_delay, self.retry_delay * 2 ** (job.n_attempts - 1)
+            )
+            logger.warning(
+                "Failed to upload exp run {} (attempt {}), retry in {:.1f}s: {}",
+                job.exprun_id,
+                job.n_attempts,
+                delay,
+                e,
+            )
+            _write_job(claim_path, job)
+            os.replace(claim_path, path)
+            return delay
+
+        claim_path.unlink()
+        logger.debug("Uploaded exp run {}", job.exprun_id)
+        return None
+
+    def _requeue_stale_claims(self):
+        """Put back in the queue the jobs claimed by processes that exited before uploading them"""
+        for claim_path in self.queue_dir.glob(f"*{CLAIM_SUFFIX}"):
+            name, pid = claim_path.name[: -len(CLAIM_SUFFIX)].rsplit(".", 1)
+            if _is_process_alive(int(pid)):
+                continue
+            logger.warning("Resume the interrupted upload of {}", name)
+            os.replace(claim_path, self.queue_dir / name)
+
+    @contextmanager
+    def _lock_queue(self) -> Iterator[None]:
+        with open(self.queue_dir / ".lock", "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _is_process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # exists but owned by another user
+        return True
+    return True
+
+
+def _write_job(path: Path, job: UploadJob):
+    """Write the job atomically, so a crash never leaves a partial job in the queue"""
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_bytes(orjson_dumps(asdict(job)))
+    os.replace(tmp_path, path)
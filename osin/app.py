@@ -1,9 +1,11 @@
 import os, re
 from gena import generate_app
 
+from osin.controllers.blob import blob_bp
 from osin.controllers.exp import exp_bp, exprun_bp
 from osin.controllers.report import report_bp, expreport_bp
 from osin.controllers.views import exprunview_bp
+from osin.middleware import GzipRequestMiddleware
 from loguru import logger
 
 app = generate_app(
@@ -13,6 +15,7 @@ app = generate_app(
         exprunview_bp,
         report_bp,
         expreport_bp,
+        blob_bp,
     ],
     os.path.dirname(__file__),
     # log_sql_queries=False,
@@ -27,3 +30,5 @@ else:
     max_upload_mb = 100
 logger.info(f"Maximum upload size is {max_upload_mb} MB")
 app.config["MAX_CONTENT_LENGTH"] = max_upload_mb * 1024 * 1024
+# clients compress large request bodies
+app.wsgi_app = GzipRequestMiddleware(app.wsgi_app, app.config["MAX_CONTENT_LENGTH"])
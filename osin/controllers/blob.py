@@ -0,0 +1,50 @@
+from flask import Blueprint, jsonify, request
+from osin.formats import BlobStore
+from osin.repository import OsinRepository
+from werkzeug.exceptions import BadRequest
+
+blob_bp = Blueprint("blob", __name__)
+
+
+@blob_bp.route("/blob/missing", methods=["POST"])
+def find_missing_blobs():
+    """Get keys of the blobs that are not in the blob store. The request body is a JSON object
+    with a property `keys` (list of blob keys)"""
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise BadRequest("The request body must be a JSON object")
+    keys = body.get("keys", None)
+    if not isinstance(keys, list) or not all(isinstance(x, str) for x in keys):
+        raise BadRequest("keys must be a list of strings")
+
+    try:
+        missing_keys = OsinRepository.get_instance().blob_store.missing(keys)
+    except KeyError as e:
+        raise BadRequest(e.args[0])
+    return jsonify({"keys": missing_keys})
+
+
+@blob_bp.route("/blob", methods=["POST"])
+def upload_blobs():
+    """Upload blobs (multipart files named by their keys). The blobs do not have references until
+    a run referencing them is uploaded"""
+    store = OsinRepository.get_instance().blob_store
+    if len(request.files) == 0:
+        raise BadRequest("No blobs provided")
+
+    blobs = {}
+    for key, file in request.files.items():
+        data = file.read()
+        if BlobStore.get_key(data) != key:
+            raise BadRequest(f"The content of blob `{key}` does not match its key")
+        blobs[key] = data
+
+    for data in blobs.values():
+        store.put(data, n_refs=0)
+    return jsonify({"status": "success"})
+
+
+@blob_bp.route("/blob/stats", methods=["GET"])
+def get_blob_stats():
+    """Report the size of the blob store and its deduplication ratio"""
+    return jsonify(OsinRepository.get_instance().blob_store.stats())
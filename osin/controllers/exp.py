@@ -1,24 +1,69 @@
+import os
 from datetime import datetime
-from flask import jsonify, request
+from typing import Any, Callable, Dict, List
+import orjson
+from flask import Response, current_app, jsonify, request
 from gena import generate_api
+from gena.deserializer import generate_deserializer
+from gena.serializer import get_peewee_serializer
 from peewee import DoesNotExist, fn
-from osin.misc import get_extension, identity
+from osin.formats.base import parse_column_key, parse_filter
+from osin.formats.diff import CHANGES, ColumnDiff
+from osin.misc import get_extension, identity, orjson_dumps
+from osin.models.base import db
 from osin.models.exp import Exp, ExpRun
-from werkzeug.exceptions import BadRequest, NotFound
+from werkzeug.exceptions import BadRequest, Conflict, NotFound
 from osin.repository import OsinRepository
+from osin.types import NestedPrimitiveOutputSchema
+from osin.types.pyobject import OTABLE_PAGE_SIZE, OTable
+from osin.upload import ChunkedUpload
+from werkzeug.datastructures import FileStorage
 from werkzeug.utils import secure_filename
 
-exp_bp = generate_api(Exp)
-exprun_bp = generate_api(
-    ExpRun,
-    deserializers={
-        "params": identity,
-        # seems that with timezone, peewee cannot parse back to datetime
-        # "finished_time": lambda x: parse(x).replace(tzinfo=None),
-        # "created_time": lambda x: parse(x).replace(tzinfo=None),
-        "aggregated_primitive_outputs": identity,
-    },
+ALL_RECORD_FIELDS = {"primitive", "complex"}
+PREVIEW_MIN_SIZE = 16
+PREVIEW_MAX_SIZE = 4096
+
+exp_deserializers = generate_deserializer(Exp)
+exprun_deserializers = {
+    "params": identity,
+    # seems that with timezone, peewee cannot parse back to datetime
+    # "finished_time": lambda x: parse(x).replace(tzinfo=None),
+    # "created_time": lambda x: parse(x).replace(tzinfo=None),
+    "aggregated_primitive_outputs": identity,
+}
+exprun_deserializers.update(
+    generate_deserializer(
+        ExpRun, known_field_deserializers=set(exprun_deserializers.keys())
+    )
 )
+serialize_exp = get_peewee_serializer(Exp)
+serialize_exprun = get_peewee_serializer(ExpRun)
+
+exp_bp = generate_api(Exp, deserializers=exp_deserializers)
+exprun_bp = generate_api(ExpRun, deserializers=exprun_deserializers)
+
+
+def deserialize_record(
+    deserializers: Dict[str, Callable[[Any], Any]], data: Any, fields: List[str]
+) -> Dict[str, Any]:
+    """Deserialize the given fields of a record sent by a client, missing and null fields are
+    skipped (i.e., left to their defaults)"""
+    if not isinstance(data, dict):
+        raise BadRequest("The record must be a JSON object")
+    record = {}
+    for name in fields:
+        if data.get(name, None) is not None:
+            try:
+                record[name] = deserializers[name](data[name])
+            except ValueError as e:
+                raise BadRequest(f"Field `{name}` {str(e)}")
+    return record
+
+
+def join_json_items(items: List[bytes]) -> bytes:
+    """Join pre-serialized JSON values into a JSON array without decoding them"""
+    return b"[" + b",".join(items) + b"]"
 
 
 @exprun_bp.route(f"/{exprun_bp.name}/activity", methods=["GET"])
@@ -53,8 +98,6 @@ def fetch_exp_run_data(id: int):
         raise NotFound(f"ExpRun with id {id} does not exist")
 
     osin = OsinRepository.get_instance()
-    format = osin.get_exp_run_data_format(exp_run.exp, exp_run)
-    h5file = osin.get_exp_run_data_file(exp_run.exp, exp_run)
 
     limit = request.args.get("limit", "50")
     if not limit.isdigit():
@@ -95,27 +138,254 @@ def fetch_exp_run_data(id: int):
         sorted_by = None
         sorted_order = "ascending"
 
+    # e.g., filter=data.metrics.f1<0.5&&data.label==cat
+    filter = request.args.get("filter", None)
+    if filter is not None:
+        try:
+            parse_filter(filter)
+        except ValueError as e:
+            raise BadRequest(str(e))
+
     try:
-        exp_run_data, n_examples = format.load_exp_run_data(
-            h5file,
-            fields,
-            limit,
-            offset,
-            sorted_by,
-            sorted_order,
-            with_complex_size=True,
-        )
-    except KeyError:
+        with osin.open_exp_run_data(exp_run.exp, exp_run) as (format, f):
+            if fields is None or fields.get("individual", None) == ALL_RECORD_FIELDS:
+                # use the pre-serialized JSON of the examples if the file has them
+                examples_json = format.load_examples_json(
+                    f, limit, offset, sorted_by, sorted_order, filter
+                )
+            else:
+                examples_json = None
+
+            if examples_json is not None:
+                exp_run_data, _ = format.load_exp_run_data(
+                    f,
+                    {"aggregated": ALL_RECORD_FIELDS}
+                    if fields is None
+                    else {k: v for k, v in fields.items() if k == "aggregated"},
+                )
+            else:
+                exp_run_data, n_examples = format.load_exp_run_data(
+                    f,
+                    fields,
+                    limit,
+                    offset,
+                    sorted_by,
+                    sorted_order,
+                    with_complex_size=True,
+                    filter=filter,
+                )
+    except FileNotFoundError:
+        raise NotFound(f"ExpRun with id {id} does not have data")
+    except KeyError as e:
+        if filter is not None and str(e).find("filter key") != -1:
+            raise BadRequest(e.args[0])
         if sorted_by is not None:
             raise BadRequest(f"The key `{sorted_by}` does not exist to sort by")
         else:
             raise
 
+    if examples_json is not None:
+        items, n_examples = examples_json
+        return Response(
+            b'{"aggregated":'
+            + orjson_dumps(exp_run_data.aggregated.to_dict())
+            + b',"individual":'
+            + join_json_items(items)
+            + b',"n_examples":'
+            + str(n_examples).encode()
+            + b"}",
+            mimetype="application/json",
+        )
+
     out = exp_run_data.to_dict()
     out["n_examples"] = n_examples
     return jsonify(out)
 
 
+@exprun_bp.route(f"/{exprun_bp.name}/<id>/data/stats", methods=["GET"])
+def get_exp_run_data_stats(id: int):
+    """Get statistics (count, mean, std, min, max, p50, p90, p99) of numeric primitive outputs
+    across all individual examples of a run. `fields` is a comma-separated list of keys (e.g.,
+    `data.metrics.f1`), default to all numeric primitive outputs"""
+    try:
+        exp_run: ExpRun = ExpRun.get_by_id(id)
+    except DoesNotExist:
+        raise NotFound(f"ExpRun with id {id} does not exist")
+
+    osin = OsinRepository.get_instance()
+
+    if "fields" in request.args:
+        keys = []
+        for field in request.args["fields"].split(","):
+            try:
+                key = parse_column_key(field)
+            except ValueError as e:
+                raise BadRequest(str(e))
+            if not key.startswith("primitive/"):
+                raise BadRequest(f"Invalid field: {field}")
+            keys.append(key[len("primitive/") :])
+    else:
+        keys = None
+
+    try:
+        stats = osin.get_exp_run_data_stats(exp_run.exp, exp_run, keys)
+    except FileNotFoundError:
+        raise NotFound(f"ExpRun with id {id} does not have data")
+    except KeyError as e:
+        raise BadRequest(str(e))
+    return jsonify({key.replace("/", "."): value for key, value in stats.items()})
+
+
+@exprun_bp.route(f"/{exprun_bp.name}/<id>/data/preview", methods=["GET"])
+def get_exp_run_data_preview(id: int):
+    """Get a small preview (a PNG thumbnail of an image, a waveform of an audio) of a complex
+    object (`key`) of an example (`example_id`, omitted for aggregated objects) of a run, so
+    that the full-resolution array is not sent to the browser. `size` is the maximum size of the
+    preview (e.g., the longest side of a thumbnail), default to 128."""
+    try:
+        exp_run: ExpRun = ExpRun.get_by_id(id)
+    except DoesNotExist:
+        raise NotFound(f"ExpRun with id {id} does not exist")
+
+    if "key" not in request.args:
+        raise BadRequest("Missing key")
+    try:
+        size = int(request.args.get("size", 128))
+    except ValueError:
+        raise BadRequest("size must be an integer")
+    if size < PREVIEW_MIN_SIZE or size > PREVIEW_MAX_SIZE:
+        raise BadRequest(
+            f"size must be between {PREVIEW_MIN_SIZE} and {PREVIEW_MAX_SIZE}"
+        )
+
+    osin = OsinRepository.get_instance()
+    try:
+        content, mimetype = osin.get_exp_run_preview(
+            exp_run.exp,
+            exp_run,
+            request.args.get("example_id", None),
+            request.args["key"],
+            size,
+        )
+    except FileNotFoundError:
+        raise NotFound(f"ExpRun with id {id} does not have data")
+    except KeyError as e:
+        raise NotFound(str(e))
+    except (ValueError, NotImplementedError) as e:
+        raise BadRequest(str(e) or "The object does not support previews")
+    return Response(content, mimetype=mimetype)
+
+
+@exprun_bp.route(f"/{exprun_bp.name}/<id>/data/table", methods=["GET"])
+def get_exp_run_data_table_rows(id: int):
+    """Get a range of rows (`offset`, `limit`, default to the first page) of a table (`key`) of
+    an example (`example_id`, omitted for aggregated tables) of a run. Only the requested rows are
+    read and decoded. Returns the header, the rows and the total number of rows of the table."""
+    try:
+        exp_run: ExpRun = ExpRun.get_by_id(id)
+    except DoesNotExist:
+        raise NotFound(f"ExpRun with id {id} does not exist")
+
+    if "key" not in request.args:
+        raise BadRequest("Missing key")
+    try:
+        offset = int(request.args.get("offset", 0))
+        limit = int(request.args.get("limit", OTABLE_PAGE_SIZE))
+    except ValueError:
+        raise BadRequest("offset and limit must be integers")
+    if offset < 0 or limit < 0:
+        raise BadRequest("offset and limit must be non-negative")
+
+    osin = OsinRepository.get_instance()
+    try:
+        with osin.open_exp_run_data(exp_run.exp, exp_run) as (format, f):
+            with format.open_complex_columns(
+                f, request.args.get("example_id", None), request.args["key"]
+            ) as (cls, columns, attrs):
+                if not issubclass(cls, OTable):
+                    raise BadRequest(f"{request.args['key']} is not a table")
+                table = cls.read_rows(columns, offset, limit)
+    except FileNotFoundError:
+        raise NotFound(f"ExpRun with id {id} does not have data")
+    except KeyError as e:
+        raise NotFound(str(e))
+    except (ValueError, NotImplementedError) as e:
+        raise BadRequest(str(e))
+    return jsonify(table)
+
+
+@exprun_bp.route(f"/{exprun_bp.name}/<id>/diff/<other_id>", methods=["GET"])
+def diff_exp_run_data(id: int, other_id: int):
+    """Compare a primitive output (`field`, e.g., `data.metrics.f1`) of individual examples of two
+    runs, joined by example id. Returns a page of per-example differences (from this run to the
+    other run), the number of examples in the page's selection, and a summary of the changes.
+
+    Optional arguments: `changes` (comma-separated list of changes to keep: unchanged, increased,
+    decreased, changed, missing), `sorted_by` (id, delta, abs_delta, prefixed by `-` for
+    descending order), `limit` and `offset`.
+    """
+    exp_runs = []
+    for run_id in [id, other_id]:
+        try:
+            exp_runs.append(ExpRun.get_by_id(run_id))
+        except DoesNotExist:
+            raise NotFound(f"ExpRun with id {run_id} does not exist")
+
+    if "field" not in request.args:
+        raise BadRequest("Missing field to compare")
+    try:
+        key = parse_column_key(request.args["field"])
+    except ValueError as e:
+        raise BadRequest(str(e))
+    if not key.startswith("primitive/"):
+        raise BadRequest(f"Invalid field: {request.args['field']}")
+    key = key[len("primitive/") :]
+
+    changes = request.args.get("changes", ",".join(CHANGES.keys())).split(",")
+    if not all(change in CHANGES for change in changes):
+        raise BadRequest(f"Invalid changes: {changes}")
+
+    sorted_by = request.args.get("sorted_by", "-abs_delta")
+    if sorted_by.startswith("-"):
+        sorted_by = sorted_by[1:]
+        sorted_order = "descending"
+    else:
+        sorted_order = "ascending"
+    if sorted_by not in ("id", "delta", "abs_delta"):
+        raise BadRequest(f"Invalid sorted_by: {sorted_by}")
+
+    limit = request.args.get("limit", "50")
+    if not limit.isdigit():
+        raise BadRequest("limit must be an integer")
+    limit = int(limit)
+
+    offset = request.args.get("offset", "0")
+    if not offset.isdigit():
+        raise BadRequest("offset must be an integer")
+    offset = int(offset)
+
+    osin = OsinRepository.get_instance()
+    columns = []
+    for exp_run in exp_runs:
+        try:
+            with osin.open_exp_run_data(exp_run.exp, exp_run) as (format, f):
+                columns.append(format.get_column(f, key))
+        except FileNotFoundError:
+            raise NotFound(f"ExpRun with id {exp_run.id} does not have data")
+        except KeyError as e:
+            raise BadRequest(f"ExpRun {exp_run.id}: {e.args[0]}")
+
+    diff = ColumnDiff.from_columns(*columns)
+    positions, n_examples = diff.select(changes, sorted_by, sorted_order, offset, limit)
+    return jsonify(
+        {
+            "summary": diff.summary(),
+            "items": diff.to_dict(positions),
+            "n_examples": n_examples,
+        }
+    )
+
+
 @exprun_bp.route(
     f"/{exprun_bp.name}/<id>/data/individual/<example_id>", methods=["GET"]
 )
@@ -126,8 +396,6 @@ def get_individual_exp_run_data(id: int, example_id: str):
         raise NotFound(f"ExpRun with id {id} does not exist")
 
     osin = OsinRepository.get_instance()
-    format = osin.get_exp_run_data_format(exp_run.exp, exp_run)
-    h5file = osin.get_exp_run_data_file(exp_run.exp, exp_run)
 
     if "fields" in request.args:
         fields = request.args["fields"].split(",")
@@ -138,14 +406,72 @@ def get_individual_exp_run_data(id: int, example_id: str):
         complex = True
 
     try:
-        exdata = format.get_example_data(
-            h5file, example_id, primitive, complex, with_complex_size=True
-        )
+        with osin.open_exp_run_data(exp_run.exp, exp_run) as (format, f):
+            if primitive and complex:
+                examples_json = format.get_examples_json(f, [example_id])
+                if examples_json is not None:
+                    return Response(examples_json[0], mimetype="application/json")
+            exdata = format.get_example_data(
+                f, example_id, primitive, complex, with_complex_size=True
+            )
+    except FileNotFoundError:
+        raise NotFound(f"ExpRun with id {id} does not have data")
     except KeyError as e:
         raise BadRequest(str(e))
     return jsonify(exdata.to_dict())
 
 
+@exprun_bp.route(f"/{exprun_bp.name}/<id>/data/individual", methods=["POST"])
+def get_individual_exp_run_data_batch(id: int):
+    """Fetch data of multiple examples at once. The request body is a JSON object with two
+    properties: `example_ids` (list of example ids) and an optional `fields` (list of fields to
+    fetch: primitive, complex)"""
+    try:
+        exp_run: ExpRun = ExpRun.get_by_id(id)
+    except DoesNotExist:
+        raise NotFound(f"ExpRun with id {id} does not exist")
+
+    osin = OsinRepository.get_instance()
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise BadRequest("The request body must be a JSON object")
+
+    example_ids = body.get("example_ids", None)
+    if not isinstance(example_ids, list) or not all(
+        isinstance(x, str) for x in example_ids
+    ):
+        raise BadRequest("example_ids must be a list of strings")
+
+    fields = body.get("fields", ["primitive", "complex"])
+    if not isinstance(fields, list) or not all(
+        x in {"primitive", "complex"} for x in fields
+    ):
+        raise BadRequest(f"Invalid fields: {fields}")
+
+    try:
+        with osin.open_exp_run_data(exp_run.exp, exp_run) as (format, f):
+            if set(fields) == ALL_RECORD_FIELDS:
+                examples_json = format.get_examples_json(f, example_ids)
+                if examples_json is not None:
+                    return Response(
+                        b'{"items":' + join_json_items(examples_json) + b"}",
+                        mimetype="application/json",
+                    )
+            examples = format.get_examples_data(
+                f,
+                example_ids,
+                "primitive" in fields,
+                "complex" in fields,
+                with_complex_size=True,
+            )
+    except FileNotFoundError:
+        raise NotFound(f"ExpRun with id {id} does not have data")
+    except KeyError as e:
+        raise BadRequest(str(e))
+    return jsonify({"items": [example.to_dict() for example in examples]})
+
+
 @exprun_bp.route(f"/{exprun_bp.name}/<id>/upload", methods=["POST"])
 def upload_exp_run_data(id: int):
     try:
@@ -153,6 +479,16 @@ def upload_exp_run_data(id: int):
     except DoesNotExist:
         raise NotFound(f"ExpRun with id {id} does not exist")
 
+    files = get_request_run_files()
+    if len(files) == 0:
+        raise BadRequest(f"No files provided")
+    save_exp_run_files(exp_run, files)
+
+    return jsonify({"status": "success"})
+
+
+def get_request_run_files() -> Dict[str, FileStorage]:
+    """Get files of a run (with allowed extensions) uploaded in a multipart request"""
     files = {}
     for file_id, file in request.files.items():
         print(file, file and file.filename is not None, get_extension(file.filename))
@@ -160,13 +496,13 @@ def upload_exp_run_data(id: int):
             file
             and file.filename is not None
             and ("." + (get_extension(file.filename) or ""))
-            in OsinRepository.ALLOWED_EXTENSIONS
+            in OsinRepository.get_allowed_extensions()
         ):
             files[file_id] = file
+    return files
 
-    if len(files) == 0:
-        raise BadRequest(f"No files provided")
 
+def save_exp_run_files(exp_run: ExpRun, files: Dict[str, FileStorage]):
     osin = OsinRepository.get_instance()
     rundir = osin.get_exp_run_dir(exp_run.exp, exp_run)
     if not rundir.exists():
@@ -174,8 +510,223 @@ def upload_exp_run_data(id: int):
 
     for file_id, file in files.items():
         filename = secure_filename(file.filename)
-        file.save(str(rundir / filename))
+        # write to a temporary file first so that readers holding the old file are not affected
+        tmpfile = rundir / f".{filename}.tmp"
+        file.save(str(tmpfile))
+        try:
+            osin.replace_exp_run_file(rundir / filename, tmpfile)
+        except KeyError as e:
+            tmpfile.unlink()
+            raise BadRequest(e.args[0])
+
+    (rundir / "_SUCCESS").touch()
+
+
+def get_chunked_upload(exp_run: ExpRun, upload_id: str) -> ChunkedUpload:
+    osin = OsinRepository.get_instance()
+    rundir = osin.get_exp_run_dir(exp_run.exp, exp_run)
+    upload = ChunkedUpload(rundir / ".uploads" / secure_filename(upload_id))
+    if not upload.exists():
+        raise NotFound(f"Upload {upload_id} does not exist")
+    return upload
+
+
+@exprun_bp.route(f"/{exprun_bp.name}/<id>/uploads", methods=["POST"])
+def init_chunked_upload(id: int):
+    """Start (or resume) an upload of a file of a run in chunks. The request body is a JSON
+    object with the `filename`, `size` and `checksum` (sha256 hex) of the file and the
+    `chunk_size` of the upload, which is capped by the maximum size of a request.
+
+    The response has the `upload_id`, the `chunk_size` and the number of chunks already
+    received (`n_received`), from which the client continues."""
+    try:
+        exp_run: ExpRun = ExpRun.get_by_id(id)
+    except DoesNotExist:
+        raise NotFound(f"ExpRun with id {id} does not exist")
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise BadRequest("The request body must be a JSON object")
+    filename = secure_filename(body.get("filename", None) or "")
+    extension = "." + (get_extension(filename) or "")
+    if extension not in OsinRepository.get_allowed_extensions():
+        raise BadRequest(f"Invalid filename: {body.get('filename', None)}")
+    size, checksum, chunk_size = (
+        body.get("size", None),
+        body.get("checksum", None),
+        body.get("chunk_size", None),
+    )
+    if not isinstance(size, int) or size < 0:
+        raise BadRequest("size must be a non-negative integer")
+    if not isinstance(checksum, str) or len(checksum) != 64:
+        raise BadRequest("checksum must be a sha256 hex digest")
+    if not isinstance(chunk_size, int) or chunk_size <= 0:
+        raise BadRequest("chunk_size must be a positive integer")
+    max_chunk_size = current_app.config.get("MAX_CONTENT_LENGTH", None)
+    if max_chunk_size is not None:
+        chunk_size = min(chunk_size, max_chunk_size)
+
+    osin = OsinRepository.get_instance()
+    upload = ChunkedUpload.init(
+        osin.get_exp_run_dir(exp_run.exp, exp_run), filename, size, checksum, chunk_size
+    )
+    state = upload.get_state()
+    return jsonify(
+        {
+            "upload_id": upload.upload_id,
+            "chunk_size": state.chunk_size,
+            "n_received": state.n_received,
+        }
+    )
+
+
+@exprun_bp.route(
+    f"/{exprun_bp.name}/<id>/uploads/<upload_id>/<int:index>", methods=["PUT"]
+)
+def upload_chunk(id: int, upload_id: str, index: int):
+    """Append the `index`-th chunk (the raw request body) to an upload. The query parameter
+    `checksum` is the sha256 hex of the chunk. Responds 409 with the number of received chunks
+    if the chunk is out of order."""
+    try:
+        exp_run: ExpRun = ExpRun.get_by_id(id)
+    except DoesNotExist:
+        raise NotFound(f"ExpRun with id {id} does not exist")
+
+    upload = get_chunked_upload(exp_run, upload_id)
+    if index > upload.get_state().n_received:
+        raise Conflict(f"Expect chunk {upload.get_state().n_received}")
+    try:
+        state = upload.append(index, request.stream, request.args.get("checksum", ""))
+    except ValueError as e:
+        raise BadRequest(str(e))
+    return jsonify({"n_received": state.n_received})
+
+
+@exprun_bp.route(f"/{exprun_bp.name}/<id>/uploads/<upload_id>/commit", methods=["POST"])
+def commit_chunked_upload(id: int, upload_id: str):
+    """Verify the uploaded file against its checksum and replace the file of the run with it"""
+    try:
+        exp_run: ExpRun = ExpRun.get_by_id(id)
+    except DoesNotExist:
+        raise NotFound(f"ExpRun with id {id} does not exist")
+
+    osin = OsinRepository.get_instance()
+    rundir = osin.get_exp_run_dir(exp_run.exp, exp_run)
+    upload = get_chunked_upload(exp_run, upload_id)
+    filename = upload.get_state().filename
+    try:
+        with upload.complete() as datafile:
+            osin.replace_exp_run_file(rundir / filename, datafile)
+    except ValueError as e:
+        raise BadRequest(str(e))
+    except KeyError as e:
+        raise BadRequest(e.args[0])
 
     (rundir / "_SUCCESS").touch()
+    return jsonify({"status": "success"})
+
+
+@exprun_bp.route(f"/{exprun_bp.name}/init-and-start-run", methods=["POST"])
+def init_and_start_exp_run():
+    """Get or create the experiment of a run and create the run in one request, following the
+    same rules as `Osin.init_exp`. The request body is a JSON object with:
+
+        - `exp`: the experiment (name, version, description, program, params and
+          aggregated_primitive_outputs) and `update_param_schema`
+        - `exprun`: fields of the run (except its experiment)
+
+    The response has the experiment (`exp`) and the created run (`exprun`)."""
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get("exp", None), dict):
+        raise BadRequest(
+            "The request body must be a JSON object with `exp` and `exprun`"
+        )
+    exp_fields = [
+        "name",
+        "version",
+        "description",
+        "program",
+        "params",
+        "aggregated_primitive_outputs",
+    ]
+    exp_record = deserialize_record(exp_deserializers, body["exp"], exp_fields)
+    if "name" not in exp_record or "version" not in exp_record:
+        raise BadRequest("The experiment must have a name and a version")
+    exprun_record = deserialize_record(
+        exprun_deserializers,
+        body.get("exprun", {}),
+        [name for name in exprun_deserializers if name not in {"id", "exp", "exp_id"}],
+    )
+
+    with db.atomic():
+        exp = (
+            Exp.select()
+            .where(Exp.name == exp_record["name"])
+            .order_by(Exp.version.desc())  # type: ignore
+            .first()
+        )
+        if exp is None or exp.version < exp_record["version"]:
+            if (
+                exp_record.get("description", None) is None
+                or "params" not in exp_record
+            ):
+                raise BadRequest(
+                    "Cannot create a new experiment without description and params"
+                )
+            exp = Exp.create(**exp_record)
+        elif exp.version > exp_record["version"]:
+            raise BadRequest("Cannot create an older version of an experiment")
+        elif body["exp"].get("update_param_schema", False):
+            exp.params = exp_record.get("params", {})
+            exp.save()
+        exp_run = ExpRun.create(exp=exp, **exprun_record)
+
+    return jsonify({"exp": serialize_exp(exp), "exprun": serialize_exprun(exp_run)})
+
+
+@exprun_bp.route(f"/{exprun_bp.name}/<id>/finish-and-upload", methods=["POST"])
+def finish_and_upload_exp_run(id: int):
+    """Save the files of a finished run and update the run in one request. The request is a
+    multipart request with the files of the run (larger files can be uploaded beforehand in
+    chunks) and a field `exprun` with the JSON object of the updated fields of the run.
+
+    The schema of the aggregated primitive outputs of the experiment is inferred from the run if
+    the experiment does not have one yet, otherwise the run is checked against it."""
+    try:
+        exp_run: ExpRun = ExpRun.get_by_id(id)
+    except DoesNotExist:
+        raise NotFound(f"ExpRun with id {id} does not exist")
+
+    try:
+        data = orjson.loads(request.form.get("exprun", ""))
+    except orjson.JSONDecodeError:
+        raise BadRequest("exprun must be a JSON object")
+    exprun_record = deserialize_record(
+        exprun_deserializers,
+        data,
+        [name for name in exprun_deserializers if name not in {"id", "exp", "exp_id"}],
+    )
+
+    save_exp_run_files(exp_run, get_request_run_files())
+
+    with db.atomic():
+        for name, value in exprun_record.items():
+            setattr(exp_run, name, value)
+        exp = Exp.get_by_id(exp_run.exp_id)
+        if exp.aggregated_primitive_outputs is None:
+            exp.aggregated_primitive_outputs = (
+                NestedPrimitiveOutputSchema.infer_from_data(
+                    exp_run.aggregated_primitive_outputs
+                )
+            )
+            exp.save()
+            exp_run.has_invalid_agg_output_schema = False
+        else:
+            exp_run.has_invalid_agg_output_schema = (
+                not exp.aggregated_primitive_outputs.does_data_match(
+                    exp_run.aggregated_primitive_outputs
+                )
+            )
+        exp_run.save()
 
     return jsonify({"status": "success"})
@@ -1 +1,38 @@
-from osin.formats.hdf5 import Hdf5Format
+from pathlib import Path
+from typing import Dict, Set, Type, Union
+
+from osin.formats.base import RunDataFormat
+from osin.formats.blobstore import BlobStore
+from osin.formats.hdf5 import Hdf5Compression, Hdf5FilePool, Hdf5Format
+from osin.formats.npy import NpyFormat
+
+FORMATS: Dict[str, Type[RunDataFormat]] = {}
+
+
+def register_format(format: Type[RunDataFormat]) -> Type[RunDataFormat]:
+    """Register a run data format so that runs stored in the format can be detected and uploaded"""
+    FORMATS[format.name] = format
+    return format
+
+
+def get_format(name: str) -> RunDataFormat:
+    if name not in FORMATS:
+        raise KeyError(f"Unknown run data format: {name}")
+    return FORMATS[name]()
+
+
+def detect_format(rundir: Union[Path, str]) -> RunDataFormat:
+    """Detect the format of a run from the data file in its directory, default to HDF5"""
+    for format in FORMATS.values():
+        if (Path(rundir) / format.data_file_name).exists():
+            return format()
+    return Hdf5Format()
+
+
+def get_allowed_extensions() -> Set[str]:
+    """Extensions of the files that can be uploaded to a run's directory"""
+    return {".json"}.union(*(format.extensions for format in FORMATS.values()))
+
+
+register_format(Hdf5Format)
+register_format(NpyFormat)
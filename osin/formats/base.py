@@ -0,0 +1,581 @@
+import math
+import operator
+import re
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import (
+    Any,
+    ClassVar,
+    ContextManager,
+    Dict,
+    Iterator,
+    List,
+    Literal,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
+
+import numpy as np
+import orjson
+from osin.models import ExampleData, ExpRunData
+from osin.types import NestedPrimitiveOutput, PyObject
+
+# status of a cell in a primitive column (stored in the column's mask)
+CELL_PRESENT = 0
+CELL_NONE = 1
+CELL_ABSENT = 2
+
+ColumnType = Literal["bool", "int", "float", "str", "json"]
+
+# marker of a cell that does not have value (different from None)
+ABSENT = object()
+
+# percentiles reported by `compute_column_stats`
+STATS_PERCENTILES = (50, 90, 99)
+
+FILTER_OPS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<=": operator.le,
+    ">=": operator.ge,
+    "<": operator.lt,
+    ">": operator.gt,
+}
+FILTER_PREDICATE_REGEX = re.compile(r"^\s*([^=!<>]+?)\s*(==|!=|<=|>=|<|>)\s*(.*?)\s*$")
+
+
+@dataclass
+class Predicate:
+    """A comparison between a column and a value, e.g., `data.metrics.f1<0.5`
+
+    Attributes:
+        key: id, name, or `primitive/<flattened key>`
+        op: one of `FILTER_OPS`
+        value: the value parsed as JSON (falls back to the text if it is not valid JSON)
+        text: the value as written in the filter, used to compare with string columns
+    """
+
+    key: str
+    op: str
+    value: Any
+    text: str
+
+
+@dataclass
+class SaveTimings:
+    """Time (in seconds) spent in the stages of saving run data
+
+    Attributes:
+        serialize: time spent serializing complex objects, summed over the workers if they are
+            serialized in parallel
+        wait: time the writer spent waiting for objects to be serialized
+        write: time the writer spent on everything else (mostly writing to disk)
+        total: wall-clock time of saving the data
+    """
+
+    serialize: float = 0.0
+    wait: float = 0.0
+    write: float = 0.0
+    total: float = 0.0
+
+
+@dataclass
+class Column:
+    """Values of a primitive output of all individual examples of a run
+
+    Attributes:
+        ids: ids of the examples
+        type: type of the column
+        values: values of the column (numbers, numpy strings, or decoded JSON objects for json columns)
+        status: status of the cells (`CELL_*`)
+    """
+
+    ids: np.ndarray
+    type: ColumnType
+    values: np.ndarray
+    status: np.ndarray
+
+
+class RunDataFormat(ABC):
+    """An interface for storing experiment run data.
+
+    Each format has a name (used to select the format of a run), the name of its main data file in
+    the run directory (used to detect the format of a run), and the extensions of all the files it
+    writes (used to accept the files when a run is uploaded).
+    """
+
+    name: ClassVar[str]
+    data_file_name: ClassVar[str]
+    extensions: ClassVar[Set[str]]
+
+    @abstractmethod
+    def save_run_data(
+        self,
+        data: ExpRunData,
+        outfile: Union[Path, str],
+        timings: Optional[SaveTimings] = None,
+    ):
+        """Save the experiment run data to the file, recording the time spent in each stage in
+        `timings` if provided"""
+        pass
+
+    @abstractmethod
+    def load_exp_run_data(
+        self,
+        infile: Any,
+        fields: Optional[Dict[str, Set[str]]] = None,
+        limit: int = -1,
+        offset: int = 0,
+        sorted_by: Optional[str] = None,
+        sorted_order: Literal["ascending", "descending"] = "ascending",
+        with_complex_size: bool = False,
+        filter: Optional[str] = None,
+    ) -> Tuple[ExpRunData, int]:
+        """Load experiment run data from a file.
+
+        Args:
+            infile: The file to load from
+            fields: A dictionary of fields to load. If None, load all fields
+            limit: The maximum number of individual records to load. If -1, load all records. Only apply to `individual` property
+            offset: The offset to start loading from. Only apply to `individual` property
+            sorted_by: The field to sort by. Only apply to `individual` property. Support either: id, name, or `data.<nested_field>` where `nested_field` is a field in the primitive or complex object
+            sorted_order: The order to sort by. Only apply to `individual` property
+            with_complex_size: return the number of complex objects for each individual example
+            filter: Only keep individual examples matching the filter (see `parse_filter`). The filter is applied before pagination, and the returned number of examples is the number of matched examples
+        """
+        pass
+
+    @abstractmethod
+    def get_stats(
+        self, infile: Any, keys: Optional[List[str]] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """Compute statistics (see `compute_column_stats`) of numeric primitive outputs across
+        all individual examples.
+
+        Args:
+            infile: The file to load from
+            keys: Flattened keys of the primitive outputs (e.g., `metrics/f1`). If None, use all
+                numeric primitive outputs
+        Raises:
+            KeyError: if a key is not found or is not numeric
+        """
+        pass
+
+    @abstractmethod
+    def get_column(self, infile: Any, key: str) -> Column:
+        """Read a primitive output of all individual examples.
+
+        Args:
+            infile: The file to load from
+            key: Flattened key of the primitive output (e.g., `metrics/f1`)
+        Raises:
+            KeyError: if the key is not found
+        """
+        pass
+
+    @abstractmethod
+    def get_examples_data(
+        self,
+        infile: Any,
+        example_ids: List[str],
+        primitive: bool,
+        complex: bool,
+        with_complex_size: bool = False,
+    ) -> List[ExampleData]:
+        """Get data of multiple examples (in the same order as the given ids) in one pass.
+
+        Args:
+            infile: The file to load from
+            example_ids: Ids of the examples
+            primitive: whether to load primitive outputs
+            complex: whether to load complex outputs
+            with_complex_size: return the number of complex objects for each example
+        """
+        pass
+
+    def load_examples_json(
+        self,
+        infile: Any,
+        limit: int = -1,
+        offset: int = 0,
+        sorted_by: Optional[str] = None,
+        sorted_order: Literal["ascending", "descending"] = "ascending",
+        filter: Optional[str] = None,
+    ) -> Optional[Tuple[List[bytes], int]]:
+        """Load pre-serialized JSON of a page of individual examples (`ExampleData.to_dict()` with
+        the number of complex objects) and the number of (matched) examples, see
+        `load_exp_run_data` for the arguments. Returns None if the file does not store the JSON of
+        its examples, in which case the examples must be loaded with `load_exp_run_data`."""
+        return None
+
+    def get_examples_json(
+        self, infile: Any, example_ids: List[str]
+    ) -> Optional[List[bytes]]:
+        """Get pre-serialized JSON of multiple examples (see `load_examples_json`), or None if the
+        file does not store the JSON of its examples"""
+        return None
+
+    def get_example_data(
+        self,
+        infile: Any,
+        example_id: str,
+        primitive: bool,
+        complex: bool,
+        with_complex_size: bool = False,
+    ) -> ExampleData:
+        return self.get_examples_data(
+            infile, [example_id], primitive, complex, with_complex_size
+        )[0]
+
+    def open_complex_array(
+        self, infile: Any, example_id: Optional[str], key: str
+    ) -> ContextManager[Tuple[Type[PyObject], Any, Mapping[str, Any]]]:
+        """Open a complex object stored as an array (e.g., an image) to read parts of it. Yields
+        the class of the object, the array (supporting numpy slicing), and its attributes.
+
+        Args:
+            infile: The file to load from
+            example_id: Id of the example of the object, None for aggregated objects
+            key: Key of the object
+        Raises:
+            KeyError: if the object is not found
+            ValueError: if the object is not stored as an array
+        """
+        raise NotImplementedError(
+            f"The {self.name} format does not support reading parts of complex objects"
+        )
+
+    def open_complex_columns(
+        self, infile: Any, example_id: Optional[str], key: str
+    ) -> ContextManager[Tuple[Type[PyObject], Mapping[str, Any], Mapping[str, Any]]]:
+        """Open a complex object stored as a mapping of arrays (e.g., columns of a table) to read
+        slices of them. Yields the class of the object, the arrays (supporting numpy slicing), and
+        its attributes.
+
+        Raises:
+            KeyError: if the object is not found
+            ValueError: if the object is not stored as a mapping of arrays
+        """
+        raise NotImplementedError(
+            f"The {self.name} format does not support reading parts of complex objects"
+        )
+
+    def open_stream_writer(
+        self,
+        outfile: Union[Path, str],
+        batch_size: int = 1000,
+        live: bool = False,
+        flush_interval: Optional[float] = None,
+    ):
+        """Open a writer that appends individual examples to the file in batches while the run
+        is in progress. If `live` is True, the file can be read while it is written, and a batch
+        is written at least every `flush_interval` seconds"""
+        raise NotImplementedError(
+            f"The {self.name} format does not support streaming individual examples"
+        )
+
+    def _flatten_primitive_object(
+        self, primitive_object: NestedPrimitiveOutput, prefix: str = ""
+    ) -> Iterator[Tuple[str, Any]]:
+        for key, value in primitive_object.items():
+            self._validate_key(key)
+            if isinstance(value, dict):
+                yield from self._flatten_primitive_object(value, prefix + key + "/")
+            else:
+                yield prefix + key, value
+
+    def _flatten_primitive_columns(
+        self,
+        primitive_object: NestedPrimitiveOutput,
+        leaf_keys: Set[str],
+        prefix: str = "",
+    ) -> Iterator[Tuple[str, Any]]:
+        """Flatten a primitive object into (column key, value) pairs. Objects at `leaf_keys` and
+        empty objects are not flattened"""
+        for key, value in primitive_object.items():
+            self._validate_key(key)
+            column_key = prefix + key
+            if (
+                isinstance(value, dict)
+                and len(value) > 0
+                and column_key not in leaf_keys
+            ):
+                yield from self._flatten_primitive_columns(
+                    value, leaf_keys, column_key + "/"
+                )
+            else:
+                yield column_key, value
+
+    def _group_primitive_columns(
+        self, primitive_objects: List[NestedPrimitiveOutput], leaf_keys: Set[str]
+    ) -> Dict[str, List[Any]]:
+        """Group the flattened values of the primitive objects by column, values of objects
+        without a column are `ABSENT`"""
+        columns: Dict[str, List[Any]] = {}
+        for i, primitive_object in enumerate(primitive_objects):
+            for key, value in self._flatten_primitive_columns(
+                primitive_object, leaf_keys
+            ):
+                if key not in columns:
+                    columns[key] = [ABSENT] * len(primitive_objects)
+                columns[key][i] = value
+        return columns
+
+    def _validate_key(self, key: str):
+        if key.find("/") != -1:
+            raise KeyError(f"Cannot have '/' in hdf5 group's item: {key}")
+
+
+def set_nested_value(obj: dict, key: str, value: Any):
+    """Set a value of a nested object using a flattened key (e.g., `metrics/f1`)"""
+    path = key.split("/")
+    for name in path[:-1]:
+        obj = obj.setdefault(name, {})
+    obj[path[-1]] = value
+
+
+def find_parent_keys(keys: Set[str]) -> Set[str]:
+    """Find the flattened keys that are also parents of other keys (only the outermost ones)"""
+    parents = set()
+    for key in keys:
+        path = key.split("/")
+        for i in range(1, len(path)):
+            parent = "/".join(path[:i])
+            if parent in keys:
+                parents.add(parent)
+                break
+    return parents
+
+
+def infer_column_type(values: List[Any]) -> Optional[ColumnType]:
+    """Infer the type of a primitive column from its values, None if there is no value"""
+    coltype = None
+    for value in values:
+        if value is None or value is ABSENT:
+            continue
+        if isinstance(value, bool):
+            valtype = "bool"
+        elif isinstance(value, int):
+            valtype = "int"
+        elif isinstance(value, float):
+            valtype = "float"
+        elif isinstance(value, str):
+            valtype = "str"
+        else:
+            return "json"
+        coltype = valtype if coltype is None else promote_column_type(coltype, valtype)
+        if coltype == "json":
+            break
+    return coltype
+
+
+def promote_column_type(type1: ColumnType, type2: ColumnType) -> ColumnType:
+    if type1 == type2:
+        return type1
+    if {type1, type2} == {"int", "float"}:
+        return "float"
+    return "json"
+
+
+def argsort_with_missing(
+    values: np.ndarray, is_valid: np.ndarray
+) -> Tuple[np.ndarray, int]:
+    """Compute the permutation of rows sorting the values in ascending order.
+
+    Rows that do not have a value (`is_valid` is False) are placed at the end of the permutation.
+    `values` either has one value per row, or only the values of the valid rows.
+    Returns the permutation and the number of rows having a value.
+    """
+    valid_rows = np.flatnonzero(is_valid)
+    if len(values) != len(valid_rows):
+        values = values[valid_rows]
+    sort_index = valid_rows[np.argsort(values, kind="stable")]
+    if len(valid_rows) != len(is_valid):
+        sort_index = np.concatenate([sort_index, np.flatnonzero(~is_valid)])
+    return sort_index, len(valid_rows)
+
+
+def page_sort_index(
+    sort_index: Any,
+    n_valid: int,
+    offset: int,
+    limit: int,
+    sorted_order: Literal["ascending", "descending"],
+) -> np.ndarray:
+    """Get rows of a page from an ascending sort index (an array, or a dataset from which only the
+    needed slices are read). In both orders, examples without value stay at the end."""
+    n = len(sort_index)
+    end = min(offset + limit, n)
+    if sorted_order == "ascending":
+        return np.asarray(sort_index[offset:end], dtype=np.int64)
+
+    parts = []
+    if offset < n_valid:
+        parts.append(sort_index[n_valid - min(end, n_valid) : n_valid - offset][::-1])
+    if end > n_valid:
+        parts.append(sort_index[max(offset, n_valid) : end])
+    if len(parts) == 0:
+        return np.zeros((0,), dtype=np.int64)
+    return np.concatenate(parts).astype(np.int64)
+
+
+def parse_filter(filter: str) -> List[Predicate]:
+    """Parse a filter: a conjunction of predicates separated by `&&`, e.g.,
+    `data.metrics.f1<0.5&&data.label==cat`. The left side of a predicate is id, name, or
+    `data.<nested primitive key>` (`data.primitive.<nested primitive key>` is also accepted, same as
+    `sorted_by`). Values are parsed as JSON (e.g., `0.5`, `true`, `null`, `"a string"`), anything
+    else is a string.
+
+    Raises:
+        ValueError: if the filter is invalid
+    """
+    predicates = []
+    for expr in filter.split("&&"):
+        m = FILTER_PREDICATE_REGEX.match(expr)
+        if m is None:
+            raise ValueError(f"Invalid filter predicate: {expr}")
+        key, op, text = m.groups()
+
+        key = parse_column_key(key)
+
+        try:
+            value = orjson.loads(text)
+        except orjson.JSONDecodeError:
+            value = text
+        if isinstance(value, str):
+            text = value
+        predicates.append(Predicate(key, op, value, text))
+    return predicates
+
+
+def parse_column_key(key: str) -> str:
+    """Convert a key written in the API (id, name, `data.<nested primitive key>` or
+    `data.primitive.<nested primitive key>`) to a column key: id, name, or
+    `primitive/<flattened key>`
+
+    Raises:
+        ValueError: if the key is invalid
+    """
+    path = key.split(".")
+    if len(path) == 1:
+        if key not in ("id", "name"):
+            raise ValueError(f"Invalid key: {key}")
+        return key
+    if path[0] != "data" or any(name == "" for name in path):
+        raise ValueError(f"Invalid key: {key}")
+    if path[1] == "primitive" and len(path) > 2:
+        path = path[1:]
+    return "primitive/" + "/".join(path[1:])
+
+
+def encode_filter_column(
+    values: List[Any], coltype: ColumnType
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Convert values of a column (absent cells are marked with `ABSENT`) to the arrays of values
+    and cell status used by `match_predicate`"""
+    status = np.asarray(
+        [
+            CELL_ABSENT if v is ABSENT else (CELL_NONE if v is None else CELL_PRESENT)
+            for v in values
+        ],
+        dtype=np.int8,
+    )
+    if coltype in ("bool", "int", "float"):
+        default = math.nan if coltype == "float" else 0
+        array = np.asarray(
+            [default if v is None or v is ABSENT else v for v in values],
+            dtype={"bool": np.bool_, "int": np.int64, "float": np.float64}[coltype],
+        )
+    elif coltype == "str":
+        array = np.asarray(
+            ["" if v is None or v is ABSENT else v for v in values], dtype=np.str_
+        )
+    else:
+        array = np.empty((len(values),), dtype=np.object_)
+        array[:] = values
+    return array, status
+
+
+def match_predicate(
+    predicate: Predicate,
+    coltype: ColumnType,
+    values: np.ndarray,
+    status: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Evaluate a predicate over all values of a column at once.
+
+    Args:
+        predicate: the predicate
+        coltype: type of the column
+        values: the values (numbers, numpy strings, or decoded JSON objects for json columns)
+        status: status of the cells (`CELL_*`), None if all cells have value
+    Returns:
+        A boolean mask of the matched rows. Cells without value only match `==null` (None cells)
+        and `!=null` (cells with value).
+    """
+    if status is None:
+        status = np.full((len(values),), CELL_PRESENT, dtype=np.int8)
+    has_value = status == CELL_PRESENT
+    if predicate.value is None:
+        if predicate.op == "==":
+            return status == CELL_NONE
+        if predicate.op == "!=":
+            return has_value
+        return np.zeros((len(values),), dtype=np.bool_)
+
+    op = FILTER_OPS[predicate.op]
+    if coltype == "str":
+        return has_value & op(values, predicate.text)
+    if coltype in ("bool", "int", "float"):
+        if isinstance(predicate.value, (bool, int, float)):
+            return has_value & op(values, predicate.value)
+        # comparing a number with a non-number never matches
+        return np.zeros((len(values),), dtype=np.bool_)
+
+    matched = np.zeros((len(values),), dtype=np.bool_)
+    for i in np.flatnonzero(has_value):
+        try:
+            matched[i] = op(values[i], predicate.value)
+        except TypeError:
+            pass
+    return matched
+
+
+def filter_sort_index(
+    sort_index: Any, n_valid: int, selected: np.ndarray
+) -> Tuple[np.ndarray, int]:
+    """Keep only the selected rows (a boolean mask) of a sort index, preserving the order"""
+    sort_index = np.asarray(sort_index)
+    is_selected = selected[sort_index]
+    return sort_index[is_selected], int(np.count_nonzero(is_selected[:n_valid]))
+
+
+def compute_column_stats(values: np.ndarray, is_valid: np.ndarray) -> Dict[str, Any]:
+    """Compute count, mean, std, min, max and percentiles (p50, p90, p99) of the valid values of a
+    numeric column. Statistics other than the counts are None if there is no valid value."""
+    values = np.asarray(values)[is_valid].astype(np.float64)
+    stats = {"count": len(values), "n_missing": len(is_valid) - len(values)}
+    if len(values) == 0:
+        stats.update((name, None) for name in ["mean", "std", "min", "max"])
+        stats.update((f"p{q}", None) for q in STATS_PERCENTILES)
+        return stats
+
+    stats["mean"] = float(values.mean())
+    stats["std"] = float(values.std())
+    stats["min"] = float(values.min())
+    stats["max"] = float(values.max())
+    for q, value in zip(STATS_PERCENTILES, np.percentile(values, STATS_PERCENTILES)):
+        stats[f"p{q}"] = float(value)
+    return stats
+
+
+def get_file_signature(path: Path) -> Tuple[int, int]:
+    """Identify a version of a file: a replaced file has a different inode, an overwritten file
+    has a different modified time"""
+    stat = path.stat()
+    return (stat.st_ino, stat.st_mtime_ns)
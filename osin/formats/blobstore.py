@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, List, Union
+
+
+class BlobStore:
+    """A content-addressed store of blobs (serialized complex objects) with reference counting.
+
+    A blob is keyed by the sha256 of its content and stored once at `<root>/<key[:2]>/<key[2:]>`,
+    no matter how many runs reference it. The number of references of each blob is kept in a
+    sqlite database (`<root>/blobs.db`). Blobs without references are only deleted by `gc`, once
+    they have not been uploaded, queried (`missing`) or released (`decref`) for a grace period, so
+    a client that was told a blob exists can still reference it when it uploads its run.
+    """
+
+    def __init__(self, root: Union[Path, str]):
+        self.root = Path(root)
+        self.root.mkdir(exist_ok=True, parents=True)
+        self.dbfile = self.root / "blobs.db"
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(str(self.dbfile), check_same_thread=False)
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS blobs(key TEXT PRIMARY KEY, size INTEGER, refcount INTEGER, touched_at REAL DEFAULT 0)"
+            )
+            columns = {row[1] for row in self.db.execute("PRAGMA table_info(blobs)")}
+            if "touched_at" not in columns:
+                # stores created by previous versions
+                self.db.execute(
+                    "ALTER TABLE blobs ADD COLUMN touched_at REAL DEFAULT 0"
+                )
+
+    @staticmethod
+    def get_key(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def put(self, data: bytes, n_refs: int = 1) -> str:
+        """Store the blob if it does not exist and add `n_refs` references to it"""
+        key = self.get_key(data)
+        with self.lock, self.db:
+            record = self.db.execute(
+                "SELECT refcount FROM blobs WHERE key = ?", (key,)
+            ).fetchone()
+            if record is None:
+                self._write_file(key, data)
+                self.db.execute(
+                    "INSERT INTO blobs(key, size, refcount, touched_at) VALUES (?, ?, ?, ?)",
+                    (key, len(data), n_refs, time.time()),
+                )
+            else:
+                self.db.execute(
+                    "UPDATE blobs SET refcount = refcount + ?, touched_at = ? WHERE key = ?",
+                    (n_refs, time.time(), key),
+                )
+        return key
+
+    def get(self, key: str) -> bytes:
+        path = self._get_path(key)
+        if not path.exists():
+            raise KeyError(f"blob `{key}` not found")
+        return path.read_bytes()
+
+    def missing(self, keys: Iterable[str]) -> List[str]:
+        """Get keys of the blobs that are not in the store (keeping the order, without duplicates).
+        The blobs that are in the store are kept by `gc` for its grace period."""
+        out = []
+        with self.lock, self.db:
+            for key in dict.fromkeys(keys):
+                cursor = self.db.execute(
+                    "UPDATE blobs SET touched_at = ? WHERE key = ?", (time.time(), key)
+                )
+                if cursor.rowcount == 0:
+                    out.append(key)
+        return out
+
+    def incref(self, keys: Iterable[str]):
+        """Add one reference to the blobs for each occurrence of their keys"""
+        with self.lock, self.db:
+            for key in keys:
+                cursor = self.db.execute(
+                    "UPDATE blobs SET refcount = refcount + 1 WHERE key = ?", (key,)
+                )
+                if cursor.rowcount == 0:
+                    raise KeyError(f"blob `{key}` not found")
+
+    def decref(self, keys: Iterable[str]):
+        """Remove one reference to the blobs for each occurrence of their keys. Blobs left without
+        references are not deleted (see `gc`)"""
+        with self.lock, self.db:
+            for key in keys:
+                self.db.execute(
+                    "UPDATE blobs SET refcount = refcount - 1, touched_at = ? WHERE key = ? AND refcount > 0",
+                    (time.time(), key),
+                )
+
+    def gc(self, grace_period: float = 24 * 3600) -> int:
+        """Delete blobs without references that have not been uploaded, queried or released for
+        `grace_period` seconds. Returns the number of deleted blobs"""
+        with self.lock, self.db:
+            keys = [
+                key
+                for (key,) in self.db.execute(
+                    "SELECT key FROM blobs WHERE refcount <= 0 AND touched_at < ?",
+                    (time.time() - grace_period,),
+                )
+            ]
+            self._delete_unreferenced(keys)
+        return len(keys)
+
+    def stats(self) -> dict:
+        """Report the number of blobs and references, and the bytes saved by deduplication.
+        `dedup_ratio` is the size of all references over the size of the stored blobs."""
+        with self.lock:
+            n_blobs, n_refs, stored_bytes, referenced_bytes = self.db.execute(
+                "SELECT COUNT(*), SUM(refcount), SUM(size), SUM(size * refcount) FROM blobs"
+            ).fetchone()
+        stored_bytes = stored_bytes or 0
+        referenced_bytes = referenced_bytes or 0
+        return {
+            "n_blobs": n_blobs,
+            "n_refs": n_refs or 0,
+            "stored_bytes": stored_bytes,
+            "referenced_bytes": referenced_bytes,
+            "dedup_ratio": referenced_bytes / stored_bytes if stored_bytes > 0 else 1.0,
+        }
+
+    def _delete_unreferenced(self, keys: List[str]):
+        for key in keys:
+            self._get_path(key).unlink(missing_ok=True)
+            self.db.execute("DELETE FROM blobs WHERE key = ?", (key,))
+
+    def _get_path(self, key: str) -> Path:
+        if len(key) != 64 or not all(c in "0123456789abcdef" for c in key):
+            raise KeyError(f"invalid blob key `{key}`")
+        return self.root / key[:2] / key[2:]
+
+    def _write_file(self, key: str, data: bytes):
+        path = self._get_path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmpfile = path.parent / f".{path.name}.tmp"
+        tmpfile.write_bytes(data)
+        os.replace(tmpfile, path)
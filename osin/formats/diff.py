@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Literal, Tuple
+
+import numpy as np
+from osin.formats.base import (
+    CELL_PRESENT,
+    Column,
+    argsort_with_missing,
+    filter_sort_index,
+    page_sort_index,
+)
+
+# how the value of an example changes from the first run to the second run
+CHANGE_UNCHANGED = 0
+CHANGE_INCREASED = 1
+CHANGE_DECREASED = 2
+# the values are different but not comparable (e.g., strings)
+CHANGE_CHANGED = 3
+# only one of the runs has a value
+CHANGE_MISSING = 4
+
+CHANGES = {
+    "unchanged": CHANGE_UNCHANGED,
+    "increased": CHANGE_INCREASED,
+    "decreased": CHANGE_DECREASED,
+    "changed": CHANGE_CHANGED,
+    "missing": CHANGE_MISSING,
+}
+DiffSortKey = Literal["id", "delta", "abs_delta"]
+
+
+@dataclass
+class ColumnDiff:
+    """Per-example differences of a primitive output between two runs, joined by example id.
+
+    Attributes:
+        a: the column of the first run
+        b: the column of the second run
+        ids: ids of the examples in both runs
+        rows_a: rows of the examples in the first run
+        rows_b: rows of the examples in the second run
+        delta: `b - a` of numeric columns, NaN if not comparable or one of the values is missing
+        change: how the value changes (`CHANGE_*`)
+    """
+
+    a: Column
+    b: Column
+    ids: np.ndarray
+    rows_a: np.ndarray
+    rows_b: np.ndarray
+    delta: np.ndarray
+    change: np.ndarray
+
+    @staticmethod
+    def from_columns(a: Column, b: Column) -> ColumnDiff:
+        """Join two columns by example id (the first example is used if an id is duplicated)"""
+        ids, rows_a, rows_b = np.intersect1d(
+            a.ids, b.ids, assume_unique=False, return_indices=True
+        )
+        values_a = a.values[rows_a]
+        values_b = b.values[rows_b]
+        valid_a = _is_valid(a, rows_a)
+        valid_b = _is_valid(b, rows_b)
+        both_valid = valid_a & valid_b
+
+        change = np.full((len(ids),), CHANGE_UNCHANGED, dtype=np.int8)
+        change[valid_a != valid_b] = CHANGE_MISSING
+        delta = np.full((len(ids),), np.nan, dtype=np.float64)
+        if _is_numeric(a) and _is_numeric(b):
+            delta[both_valid] = values_b[both_valid].astype(np.float64)
+            delta[both_valid] -= values_a[both_valid].astype(np.float64)
+            change[both_valid & (delta > 0)] = CHANGE_INCREASED
+            change[both_valid & (delta < 0)] = CHANGE_DECREASED
+        else:
+            if a.type == b.type == "str":
+                is_equal = values_a == values_b
+            else:
+                is_equal = np.fromiter(
+                    (x == y for x, y in zip(values_a.tolist(), values_b.tolist())),
+                    dtype=np.bool_,
+                    count=len(ids),
+                )
+            change[both_valid & ~is_equal] = CHANGE_CHANGED
+
+        return ColumnDiff(a, b, ids, rows_a, rows_b, delta, change)
+
+    def summary(self) -> Dict[str, Any]:
+        """Counts of examples per change, and the number of examples only in one of the runs"""
+        counts = np.bincount(self.change, minlength=len(CHANGES))
+        summary: Dict[str, Any] = {
+            "n_common": len(self.ids),
+            "n_only_a": len(self.a.ids) - len(self.ids),
+            "n_only_b": len(self.b.ids) - len(self.ids),
+        }
+        for name, code in CHANGES.items():
+            summary[f"n_{name}"] = int(counts[code])
+        is_valid = ~np.isnan(self.delta)
+        summary["mean_delta"] = (
+            float(self.delta[is_valid].mean()) if np.any(is_valid) else None
+        )
+        return summary
+
+    def select(
+        self,
+        changes: List[str],
+        sorted_by: DiffSortKey,
+        sorted_order: Literal["ascending", "descending"],
+        offset: int,
+        limit: int,
+    ) -> Tuple[np.ndarray, int]:
+        """Get the positions (in `ids`) of a page of examples having one of the changes, and the
+        number of examples having one of the changes. Examples without delta are placed at the end
+        when sorting by delta."""
+        if sorted_by == "id":
+            sort_index, n_valid = np.arange(len(self.ids)), len(self.ids)
+        else:
+            values = np.abs(self.delta) if sorted_by == "abs_delta" else self.delta
+            sort_index, n_valid = argsort_with_missing(values, ~np.isnan(values))
+
+        if len(changes) < len(CHANGES):
+            selected = np.isin(self.change, [CHANGES[name] for name in changes])
+            sort_index, n_valid = filter_sort_index(sort_index, n_valid, selected)
+        n_selected = len(sort_index)
+        if limit <= 0:
+            limit = n_selected
+        return (
+            page_sort_index(sort_index, n_valid, offset, limit, sorted_order),
+            n_selected,
+        )
+
+    def to_dict(self, positions: np.ndarray) -> List[dict]:
+        """Serialize the differences of the examples at the given positions"""
+        change_names = list(CHANGES.keys())
+        out = []
+        for i in positions.tolist():
+            delta = self.delta[i]
+            out.append(
+                {
+                    "id": str(self.ids[i]),
+                    "a": _get_value(self.a, self.rows_a[i]),
+                    "b": _get_value(self.b, self.rows_b[i]),
+                    "delta": None if np.isnan(delta) else float(delta),
+                    "change": change_names[self.change[i]],
+                }
+            )
+        return out
+
+
+def _is_numeric(column: Column) -> bool:
+    return column.type in ("bool", "int", "float")
+
+
+def _is_valid(column: Column, rows: np.ndarray) -> np.ndarray:
+    is_valid = column.status[rows] == CELL_PRESENT
+    if column.type == "float":
+        is_valid &= ~np.isnan(column.values[rows])
+    return is_valid
+
+
+def _get_value(column: Column, row: int) -> Any:
+    if column.status[row] != CELL_PRESENT:
+        return None
+    value = column.values[row]
+    return value.item() if isinstance(value, np.generic) else value
@@ -1,4 +1,34 @@
+"""HDF5 storage of the data of experiment runs.
+
+Layout of a file:
+
+- `/aggregated/primitive`, `/aggregated/complex`: aggregated outputs of the run.
+- `/individual/id`, `/individual/name`: string columns of the individual examples.
+- `/individual/primitive/<key>`: a typed column per flattened primitive key (e.g., `metrics/f1`).
+  A key with a value in some examples and nested keys in others is a json column, absent cells
+  are flagged in `/individual/primitive_mask` and int values of float columns in
+  `/individual/primitive_int`.
+- `/individual/complex/<example_id>` (or `/individual/complex/<bucket>/<example_id>` with
+  `n_complex_buckets`): complex objects of an example. With `dedup`, they only hold keys of the
+  blob store, and all referenced keys are listed in `/blob_refs`.
+- `/individual/id_index`: sorted ids and their rows, written when the file is sealed.
+- `/individual/json`: JSON of each example, with `json_cache`.
+
+Files written with the previous layout (one group per example) are still readable. HDF5 indexes
+links of large groups with a B-tree, so the flat layout of complex objects stays faster up to
+millions of examples (see `scripts/benchmark_bucketed_layout.py`).
+"""
+
+import io
 import math
+import os
+import threading
+import time
+import zipfile
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
 from typing import (
@@ -6,89 +36,193 @@ from typing import (
     Callable,
     Dict,
     Generic,
+    Iterator,
+    List,
     Literal,
+    Mapping,
     Optional,
     Set,
     Tuple,
+    Type,
     TypeVar,
     Union,
 )
 
 import numpy as np
-from h5py import Empty, File, Group
+import orjson
+from h5py import Dataset, Empty, File, Group, ref_dtype, string_dtype
+from h5py.h5 import INDEX_CRT_ORDER as h5_INDEX_CRT_ORDER
+from h5py.h5 import ITER_INC as h5_ITER_INC
 from numpy import sort
+from osin.formats.base import (
+    ABSENT,
+    CELL_ABSENT,
+    CELL_NONE,
+    CELL_PRESENT,
+    Column,
+    ColumnType,
+    Predicate,
+    RunDataFormat,
+    SaveTimings,
+    argsort_with_missing,
+    compute_column_stats,
+    encode_filter_column,
+    filter_sort_index,
+    find_parent_keys,
+    get_file_signature,
+    infer_column_type,
+    match_predicate,
+    page_sort_index,
+    parse_filter,
+    promote_column_type,
+    set_nested_value,
+)
+from osin.formats.blobstore import BlobStore
+from osin.misc import orjson_dumps
 from osin.models import ExampleData, ExpRunData, Record
 from osin.models.exp_data import RecordWithComplexSize
 from osin.types import NestedPrimitiveOutput, PyObject
 
+# number of rows per chunk of the columns in the columnar layout
+COLUMN_CHUNK_SIZE = 4096
+# number of sorted ids per block of the id index, a lookup reads one block
+ID_INDEX_BLOCK_SIZE = 4096
+# maximum number of complex objects serialized ahead of the writer by a serialize executor
+SERIALIZE_QUEUE_SIZE = 64
+# default maximum number of seconds between two batches of a live stream writer
+LIVE_FLUSH_INTERVAL = 10.0
+
+
+@dataclass
+class Hdf5Compression:
+    """Compression of complex objects stored in HDF5.
+
+    Attributes:
+        method: compression filter, gzip has better ratio while lzf is faster
+        level: compression level of gzip (0-9), None to use the default level (4)
+        shuffle: whether to apply the shuffle filter before compressing, it only helps
+            objects serialized to arrays of multi-byte numbers
+        chunk_size: maximum number of elements per chunk
+    """
+
+    method: Literal["gzip", "lzf"] = "gzip"
+    level: Optional[int] = None
+    shuffle: bool = False
+    chunk_size: int = 65536
+
 
-class Hdf5Format:
-    """An interface for storing experiment data"""
+# compression of complex objects serialized to arrays when no compression is configured
+DEFAULT_ARRAY_COMPRESSION = Hdf5Compression("gzip", 4, shuffle=True)
 
-    def save_run_data(self, data: ExpRunData, outfile: Union[Path, str]):
-        """Save the experiment run data to the file"""
+
+class Hdf5Format(RunDataFormat):
+    """An interface for storing experiment data in an HDF5 file (see the module docstring for
+    the layout of the file).
+
+    Args:
+        compression: compression of complex objects (none by default)
+        compression_by_type: compression of complex objects of specific types
+        dedup: store serialized complex objects in the repository's `BlobStore`
+        json_cache: also store the JSON of each example (see `load_examples_json`)
+        n_complex_buckets: shard the groups of complex objects into this many buckets
+        decode_executor: decode complex objects of a page of examples in parallel
+        serialize_executor: serialize complex objects ahead of the writer
+    """
+
+    name = "hdf5"
+    data_file_name = "data.h5"
+    extensions = {".h5"}
+
+    def __init__(
+        self,
+        compression: Optional["Hdf5Compression"] = None,
+        compression_by_type: Optional[Dict[Type[PyObject], "Hdf5Compression"]] = None,
+        dedup: bool = False,
+        blob_store: Optional[BlobStore] = None,
+        json_cache: bool = False,
+        n_complex_buckets: int = 0,
+        decode_executor: Optional[Executor] = None,
+        serialize_executor: Optional[Executor] = None,
+    ):
+        self.compression = compression
+        self.compression_by_type = compression_by_type or {}
+        self.dedup = dedup
+        self.blob_store = blob_store
+        self.json_cache = json_cache
+        self.n_complex_buckets = n_complex_buckets
+        self.decode_executor = decode_executor
+        self.serialize_executor = serialize_executor
+
+    def save_run_data(
+        self,
+        data: ExpRunData,
+        outfile: Union[Path, str],
+        timings: Optional[SaveTimings] = None,
+    ):
+        """Save the experiment run data to the file, recording the time spent in each stage in
+        `timings` if provided"""
+        start = time.perf_counter()
         with File(outfile, "a") as f:
-            self._update_nested_primitive_object(
-                f.create_group("/aggregated/primitive", track_order=True),
-                data.aggregated.primitive,
-            )
-
-            grp = f.create_group("/aggregated/complex", track_order=True)
-            for key, value in data.aggregated.complex.items():
-                self._validate_key(key)
-                grp[key] = value.serialize_hdf5()
-                grp.attrs[key] = value.get_classpath()
-
-            ind_group = f.create_group("/individual", track_order=True)
-            for (
-                example_id,
-                example,
-            ) in data.individual.items():
-                self._validate_key(example_id)
-                ex_group = ind_group.create_group(example_id, track_order=True)
-                ex_group.attrs["id"] = example.id
-                ex_group.attrs["name"] = example.name
-
-                self._update_nested_primitive_object(
-                    ex_group.create_group("primitive", track_order=True),
-                    example.data.primitive,
-                )
-
-                grp = ex_group.create_group(f"complex", track_order=True)
-                for key, obj in example.data.complex.items():
-                    self._validate_key(key)
-                    grp[key] = obj.serialize_hdf5()
-                    grp.attrs[key] = obj.get_classpath()
+            self._save_aggregated(f, data.aggregated, timings)
+            ind_group = self._create_columnar_group(f)
+            self._append_examples(
+                ind_group, list(data.individual.values()), timings=timings
+            )
+            self._build_sort_indexes(ind_group)
+
+        if timings is not None:
+            timings.total = time.perf_counter() - start
+            timings.write = timings.total - timings.wait
+            if self.serialize_executor is None:
+                timings.write -= timings.serialize
+
+    def open_stream_writer(
+        self,
+        outfile: Union[Path, str],
+        batch_size: int = 1000,
+        live: bool = False,
+        flush_interval: Optional[float] = None,
+    ) -> "Hdf5StreamWriter":
+        """Open a writer that appends individual examples to the file in batches while the run
+        is in progress. In live mode, the file can be read while it is written, and a batch is
+        written at least every `flush_interval` seconds (default: `LIVE_FLUSH_INTERVAL`). See
+        `Hdf5StreamWriter`."""
+        if live and flush_interval is None:
+            flush_interval = LIVE_FLUSH_INTERVAL
+        return Hdf5StreamWriter(self, outfile, batch_size, live, flush_interval)
 
     def load_exp_run_data(
         self,
-        infile: Union[Path, str],
+        infile: Union[Path, str, File],
         fields: Optional[Dict[str, Set[str]]] = None,
         limit: int = -1,
         offset: int = 0,
         sorted_by: Optional[str] = None,
         sorted_order: Literal["ascending", "descending"] = "ascending",
         with_complex_size: bool = False,
+        filter: Optional[str] = None,
     ) -> Tuple[ExpRunData, int]:
         """Load experiment run data from a file.
 
         Args:
-            infile: The file to load from
+            infile: The file to load from, either a path or an opened file
             fields: A dictionary of fields to load. If None, load all fields
             limit: The maximum number of individual records to load. If -1, load all records. Only apply to `individual` property
             offset: The offset to start loading from. Only apply to `individual` property
             sorted_by: The field to sort by. Only apply to `individual` property. Support either: id, name, or `data.<nested_field>` where `nested_field` is a field in the primitive or complex object
             sorted_order: The order to sort by. Only apply to `individual` property
             with_complex_size: return the number of complex objects for each individual example
+            filter: Only keep individual examples matching the filter (see `parse_filter`), e.g., `data.metrics.f1<0.5&&data.label==cat`. The filter is evaluated over whole columns before pagination, and the returned number of examples is the number of matched examples
         """
         if fields is None:
             fields = {
                 "aggregated": {"primitive", "complex"},
                 "individual": {"primitive", "complex"},
             }
+        predicates = parse_filter(filter) if filter is not None else None
 
         expdata = ExpRunData()
-        with File(infile, "r") as f:
+        with _open_file(infile) as f:
             if "aggregated" in fields:
                 group = f["aggregated"]
                 if "primitive" in fields["aggregated"]:
@@ -96,119 +230,1233 @@ class Hdf5Format:
                         group["primitive"]
                     )
                 if "complex" in fields["aggregated"]:
-                    for key, value in group["complex"].items():
-                        pyobject_class = PyObject.from_classpath(group.attrs[key])
-                        expdata.aggregated.complex[key] = pyobject_class.from_hdf5(
-                            value[()]
-                        )
-            if "individual" in fields:
-                if limit <= 0 and offset == 0 and sorted_by is None:
-                    # select all without sorting
-                    selected_examples = f["individual"].items()
-                elif sorted_by is None:
-                    if limit <= 0:
-                        limit = math.inf  # type: ignore
-                    # select some, no need to sort
-                    selected_examples = []
-                    for i, (key, ex_group) in enumerate(f["individual"].items()):
-                        if i < offset:
-                            continue
-                        if i >= offset + limit:
-                            break
-                        selected_examples.append((key, ex_group))
-                else:
-                    if sorted_by.find("/") == -1:
-                        sorted_by_first, sorted_by_remain = sorted_by, None
-                        assert sorted_by_first in ["id", "name"], sorted_by_first
-                    else:
-                        sorted_by_first, sorted_by_remain = sorted_by.split("/", 1)
-                        assert sorted_by_first == "data", sorted_by_first
-
-                    # must sort
-                    if limit <= 0:
-                        limit = math.inf  # type: ignore
-                    selected_examples = []
-                    sorted_keys = {}
-                    if sorted_by_remain is None:
-                        for key, ex_group in f["individual"].items():
-                            selected_examples.append((key, ex_group))
-                            sorted_keys[key] = ex_group.attrs[sorted_by_first]
-                    else:
-                        for key, ex_group in f["individual"].items():
-                            selected_examples.append((key, ex_group))
-                            if sorted_by_remain not in ex_group:
-                                raise KeyError(
-                                    f"sort by key `data.{sorted_by_remain}` not found"
-                                )
-                            sorted_keys[key] = ex_group[sorted_by_remain][()]
-
-                    selected_examples.sort(
-                        key=lambda x: sorted_keys[x[0]],
-                        reverse=sorted_order == "descending",
-                    )
-                    selected_examples = selected_examples[offset : offset + limit]
-
-                for example_id, ex_group in selected_examples:
-                    assert example_id not in expdata.individual
-                    if with_complex_size:
-                        data = RecordWithComplexSize(n_complex=len(ex_group["complex"]))
-                    else:
-                        data = Record()
-                    example = ExampleData(
-                        id=ex_group.attrs["id"],
-                        name=ex_group.attrs["name"],
-                        data=data,
+                    items = list(group["complex"].items())
+                    objects = self._read_complex_objects(
+                        [(group["complex"], key, value) for key, value in items]
                     )
+                    for (key, _), obj in zip(items, objects):
+                        expdata.aggregated.complex[key] = obj
 
-                    if "primitive" in fields["individual"]:
-                        example.data.primitive = self._load_nested_primitive_object(
-                            ex_group["primitive"]
-                        )
-                    if "complex" in fields["individual"]:
-                        for key, value in ex_group["complex"].items():
-                            pyobject_class = PyObject.from_classpath(
-                                ex_group["complex"].attrs[key]
-                            )
-                            example.data.complex[key] = pyobject_class.from_hdf5(
-                                value[()]
-                            )
-                    expdata.individual[example_id] = example
-
-            n_examples = len(f["individual"])
+            if self._is_columnar(f):
+                ind_group = f["individual"]
+                if "individual" not in fields:
+                    if predicates is None:
+                        return expdata, len(ind_group["id"])
+                    selected = self._filter_rows(ind_group, predicates)
+                    return expdata, int(np.count_nonzero(selected))
+
+                rows, n_examples = self._select_page(
+                    ind_group, limit, offset, sorted_by, sorted_order, predicates
+                )
+                for example in self._read_examples(
+                    ind_group, rows, fields["individual"], with_complex_size
+                ):
+                    assert example.id not in expdata.individual
+                    expdata.individual[example.id] = example
+                return expdata, n_examples
+
+            if predicates is not None:
+                selected_keys = self._filter_legacy_examples(
+                    f["individual"], predicates
+                )
+                n_examples = len(selected_keys)
+            else:
+                selected_keys = None
+                n_examples = len(f["individual"])
+            if "individual" in fields:
+                self._load_legacy_individual(
+                    f["individual"],
+                    expdata,
+                    fields["individual"],
+                    limit,
+                    offset,
+                    sorted_by,
+                    sorted_order,
+                    with_complex_size,
+                    selected_keys,
+                )
         return expdata, n_examples
 
-    def get_example_data(
+    def load_examples_json(
         self,
-        infile: Union[Path, str],
-        example_id: str,
+        infile: Union[Path, str, File],
+        limit: int = -1,
+        offset: int = 0,
+        sorted_by: Optional[str] = None,
+        sorted_order: Literal["ascending", "descending"] = "ascending",
+        filter: Optional[str] = None,
+    ) -> Optional[Tuple[List[bytes], int]]:
+        predicates = parse_filter(filter) if filter is not None else None
+        with _open_file(infile) as f:
+            if not self._has_json_cache(f):
+                return None
+            ind_group = f["individual"]
+            rows, n_examples = self._select_page(
+                ind_group, limit, offset, sorted_by, sorted_order, predicates
+            )
+            return _read_rows(ind_group["json"], rows).tolist(), n_examples
+
+    def get_examples_json(
+        self, infile: Union[Path, str, File], example_ids: List[str]
+    ) -> Optional[List[bytes]]:
+        with _open_file(infile) as f:
+            if not self._has_json_cache(f):
+                return None
+            ind_group = f["individual"]
+            rows = self._find_rows(ind_group, example_ids)
+            return _read_rows(ind_group["json"], rows).tolist()
+
+    def get_examples_data(
+        self,
+        infile: Union[Path, str, File],
+        example_ids: List[str],
         primitive: bool,
         complex: bool,
         with_complex_size: bool = False,
-    ) -> ExampleData:
-        with File(infile, "r") as f:
-            if example_id not in f["individual"]:
+    ) -> List[ExampleData]:
+        """Get data of multiple examples (in the same order as the given ids) in one pass.
+
+        Args:
+            infile: The file to load from, either a path or an opened file
+            example_ids: Ids of the examples
+            primitive: whether to load primitive outputs
+            complex: whether to load complex outputs
+            with_complex_size: return the number of complex objects for each example
+        """
+        fields = set()
+        if primitive:
+            fields.add("primitive")
+        if complex:
+            fields.add("complex")
+
+        with _open_file(infile) as f:
+            if self._is_columnar(f):
+                ind_group = f["individual"]
+                rows = self._find_rows(ind_group, example_ids)
+                return self._read_examples(ind_group, rows, fields, with_complex_size)
+
+            examples = []
+            for example_id in example_ids:
+                if example_id not in f["individual"]:
+                    raise KeyError(f"example id `{example_id}` not found")
+                examples.append(
+                    self._load_legacy_example(
+                        f["individual"][example_id], fields, with_complex_size
+                    )
+                )
+            return examples
+
+    def get_stats(
+        self, infile: Union[Path, str, File], keys: Optional[List[str]] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """Compute statistics (see `compute_column_stats`) of numeric primitive outputs across
+        all individual examples. With the columnar layout, each statistic is a NumPy reduction over
+        a whole column.
+
+        Args:
+            infile: The file to load from, either a path or an opened file
+            keys: Flattened keys of the primitive outputs (e.g., `metrics/f1`). If None, use all
+                numeric primitive outputs
+        """
+        with _open_file(infile) as f:
+            if self._is_columnar(f):
+                ind_group = f["individual"]
+                if keys is None:
+                    keys = [
+                        key
+                        for key in self._iter_column_keys(ind_group["primitive"])
+                        if ind_group["primitive"][key].attrs["type"]
+                        in ("bool", "int", "float")
+                    ]
+                stats = {}
+                for key in keys:
+                    ds = ind_group["primitive"].get(key, None)
+                    if not isinstance(ds, Dataset) or ds.attrs["type"] not in (
+                        "bool",
+                        "int",
+                        "float",
+                    ):
+                        raise KeyError(f"numeric key `data.{key}` not found")
+                    stats[key] = compute_column_stats(
+                        *self._read_numeric_column(ind_group, key)
+                    )
+                return stats
+
+            # legacy layout: gather the values from the example groups
+            columns: Dict[str, List[Any]] = {}
+            ind_group = f["individual"]
+            for i, ex_group in enumerate(ind_group.values()):
+                primitive_object = self._load_nested_primitive_object(
+                    ex_group["primitive"]
+                )
+                for key, value in self._flatten_primitive_object(primitive_object):
+                    if key not in columns:
+                        columns[key] = [ABSENT] * len(ind_group)
+                    columns[key][i] = value
+
+            stats = {}
+            for key in columns.keys() if keys is None else keys:
+                coltype = infer_column_type(columns.get(key, []))
+                if coltype not in ("bool", "int", "float"):
+                    if keys is None:
+                        continue
+                    raise KeyError(f"numeric key `data.{key}` not found")
+                values, status = encode_filter_column(columns[key], coltype)
+                is_valid = status == CELL_PRESENT
+                if coltype == "float":
+                    is_valid &= ~np.isnan(values)
+                stats[key] = compute_column_stats(values, is_valid)
+            return stats
+
+    def get_column(self, infile: Union[Path, str, File], key: str) -> Column:
+        """Read a primitive output of all individual examples.
+
+        Args:
+            infile: The file to load from, either a path or an opened file
+            key: Flattened key of the primitive output (e.g., `metrics/f1`)
+        """
+        with _open_file(infile) as f:
+            ind_group = f["individual"]
+            if self._is_columnar(f):
+                if not isinstance(ind_group["primitive"].get(key, None), Dataset):
+                    raise KeyError(f"key `data.{key}` not found")
+                ids = np.asarray(ind_group["id"].asstr()[()], dtype=np.str_)
+                return Column(ids, *self._read_column_array(ind_group, key))
+
+            keys = list(ind_group.keys())
+            column = Column(
+                np.asarray([ind_group[k].attrs["id"] for k in keys], dtype=np.str_),
+                *self._read_legacy_column(ind_group, keys, "primitive/" + key),
+            )
+            if len(keys) > 0 and np.all(column.status == CELL_ABSENT):
+                raise KeyError(f"key `data.{key}` not found")
+            return column
+
+    def _find_rows(self, ind_group: Group, example_ids: List[str]) -> np.ndarray:
+        """Find rows of the examples in the columnar layout, using the id index if the file has
+        one, otherwise scanning the id column"""
+        if _has_id_index(ind_group):
+            return self._lookup_id_index(ind_group["id_index"], example_ids)
+
+        ids = ind_group["id"][()]
+        if len(example_ids) == 1:
+            (rows,) = np.nonzero(ids == example_ids[0].encode())
+            if len(rows) == 0:
+                raise KeyError(f"example id `{example_ids[0]}` not found")
+            return rows[:1]
+
+        id2row = {}
+        for row, example_id in enumerate(ids):
+            id2row.setdefault(example_id, row)
+        rows = np.empty((len(example_ids),), dtype=np.int64)
+        for i, example_id in enumerate(example_ids):
+            row = id2row.get(example_id.encode(), None)
+            if row is None:
                 raise KeyError(f"example id `{example_id}` not found")
+            rows[i] = row
+        return rows
+
+    def _lookup_id_index(self, index: Group, example_ids: List[str]) -> np.ndarray:
+        """Find rows of the examples with a binary search over the fences of the id index, then
+        over the only block of sorted ids that may contain each id"""
+        ids_ds = index["ids"]
+        block_size = int(index.attrs["block_size"])
+        fences = index["fences"][()]
+        keys = [example_id.encode() for example_id in example_ids]
+        blocks = (
+            np.searchsorted(fences, np.asarray(keys, dtype=np.bytes_), side="right") - 1
+            if len(keys) > 0
+            else np.zeros((0,), dtype=np.int64)
+        )
+
+        rows = np.empty((len(keys),), dtype=np.int64)
+        # read each block once even if it contains several of the ids
+        block_ids: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        for i, (key, block) in enumerate(zip(keys, blocks.tolist())):
+            if block < 0:
+                raise KeyError(f"example id `{example_ids[i]}` not found")
+            if block not in block_ids:
+                start = block * block_size
+                block_ids[block] = (
+                    ids_ds[start : start + block_size],
+                    index["rows"][start : start + block_size],
+                )
+            sorted_ids, sorted_rows = block_ids[block]
+            pos = int(np.searchsorted(sorted_ids, key))
+            if pos >= len(sorted_ids) or sorted_ids[pos] != key:
+                raise KeyError(f"example id `{example_ids[i]}` not found")
+            rows[i] = sorted_rows[pos]
+        return rows
+
+    def _save_aggregated(
+        self, f: File, aggregated: Record, timings: Optional[SaveTimings] = None
+    ):
+        self._update_nested_primitive_object(
+            f.create_group("/aggregated/primitive", track_order=True),
+            aggregated.primitive,
+        )
+
+        grp = f.create_group("/aggregated/complex", track_order=True)
+        values = self._serialize_complex_objects(
+            list(aggregated.complex.values()), timings
+        )
+        for (key, obj), value in zip(aggregated.complex.items(), values):
+            self._write_complex_object(grp, key, obj, value)
+
+    def _serialize_complex_objects(
+        self, objects: List[PyObject], timings: Optional[SaveTimings] = None
+    ) -> Iterator[Any]:
+        """Serialize the objects (see `PyObject.serialize_hdf5`), yielding their values in order.
+        With a serialize executor, the following objects are serialized while the caller writes
+        the current one."""
+        if self.serialize_executor is None:
+            for obj in objects:
+                value, duration = _serialize_complex_object(obj)
+                if timings is not None:
+                    timings.serialize += duration
+                yield value
+            return
+
+        futures = deque()
+        for obj in objects:
+            futures.append(
+                self.serialize_executor.submit(_serialize_complex_object, obj)
+            )
+            if len(futures) >= SERIALIZE_QUEUE_SIZE:
+                yield self._wait_serialized_object(futures.popleft(), timings)
+        while len(futures) > 0:
+            yield self._wait_serialized_object(futures.popleft(), timings)
+
+    def _wait_serialized_object(
+        self, future: "Future[Tuple[Any, float]]", timings: Optional[SaveTimings]
+    ) -> Any:
+        start = time.perf_counter()
+        value, duration = future.result()
+        if timings is not None:
+            timings.wait += time.perf_counter() - start
+            timings.serialize += duration
+        return value
+
+    @contextmanager
+    def open_complex_array(
+        self,
+        infile: Union[Path, str, File],
+        example_id: Optional[str],
+        key: str,
+    ) -> Iterator[Tuple[Type[PyObject], Dataset, Mapping[str, Any]]]:
+        """Open a complex object stored as an array without reading it. Yields the class of the
+        object, the dataset (from which parts of the array can be read), and its attributes.
+
+        Args:
+            infile: The file to load from, either a path or an opened file
+            example_id: Id of the example of the object, None for aggregated objects
+            key: Key of the object
+        Raises:
+            KeyError: if the object is not found
+            ValueError: if the object is not stored as an array
+        """
+        with _open_file(infile) as f:
+            group, value = self._find_complex_object(f, example_id, key)
+            if (
+                not isinstance(value, Dataset)
+                or value.ndim == 0
+                or value.attrs.get("encoding", None) is not None
+            ):
+                raise ValueError(f"complex object `{key}` is not stored as an array")
+            yield PyObject.from_classpath(group.attrs[key]), value, value.attrs
+
+    @contextmanager
+    def open_complex_columns(
+        self,
+        infile: Union[Path, str, File],
+        example_id: Optional[str],
+        key: str,
+    ) -> Iterator[Tuple[Type[PyObject], Mapping[str, Any], Mapping[str, Any]]]:
+        """Open a complex object stored as a mapping of arrays (e.g., a table) without reading it.
+        Yields the class of the object, the arrays (datasets from which slices can be read), and
+        its attributes.
+
+        Raises:
+            KeyError: if the object is not found
+            ValueError: if the object is not stored as a mapping of arrays
+        """
+        with _open_file(infile) as f:
+            group, value = self._find_complex_object(f, example_id, key)
+            if isinstance(value, Group):
+                arrays = _Hdf5Arrays(value)
+            elif value.attrs.get("encoding", None) == "blob-npz":
+                arrays = self._read_blob(value)
+            else:
+                raise ValueError(f"complex object `{key}` is not stored in columns")
+            yield PyObject.from_classpath(group.attrs[key]), arrays, value.attrs
+
+    def _find_complex_object(
+        self, f: File, example_id: Optional[str], key: str
+    ) -> Tuple[Group, Union[Dataset, Group]]:
+        """Find a complex object of an example (None for aggregated objects), returning the group
+        containing the object and the object's dataset (or group for mapping of arrays)"""
+        if example_id is None:
+            group = f["aggregated/complex"]
+        elif self._is_columnar(f):
+            ind_group = f["individual"]
+            row = int(self._find_rows(ind_group, [example_id])[0])
+            if ind_group["n_complex"][row] == 0:
+                group = None
+            elif _has_complex_ref(ind_group):
+                group = f[ind_group["complex_ref"][row]]
+            else:
+                group = self._get_complex_group(ind_group, example_id)
+        elif example_id in f["individual"]:
+            group = f["individual"][example_id]["complex"]
+        else:
+            raise KeyError(f"example id `{example_id}` not found")
+
+        if group is None or key not in group:
+            raise KeyError(f"complex object `{key}` not found")
+        return group, group[key]
+
+    def get_blob_refs(self, infile: Union[Path, str, File]) -> List[str]:
+        """Get keys of the blobs referenced by the file (one per reference)"""
+        with _open_file(infile) as f:
+            if "blob_refs" not in f:
+                return []
+            return f["blob_refs"].asstr()[()].tolist()
+
+    def _write_complex_object(
+        self, group: Group, key: str, obj: PyObject, value: Any = None
+    ):
+        """Write a complex object to the group. Objects serialized to bytes are stored in the blob
+        store when deduplication is enabled, or as chunked arrays of bytes when a compression is
+        configured for them. Objects serialized to arrays (e.g., images) are always stored as
+        chunked, compressed datasets so that parts of them can be read (e.g., to make previews),
+        and objects serialized to mappings of arrays (e.g., tables) as groups of such datasets, or
+        as npz archives in the blob store when deduplication is enabled.
+
+        `value` is the serialized object if it has been serialized beforehand.
+        """
+        self._validate_key(key)
+        if value is None:
+            value = obj.serialize_hdf5()
+        compression = self.compression_by_type.get(type(obj), self.compression)
+        if isinstance(value, np.ndarray) and value.ndim > 0 and value.size > 0:
+            _create_array_dataset(
+                group, key, value, compression or DEFAULT_ARRAY_COMPRESSION
+            )
+        elif self.dedup and isinstance(value, Mapping):
+            self._write_blob(group, key, _encode_npz(value), "blob-npz")
+        elif isinstance(value, Mapping):
+            subgroup = group.create_group(key, track_order=True)
+            for name, array in value.items():
+                self._validate_key(name)
+                _create_array_dataset(
+                    subgroup, name, array, compression or DEFAULT_ARRAY_COMPRESSION
+                )
+        elif self.dedup and isinstance(value, bytes):
+            self._write_blob(group, key, value, "blob")
+        elif compression is None or not isinstance(value, bytes) or len(value) == 0:
+            group[key] = value
+        else:
+            ds = group.create_dataset(
+                key,
+                data=np.frombuffer(value, dtype=np.uint8),
+                chunks=(min(len(value), compression.chunk_size),),
+                compression=compression.method,
+                compression_opts=compression.level,
+                shuffle=compression.shuffle,
+            )
+            ds.attrs["encoding"] = "bytes"
+        for name, attr in obj.get_hdf5_attrs().items():
+            group[key].attrs[name] = attr
+        group.attrs[key] = obj.get_classpath()
+
+    def _write_blob(self, group: Group, key: str, value: bytes, encoding: str):
+        """Store the value in the blob store and its key in the group"""
+        if self.blob_store is None:
+            raise ValueError("A blob store is required to deduplicate complex objects")
+        blob_key = self.blob_store.put(value)
+        group[key] = blob_key
+        group[key].attrs["encoding"] = encoding
+        _append_blob_ref(group.file, blob_key)
+
+    def _read_complex_object(self, group: Group, key: str, value: Dataset) -> PyObject:
+        """Read a complex object from the group, decompression is done by the HDF5 filters"""
+        return _decode_complex_object(self._read_raw_complex_object(group, key, value))
+
+    def _read_complex_objects(
+        self, items: List[Tuple[Group, str, Union[Dataset, Group]]]
+    ) -> List[PyObject]:
+        """Read complex objects given their groups, keys and values. With a decode executor, the
+        stored values are read one by one (h5py serializes calls to HDF5 anyway) and decoded in
+        parallel."""
+        if self.decode_executor is None or len(items) <= 1:
+            return [self._read_complex_object(*item) for item in items]
+        raw_objects = [
+            self._read_raw_complex_object(*item, materialize=True) for item in items
+        ]
+        return list(self.decode_executor.map(_decode_complex_object, raw_objects))
+
+    def _read_raw_complex_object(
+        self,
+        group: Group,
+        key: str,
+        value: Union[Dataset, Group],
+        materialize: bool = False,
+    ) -> Tuple[Type[PyObject], Any, Mapping[str, Any]]:
+        """Read the stored value of a complex object without decoding it, returning its class, the
+        value and its attributes. Objects stored as groups of arrays are read lazily unless
+        `materialize` is True."""
+        pyobject_class = PyObject.from_classpath(group.attrs[key])
+        attrs = dict(value.attrs)
+        if isinstance(value, Group):
+            arrays = _Hdf5Arrays(value)
+            if materialize:
+                return (
+                    pyobject_class,
+                    {name: arrays[name][()] for name in arrays},
+                    attrs,
+                )
+            return pyobject_class, arrays, attrs
+        encoding = attrs.get("encoding", None)
+        if encoding == "bytes":
+            return pyobject_class, value[()].tobytes(), attrs
+        if encoding == "blob" or encoding == "blob-npz":
+            return pyobject_class, self._read_blob(value), attrs
+        return pyobject_class, value[()], attrs
+
+    def _read_blob(self, value: Dataset) -> Union[bytes, Dict[str, np.ndarray]]:
+        """Read a value stored in the blob store, npz archives are read as mappings of arrays"""
+        if self.blob_store is None:
+            raise ValueError("A blob store is required to read deduplicated objects")
+        blob = self.blob_store.get(value.asstr()[()])
+        if value.attrs.get("encoding", None) == "blob-npz":
+            return _decode_npz(blob)
+        return blob
+
+    def _create_columnar_group(self, f: File) -> Group:
+        ind_group = f.create_group("/individual", track_order=True)
+        ind_group.attrs["layout"] = "columnar"
+        for name, dtype in [
+            ("id", string_dtype()),
+            ("name", string_dtype()),
+            ("n_complex", np.int32),
+            # row-ordinal index: reference to the group of complex objects of each row
+            ("complex_ref", ref_dtype),
+        ] + ([("json", string_dtype())] if self.json_cache else []):
+            ind_group.create_dataset(
+                name,
+                shape=(0,),
+                maxshape=(None,),
+                dtype=dtype,
+                chunks=(COLUMN_CHUNK_SIZE,),
+            )
+        ind_group.create_group("primitive", track_order=True)
+        ind_group.create_group("primitive_mask", track_order=True)
+        complex_group = ind_group.create_group("complex", track_order=True)
+        if self.n_complex_buckets > 0:
+            complex_group.attrs["n_buckets"] = self.n_complex_buckets
+        return ind_group
+
+    def _append_examples(
+        self,
+        ind_group: Group,
+        examples: List[ExampleData],
+        complex_group: Optional[Group] = None,
+        timings: Optional[SaveTimings] = None,
+    ):
+        """Append the examples as new rows to the columns of the individual group.
+
+        The id column is written last, so readers of a live file (see `Hdf5StreamWriter`) never see
+        an example whose other columns have not been written yet. If `complex_group` is given,
+        complex objects are written to it instead of `/individual/complex` and the row-ordinal
+        index is not updated.
+        """
+        start = len(ind_group["id"])
+        end = start + len(examples)
+
+        column_values = [
+            ("name", [example.name for example in examples]),
+            ("n_complex", [len(example.data.complex) for example in examples]),
+        ]
+        if "json" in ind_group:
+            column_values.append(
+                ("json", [_encode_example_json(example) for example in examples])
+            )
+        for name, values in column_values:
+            ds = ind_group[name]
+            ds.resize((end,))
+            if len(values) > 0:
+                ds[start:end] = np.asarray(
+                    values, dtype=object if ds.dtype.kind == "O" else ds.dtype
+                )
+
+        columns = self._gather_primitive_columns(ind_group, examples)
+        prim_group = ind_group["primitive"]
+        existing_columns = set(self._iter_column_keys(prim_group))
+        for key in existing_columns.difference(columns.keys()):
+            columns[key] = [ABSENT] * len(examples)
+
+        for key, values in columns.items():
+            coltype = infer_column_type(values)
+            if key not in existing_columns:
+                self._create_column(ind_group, key, coltype or "float", start)
+                coltype = prim_group[key].attrs["type"]
+            else:
+                prev_coltype = prim_group[key].attrs["type"]
+                new_coltype = (
+                    prev_coltype
+                    if coltype is None
+                    else promote_column_type(prev_coltype, coltype)
+                )
+                if new_coltype != prev_coltype:
+                    self._convert_column(ind_group, key, new_coltype)
+                coltype = new_coltype
+            self._write_column_rows(ind_group, key, coltype, start, values)
+
+        if complex_group is None:
+            complex_refs = self._write_complex_groups(
+                ind_group["complex"], examples, timings
+            )
+            ds = ind_group["complex_ref"]
+            ds.resize((end,))
+            if len(examples) > 0:
+                ds[start:end] = complex_refs
+        else:
+            self._write_complex_groups(complex_group, examples, timings)
+
+        f = ind_group.file
+        if f.swmr_mode:
+            f.flush()
+        ds = ind_group["id"]
+        ds.resize((end,))
+        if len(examples) > 0:
+            ds[start:end] = np.asarray(
+                [example.id for example in examples], dtype=object
+            )
+
+    def _gather_primitive_columns(
+        self, ind_group: Group, examples: List[ExampleData]
+    ) -> Dict[str, List[Any]]:
+        """Gather the primitive values of the examples column by column.
+
+        A key that has a value in some examples and nested keys in others (e.g., `{"a": 1}` and
+        `{"a": {"b": 2}}`) is stored in a single json column with the whole nested objects, existing
+        columns of its nested keys are merged into it. Empty objects are values too, so they are
+        kept (in a json column)."""
+        prim_group = ind_group["primitive"]
+        leaf_keys = set(self._iter_column_keys(prim_group))
+        primitive_objects = [example.data.primitive for example in examples]
+        while True:
+            columns = self._group_primitive_columns(primitive_objects, leaf_keys)
+            conflicts = find_parent_keys(leaf_keys.union(columns.keys()))
+            if len(conflicts) == 0:
+                return columns
+            for key in conflicts:
+                if isinstance(prim_group.get(key, None), Group):
+                    self._merge_json_column(ind_group, key)
+            leaf_keys = set(self._iter_column_keys(prim_group)).union(conflicts)
+
+    def _merge_json_column(self, ind_group: Group, key: str):
+        """Replace the columns of the nested keys of a key by a json column of the key, whose
+        values are the nested objects"""
+        prim_group = ind_group["primitive"]
+        # rows written before the current batch (the id column is written last)
+        n_rows = len(ind_group["id"])
+        values: List[Any] = [ABSENT] * n_rows
+        for subkey in self._iter_column_keys(prim_group[key], key + "/"):
+            column = self._read_column(ind_group, subkey, slice(0, n_rows))
+            for i, value in enumerate(column):
+                if value is not ABSENT:
+                    if values[i] is ABSENT:
+                        values[i] = {}
+                    set_nested_value(values[i], subkey[len(key) + 1 :], value)
+
+        for name in ("primitive", "primitive_mask", "primitive_int"):
+            if name in ind_group and key in ind_group[name]:
+                del ind_group[name][key]
+        self._create_column(ind_group, key, "json", 0)
+        self._write_column_rows(ind_group, key, "json", 0, values)
+
+    def _write_column_rows(
+        self,
+        ind_group: Group,
+        key: str,
+        coltype: ColumnType,
+        start: int,
+        values: List[Any],
+    ):
+        """Write values of a primitive column at the rows starting from `start`, with the status of
+        the cells and, for float columns, which values are ints (`/individual/primitive_int`), so
+        ints are read back as ints"""
+        end = start + len(values)
+        ds = ind_group["primitive"][key]
+        ds.resize((end,))
+        if len(values) == 0:
+            return
+        ds[start:end] = _encode_column_values(values, coltype)
+
+        status = np.asarray(
+            [
+                CELL_ABSENT
+                if value is ABSENT
+                else (CELL_NONE if value is None else CELL_PRESENT)
+                for value in values
+            ],
+            dtype=np.int8,
+        )
+        mask_group = ind_group["primitive_mask"]
+        if key not in mask_group:
+            if not np.all(status == CELL_PRESENT):
+                _require_parent_group(mask_group, key).create_dataset(
+                    key.rsplit("/", 1)[-1],
+                    data=np.full((start,), CELL_PRESENT, dtype=np.int8),
+                    maxshape=(None,),
+                    chunks=(COLUMN_CHUNK_SIZE,),
+                )
+        if key in mask_group:
+            mask_ds = mask_group[key]
+            mask_ds.resize((end,))
+            mask_ds[start:end] = status
+
+        if coltype == "float":
+            is_int = np.asarray(
+                [isinstance(value, int) for value in values], dtype=np.bool_
+            )
+            int_group = ind_group.get("primitive_int", None)
+            if int_group is None or key not in int_group:
+                if not np.any(is_int):
+                    return
+                _create_int_flags(ind_group, key, np.zeros((start,), dtype=np.bool_))
+            int_ds = ind_group["primitive_int"][key]
+            int_ds.resize((end,))
+            int_ds[start:end] = is_int
+
+    def _write_complex_groups(
+        self,
+        complex_group: Group,
+        examples: List[ExampleData],
+        timings: Optional[SaveTimings] = None,
+    ) -> np.ndarray:
+        """Write the complex objects of each example to its group (in the bucketed or flat layout),
+        returning references to the groups"""
+        n_buckets = int(complex_group.attrs.get("n_buckets", 0))
+        complex_refs = np.empty((len(examples),), dtype=ref_dtype)
+        values = self._serialize_complex_objects(
+            [obj for example in examples for obj in example.data.complex.values()],
+            timings,
+        )
+        for i, example in enumerate(examples):
+            if len(example.data.complex) == 0:
+                continue
+            self._validate_key(example.id)
+            if n_buckets > 0:
+                bucket_name = _get_bucket_name(example.id, n_buckets)
+                bucket = complex_group.get(bucket_name, None)
+                if bucket is None:
+                    bucket = complex_group.create_group(bucket_name, track_order=True)
+            else:
+                bucket = complex_group
+            grp = bucket.create_group(example.id, track_order=True)
+            for (key, obj), value in zip(example.data.complex.items(), values):
+                self._write_complex_object(grp, key, obj, value)
+            complex_refs[i] = grp.ref
+        return complex_refs
+
+    def _create_column(
+        self, ind_group: Group, key: str, coltype: ColumnType, n_rows: int
+    ):
+        """Create a new primitive column. If there are existing rows, they are marked as absent"""
+        ds = _require_parent_group(ind_group["primitive"], key).create_dataset(
+            key.rsplit("/", 1)[-1],
+            data=_encode_column_values([ABSENT] * n_rows, coltype),
+            maxshape=(None,),
+            chunks=(COLUMN_CHUNK_SIZE,),
+        )
+        ds.attrs["type"] = coltype
+        if n_rows > 0:
+            _require_parent_group(ind_group["primitive_mask"], key).create_dataset(
+                key.rsplit("/", 1)[-1],
+                data=np.full((n_rows,), CELL_ABSENT, dtype=np.int8),
+                maxshape=(None,),
+                chunks=(COLUMN_CHUNK_SIZE,),
+            )
+
+    def _convert_column(self, ind_group: Group, key: str, coltype: ColumnType):
+        """Rewrite an existing primitive column using a wider column type"""
+        prim_group = ind_group["primitive"]
+        prev_coltype = prim_group[key].attrs["type"]
+        values = self._read_column(ind_group, key, slice(None))
+        del prim_group[key]
+        if "primitive_int" in ind_group and key in ind_group["primitive_int"]:
+            del ind_group["primitive_int"][key]
+        ds = _require_parent_group(prim_group, key).create_dataset(
+            key.rsplit("/", 1)[-1],
+            data=_encode_column_values(values, coltype),
+            maxshape=(None,),
+            chunks=(COLUMN_CHUNK_SIZE,),
+        )
+        ds.attrs["type"] = coltype
+        if prev_coltype == "int" and coltype == "float":
+            _create_int_flags(ind_group, key, np.ones((len(values),), dtype=np.bool_))
+
+    def _read_column(
+        self, ind_group: Group, key: str, rows: Union[slice, np.ndarray]
+    ) -> List[Any]:
+        """Read values of a primitive column at the given rows, absent cells are marked with `ABSENT`"""
+        ds = ind_group["primitive"][key]
+        coltype = ds.attrs["type"]
+        values = _read_rows(ds.asstr() if coltype in ("str", "json") else ds, rows)
+        if coltype == "json":
+            values = [orjson.loads(value) for value in values]
+        else:
+            values = values.tolist()
+        int_group = ind_group.get("primitive_int", None)
+        if coltype == "float" and int_group is not None and key in int_group:
+            for i in np.flatnonzero(_read_rows(int_group[key], rows)):
+                values[i] = int(values[i])
+
+        if key in ind_group["primitive_mask"]:
+            status = _read_rows(ind_group["primitive_mask"][key], rows)
+            for i in np.nonzero(status != CELL_PRESENT)[0]:
+                values[i] = ABSENT if status[i] == CELL_ABSENT else None
+        return values
+
+    def _select_page(
+        self,
+        ind_group: Group,
+        limit: int,
+        offset: int,
+        sorted_by: Optional[str],
+        sorted_order: Literal["ascending", "descending"],
+        predicates: Optional[List[Predicate]],
+    ) -> Tuple[Union[slice, np.ndarray], int]:
+        """Select rows of a page of individual examples matching the predicates (if any) in the
+        columnar layout, returning the rows and the number of matched examples"""
+        n_examples = len(ind_group["id"])
+        if predicates is not None:
+            selected = self._filter_rows(ind_group, predicates)
+            n_examples = int(np.count_nonzero(selected))
+        else:
+            selected = None
+        rows = self._select_rows(
+            ind_group, n_examples, limit, offset, sorted_by, sorted_order, selected
+        )
+        return rows, n_examples
+
+    def _select_rows(
+        self,
+        ind_group: Group,
+        n_examples: int,
+        limit: int,
+        offset: int,
+        sorted_by: Optional[str],
+        sorted_order: Literal["ascending", "descending"],
+        selected: Optional[np.ndarray] = None,
+    ) -> Union[slice, np.ndarray]:
+        """Select rows of individual examples in the columnar layout. When sorting, the rows are
+        read from the persistent sort index if the file has one for the key. `selected` is a
+        boolean mask of the rows matching a filter, if any"""
+        if limit <= 0:
+            limit = n_examples
+        if sorted_by is None:
+            if selected is not None:
+                return np.flatnonzero(selected)[offset : offset + limit]
+            return slice(min(offset, n_examples), min(offset + limit, n_examples))
+
+        sort_key = self._parse_sort_key(ind_group, sorted_by)
+        sort_index_group = ind_group.get("sort_index", None)
+        if sort_index_group is not None and sort_key in sort_index_group:
+            sort_index = sort_index_group[sort_key]
+            n_valid = int(sort_index.attrs["n_valid"])
+        else:
+            sort_index, n_valid = self._compute_sort_index(ind_group, sort_key)
+        if selected is not None:
+            sort_index, n_valid = filter_sort_index(sort_index, n_valid, selected)
+        return page_sort_index(sort_index, n_valid, offset, limit, sorted_order)
+
+    def _filter_rows(self, ind_group: Group, predicates: List[Predicate]) -> np.ndarray:
+        """Evaluate the predicates over the columns, returning a boolean mask of the rows
+        matching all of them"""
+        n_rows = len(ind_group["id"])
+        selected = np.ones((n_rows,), dtype=np.bool_)
+        for predicate in predicates:
+            if predicate.key in ("id", "name"):
+                values = np.asarray(
+                    ind_group[predicate.key].asstr()[:n_rows], dtype=np.str_
+                )
+                selected &= match_predicate(predicate, "str", values)
+                continue
+
+            key = predicate.key[len("primitive/") :]
+            if not isinstance(ind_group["primitive"].get(key, None), Dataset):
+                raise KeyError(f"filter key `data.{key}` not found")
+            selected &= match_predicate(
+                predicate, *self._read_column_array(ind_group, key)
+            )
+        return selected
 
-            ex_group = f["individual"][example_id]
+    def _read_column_array(
+        self, ind_group: Group, key: str
+    ) -> Tuple[ColumnType, np.ndarray, np.ndarray]:
+        """Read the type, all values (as an array) and the cell status of a primitive column"""
+        ds = ind_group["primitive"][key]
+        coltype = ds.attrs["type"]
+        # columns of a live file may have more rows than the id column, which is written last
+        n_rows = len(ind_group["id"])
+        if coltype == "json":
+            values, status = encode_filter_column(
+                self._read_column(ind_group, key, slice(0, n_rows)), coltype
+            )
+            return coltype, values, status
+
+        if coltype == "str":
+            values = np.asarray(ds.asstr()[:n_rows], dtype=np.str_)
+        else:
+            values = ds[:n_rows]
+        if key in ind_group["primitive_mask"]:
+            status = ind_group["primitive_mask"][key][:n_rows]
+        else:
+            status = np.full((len(values),), CELL_PRESENT, dtype=np.int8)
+        return coltype, values, status
+
+    def _parse_sort_key(self, ind_group: Group, sorted_by: str) -> str:
+        """Convert the `sorted_by` argument to a sort key: id, name, or `primitive/<flattened key>`"""
+        if sorted_by.find("/") == -1:
+            assert sorted_by in ["id", "name"], sorted_by
+            return sorted_by
+
+        sorted_by_first, sorted_by_remain = sorted_by.split("/", 1)
+        assert sorted_by_first == "data", sorted_by_first
+        if not sorted_by_remain.startswith("primitive/") or not isinstance(
+            ind_group["primitive"].get(sorted_by_remain[len("primitive/") :], None),
+            Dataset,
+        ):
+            raise KeyError(f"sort by key `data.{sorted_by_remain}` not found")
+        return sorted_by_remain
+
+    def _compute_sort_index(
+        self, ind_group: Group, sort_key: str
+    ) -> Tuple[np.ndarray, int]:
+        """Compute the permutation of rows sorting the examples by the key in ascending order.
+
+        Examples that do not have a value for the key (absent, None or NaN) are placed at the end
+        of the permutation. Returns the permutation and the number of examples having a value.
+        """
+        n_rows = len(ind_group["id"])
+        if sort_key in ("id", "name"):
+            values = np.asarray(ind_group[sort_key].asstr()[:n_rows], dtype=np.str_)
+            return np.argsort(values, kind="stable"), len(values)
+
+        key = sort_key[len("primitive/") :]
+        ds = ind_group["primitive"][key]
+        if ds.attrs["type"] in ("bool", "int", "float"):
+            values, is_valid = self._read_numeric_column(ind_group, key)
+        else:
+            values = self._read_column(ind_group, key, slice(0, n_rows))
+            is_valid = np.asarray(
+                [v is not None and v is not ABSENT for v in values], dtype=np.bool_
+            )
+            values = np.asarray(
+                [v for v in values if v is not None and v is not ABSENT]
+            )
+        return argsort_with_missing(values, is_valid)
+
+    def _read_numeric_column(
+        self, ind_group: Group, key: str
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Read all values of a numeric column and whether each of them is valid (not absent,
+        None or NaN)"""
+        ds = ind_group["primitive"][key]
+        n_rows = len(ind_group["id"])
+        values = ds[:n_rows]
+        if key in ind_group["primitive_mask"]:
+            is_valid = ind_group["primitive_mask"][key][:n_rows] == CELL_PRESENT
+        else:
+            is_valid = np.ones(len(values), dtype=np.bool_)
+        if ds.attrs["type"] == "float":
+            is_valid &= ~np.isnan(values)
+        return values, is_valid
+
+    def _build_sort_indexes(self, ind_group: Group):
+        """Build persistent sort indexes for id, name, and each numeric primitive column, so that
+        sorted pagination only needs to read a slice of an index"""
+        if "sort_index" in ind_group:
+            del ind_group["sort_index"]
+        sort_index_group = ind_group.create_group("sort_index", track_order=True)
+
+        sort_keys = ["id", "name"]
+        for key in self._iter_column_keys(ind_group["primitive"]):
+            if ind_group["primitive"][key].attrs["type"] in ("bool", "int", "float"):
+                sort_keys.append("primitive/" + key)
+
+        for sort_key in sort_keys:
+            sort_index, n_valid = self._compute_sort_index(ind_group, sort_key)
+            ds = sort_index_group.create_dataset(
+                sort_key, data=sort_index.astype(np.int64)
+            )
+            ds.attrs["n_valid"] = n_valid
+
+        self._build_id_index(ind_group)
+
+    def _build_id_index(self, ind_group: Group):
+        """Build the index of example ids: the ids sorted as fixed-length bytes (`ids`) with their
+        rows (`rows`), and the first id of every block of `ID_INDEX_BLOCK_SIZE` sorted ids
+        (`fences`). A lookup reads the fences, which are small, and a single block of ids."""
+        if "id_index" in ind_group:
+            del ind_group["id_index"]
+        index = ind_group.create_group("id_index", track_order=True)
+        index.attrs["block_size"] = ID_INDEX_BLOCK_SIZE
+
+        ids = np.asarray(ind_group["id"][()].tolist(), dtype=np.bytes_)
+        if len(ids) == 0:
+            # numpy gives a zero-length dtype that HDF5 does not support
+            ids = np.zeros((0,), dtype="S1")
+        rows = np.argsort(ids, kind="stable")
+        chunks = (min(len(ids), ID_INDEX_BLOCK_SIZE),) if len(ids) > 0 else None
+        index.create_dataset("ids", data=ids[rows], chunks=chunks)
+        index.create_dataset("rows", data=rows.astype(np.int64), chunks=chunks)
+        index.create_dataset("fences", data=ids[rows][::ID_INDEX_BLOCK_SIZE])
+
+    def _read_examples(
+        self,
+        ind_group: Group,
+        rows: Union[slice, np.ndarray],
+        fields: Set[str],
+        with_complex_size: bool,
+    ) -> List[ExampleData]:
+        """Read individual examples at the given rows of the columnar layout"""
+        ids = _read_rows(ind_group["id"].asstr(), rows).tolist()
+        names = _read_rows(ind_group["name"].asstr(), rows).tolist()
+        n_complex = _read_rows(ind_group["n_complex"], rows).tolist()
+
+        examples = []
+        for i, example_id in enumerate(ids):
             if with_complex_size:
-                data = RecordWithComplexSize(n_complex=len(ex_group["complex"]))
+                data = RecordWithComplexSize(n_complex=n_complex[i])
             else:
                 data = Record()
+            examples.append(ExampleData(id=example_id, name=names[i], data=data))
+
+        if "primitive" in fields:
+            for key in self._iter_column_keys(ind_group["primitive"]):
+                for example, value in zip(
+                    examples, self._read_column(ind_group, key, rows)
+                ):
+                    if value is not ABSENT:
+                        set_nested_value(example.data.primitive, key, value)
 
-            example = ExampleData(
-                id=ex_group.attrs["id"], name=ex_group.attrs["name"], data=data
+        if "complex" in fields:
+            if _has_complex_ref(ind_group):
+                complex_refs = _read_rows(ind_group["complex_ref"], rows)
+            else:
+                complex_refs = None
+            # read the objects of the whole page first, so they can be decoded in parallel
+            items = []
+            for i, example in enumerate(examples):
+                if n_complex[i] == 0:
+                    continue
+                if complex_refs is not None:
+                    grp = ind_group.file[complex_refs[i]]
+                else:
+                    grp = self._get_complex_group(ind_group, example.id)
+                    if grp is None:
+                        # complex objects of a live file are merged when the file is sealed
+                        continue
+                items.extend((example, grp, key, value) for key, value in grp.items())
+            objects = self._read_complex_objects(
+                [(grp, key, value) for _, grp, key, value in items]
             )
-            if primitive:
-                example.data.primitive = self._load_nested_primitive_object(
-                    ex_group["primitive"]
+            for (example, _, key, _), obj in zip(items, objects):
+                example.data.complex[key] = obj
+        return examples
+
+    def _iter_column_keys(self, group: Group, prefix: str = ""):
+        """Iterate over the keys of the primitive columns in insertion order"""
+        for key, value in group.items():
+            if isinstance(value, Group):
+                yield from self._iter_column_keys(value, prefix + key + "/")
+            else:
+                yield prefix + key
+
+    def _get_complex_group(self, ind_group: Group, example_id: str) -> Optional[Group]:
+        """Get the group of complex objects of an example in the columnar layout by its id (in the
+        bucketed or flat layout), None if the example does not have complex objects"""
+        complex_group = ind_group["complex"]
+        n_buckets = int(complex_group.attrs.get("n_buckets", 0))
+        if n_buckets > 0:
+            path = _get_bucket_name(example_id, n_buckets) + "/" + example_id
+        else:
+            path = example_id
+        try:
+            # resolve the path in one call instead of checking each link first
+            return complex_group[path]
+        except KeyError:
+            return None
+
+    def _has_json_cache(self, f: File) -> bool:
+        """Whether the JSON of all individual examples are stored in the file"""
+        if not self._is_columnar(f) or "json" not in f["individual"]:
+            return False
+        return len(f["individual/json"]) == len(f["individual/id"])
+
+    def _is_columnar(self, f: File) -> bool:
+        return f["individual"].attrs.get("layout", None) == "columnar"
+
+    def _load_legacy_individual(
+        self,
+        ind_group: Group,
+        expdata: ExpRunData,
+        fields: Set[str],
+        limit: int,
+        offset: int,
+        sorted_by: Optional[str],
+        sorted_order: Literal["ascending", "descending"],
+        with_complex_size: bool,
+        selected_keys: Optional[List[str]] = None,
+    ):
+        """Load individual examples from files using the previous layout (one group per example).
+        `selected_keys` are keys of the examples matching a filter, if any"""
+        if selected_keys is not None:
+            examples = [(key, ind_group[key]) for key in selected_keys]
+        else:
+            examples = ind_group.items()
+
+        if limit <= 0 and offset == 0 and sorted_by is None:
+            # select all without sorting
+            selected_examples = examples
+        elif sorted_by is None and selected_keys is not None:
+            end = len(examples) if limit <= 0 else offset + limit
+            selected_examples = examples[offset:end]
+        elif sorted_by is None:
+            if limit <= 0:
+                limit = math.inf  # type: ignore
+            # select some, no need to sort
+            selected_examples = [
+                (key, ind_group[key])
+                for key in self._iter_legacy_example_keys(ind_group, offset, limit)
+            ]
+        else:
+            if sorted_by.find("/") == -1:
+                sorted_by_first, sorted_by_remain = sorted_by, None
+                assert sorted_by_first in ["id", "name"], sorted_by_first
+            else:
+                sorted_by_first, sorted_by_remain = sorted_by.split("/", 1)
+                assert sorted_by_first == "data", sorted_by_first
+
+            # must sort
+            selected_examples = []
+            sorted_keys = {}
+            if sorted_by_remain is None:
+                for key, ex_group in examples:
+                    selected_examples.append((key, ex_group))
+                    sorted_keys[key] = ex_group.attrs[sorted_by_first]
+            else:
+                for key, ex_group in examples:
+                    selected_examples.append((key, ex_group))
+                    if sorted_by_remain not in ex_group:
+                        raise KeyError(
+                            f"sort by key `data.{sorted_by_remain}` not found"
+                        )
+                    sorted_keys[key] = ex_group[sorted_by_remain][()]
+
+            selected_examples.sort(
+                key=lambda x: sorted_keys[x[0]],
+                reverse=sorted_order == "descending",
+            )
+            if limit <= 0:
+                selected_examples = selected_examples[offset:]
+            else:
+                selected_examples = selected_examples[offset : offset + limit]
+
+        for example_id, ex_group in selected_examples:
+            assert example_id not in expdata.individual
+            expdata.individual[example_id] = self._load_legacy_example(
+                ex_group, fields, with_complex_size
+            )
+
+    def _filter_legacy_examples(
+        self, ind_group: Group, predicates: List[Predicate]
+    ) -> List[str]:
+        """Get keys of the examples matching all predicates in the legacy layout"""
+        keys = list(ind_group.keys())
+        selected = np.ones((len(keys),), dtype=np.bool_)
+        for predicate in predicates:
+            if predicate.key in ("id", "name"):
+                values = [ind_group[key].attrs[predicate.key] for key in keys]
+                coltype = infer_column_type(values) or "str"
+                column = (coltype, *encode_filter_column(values, coltype))
+            else:
+                column = self._read_legacy_column(ind_group, keys, predicate.key)
+                if len(keys) > 0 and np.all(column[2] == CELL_ABSENT):
+                    raise KeyError(f"filter key `data.{predicate.key}` not found")
+            selected &= match_predicate(predicate, *column)
+        return [key for key, is_selected in zip(keys, selected) if is_selected]
+
+    def _read_legacy_column(
+        self, ind_group: Group, keys: List[str], path: str
+    ) -> Tuple[ColumnType, np.ndarray, np.ndarray]:
+        """Gather the values of a primitive output (`path` is relative to the example groups, e.g.,
+        `primitive/metrics/f1`) of the examples in the legacy layout, see `_read_column_array`"""
+        values = []
+        for key in keys:
+            ds = ind_group[key].get(path, None)
+            if isinstance(ds, Dataset):
+                values.append(self._read_primitive_value(ds))
+            else:
+                values.append(ABSENT)
+        coltype = infer_column_type(values) or "float"
+        return (coltype, *encode_filter_column(values, coltype))
+
+    def _iter_legacy_example_keys(
+        self, ind_group: Group, offset: int, limit: Union[int, float]
+    ) -> List[str]:
+        """Get keys of the examples at position [offset, offset + limit) in the legacy layout.
+
+        The example groups were created with tracked order, so we can start iterating from the
+        offset using the creation order index instead of walking all links before it.
+        """
+        keys = []
+        if limit <= 0 or offset >= len(ind_group):
+            return keys
+
+        def collect(name: bytes):
+            keys.append(name.decode())
+            return len(keys) >= limit or None
+
+        try:
+            ind_group.id.links.iterate(
+                collect, idx_type=h5_INDEX_CRT_ORDER, order=h5_ITER_INC, idx=offset
+            )
+        except RuntimeError:
+            # no creation order index, walk the links from the start
+            keys = []
+            for i, key in enumerate(ind_group.keys()):
+                if i >= offset + limit:
+                    break
+                if i >= offset:
+                    keys.append(key)
+        return keys
+
+    def _load_legacy_example(
+        self, ex_group: Group, fields: Set[str], with_complex_size: bool
+    ) -> ExampleData:
+        if with_complex_size:
+            data = RecordWithComplexSize(n_complex=len(ex_group["complex"]))
+        else:
+            data = Record()
+
+        example = ExampleData(
+            id=ex_group.attrs["id"], name=ex_group.attrs["name"], data=data
+        )
+        if "primitive" in fields:
+            example.data.primitive = self._load_nested_primitive_object(
+                ex_group["primitive"]
+            )
+        if "complex" in fields:
+            for key, value in ex_group["complex"].items():
+                example.data.complex[key] = self._read_complex_object(
+                    ex_group["complex"], key, value
                 )
-            if complex:
-                for key, value in ex_group["complex"].items():
-                    pyobject_class = PyObject.from_classpath(
-                        ex_group["complex"].attrs[key]
-                    )
-                    example.data.complex[key] = pyobject_class.from_hdf5(value[()])
-            return example
+        return example
 
     def _update_nested_primitive_object(
         self, group: Group, primitive_object: NestedPrimitiveOutput
@@ -229,20 +1477,555 @@ class Hdf5Format:
             if isinstance(value, Group):
                 primitive_object[key] = self._load_nested_primitive_object(value)
             else:
-                val = value[()]
-                if isinstance(val, np.floating):
-                    val = float(val)
-                elif isinstance(val, np.integer):
-                    val = int(val)
-                elif isinstance(val, np.bool_):
-                    val = bool(val)
-                elif isinstance(val, bytes):
-                    val = val.decode()
-                elif isinstance(val, Empty):
-                    val = None
-                primitive_object[key] = val
+                primitive_object[key] = self._read_primitive_value(value)
         return primitive_object
 
-    def _validate_key(self, key: str):
-        if key.find("/") != -1:
-            raise KeyError(f"Cannot have '/' in hdf5 group's item: {key}")
+    def _read_primitive_value(self, ds: Dataset) -> Any:
+        """Read a primitive value stored as a scalar dataset (the legacy layout)"""
+        val = ds[()]
+        if isinstance(val, np.floating):
+            val = float(val)
+        elif isinstance(val, np.integer):
+            val = int(val)
+        elif isinstance(val, np.bool_):
+            val = bool(val)
+        elif isinstance(val, bytes):
+            val = val.decode()
+        elif isinstance(val, Empty):
+            val = None
+        return val
+
+
+class Hdf5StreamWriter:
+    """Append individual examples to a run data file in bounded batches while the run progresses.
+
+    Outputs of examples are buffered in memory until there are `batch_size` examples, then they are
+    appended to the columns of the file. Only the ids of the written examples are kept afterward,
+    so outputs of an example can only be updated until its batch is written (a ValueError is
+    raised otherwise). Calling `close` writes the remaining examples and the aggregated outputs,
+    then seals the file by building its indexes.
+
+    In live mode, an empty file is written first, then the first batch is written to a new file
+    that is kept open in HDF5's single-writer/multiple-reader (SWMR) mode and replaces the empty
+    file, so the server can read the examples written so far while the run is in progress (a
+    marker file `<outfile>.live` tells readers to open the file in SWMR mode).
+    SWMR only allows appending to existing datasets, hence:
+
+        - the primitive columns are fixed by the first batch: later examples cannot have new keys
+          or values requiring a column to change its type (a ValueError is raised)
+        - complex objects are written to a side file `<outfile>.complex`, and are merged into the
+          file when it is sealed, so they are only readable after `close`
+
+    A batch is also written when it has been `flush_interval` seconds since the previous one (checked
+    when an example is updated), so readers do not wait for a full batch.
+    """
+
+    def __init__(
+        self,
+        format: Hdf5Format,
+        outfile: Union[Path, str],
+        batch_size: int = 1000,
+        live: bool = False,
+        flush_interval: Optional[float] = None,
+    ):
+        assert batch_size > 0, batch_size
+        self.format = format
+        self.outfile = Path(outfile)
+        self.batch_size = batch_size
+        self.pending: Dict[str, ExampleData] = {}
+        self.written_ids: Set[str] = set()
+        self.n_examples = 0
+        self.is_closed = False
+        self.live = live
+        self.flush_interval = flush_interval
+        self.last_flush_time = time.time()
+        # types of the primitive columns in live mode, fixed after the first batch
+        self.schema: Optional[Dict[str, ColumnType]] = None
+
+        if not live:
+            with File(self.outfile, "a") as f:
+                self.format._create_columnar_group(f)
+            return
+
+        # an empty file that can be read until the first batch is written, the file being written
+        # in SWMR mode replaces it (see `_start_swmr`)
+        with File(self.outfile, "a", libver="latest") as f:
+            self._create_live_groups(f)
+        self.file: Optional[File] = None
+
+        self.complex_file = File(self.get_complex_file(), "w")
+        complex_group = self.complex_file.create_group(
+            "/individual/complex", track_order=True
+        )
+        complex_group.attrs.update(
+            {"n_buckets": self.format.n_complex_buckets}
+            if self.format.n_complex_buckets > 0
+            else {}
+        )
+
+    def get_complex_file(self) -> Path:
+        """Path of the side file storing complex objects of examples in live mode"""
+        return Path(str(self.outfile) + ".complex")
+
+    def update_example(
+        self,
+        example_id: str,
+        example_name: str = "",
+        primitive: Optional[NestedPrimitiveOutput] = None,
+        complex: Optional[Dict[str, PyObject]] = None,
+    ):
+        """Update outputs of an example. When a new example arrives and the batch is full, the batch
+        is written to the file"""
+        assert not self.is_closed, "Cannot update outputs of a closed writer"
+        if example_id in self.written_ids:
+            raise ValueError(
+                f"Outputs of example `{example_id}` have already been written to disk. In streaming mode, an example can only be updated until its batch is written."
+            )
+        if self.schema is not None and primitive is not None:
+            self._check_schema(primitive)
+
+        if example_id in self.pending:
+            example = self.pending[example_id]
+            example.name = example_name
+            example.data.primitive.update(primitive or {})
+            example.data.complex.update(complex or {})
+        else:
+            if len(self.pending) >= self.batch_size or (
+                self.flush_interval is not None
+                and time.time() - self.last_flush_time >= self.flush_interval
+            ):
+                self.flush()
+            self.pending[example_id] = ExampleData(
+                id=example_id,
+                name=example_name,
+                data=Record(primitive=primitive or {}, complex=complex or {}),
+            )
+
+    def flush(self):
+        """Append the buffered examples to the file"""
+        self.last_flush_time = time.time()
+        if len(self.pending) == 0:
+            return
+
+        examples = list(self.pending.values())
+        if self.live:
+            if self.file is None:
+                self._start_swmr(examples)
+            else:
+                self.format._append_examples(
+                    self.file["individual"],
+                    examples,
+                    self.complex_file["individual/complex"],
+                )
+                self.file.flush()
+            self.complex_file.flush()
+        else:
+            with File(self.outfile, "a") as f:
+                self.format._append_examples(f["individual"], examples)
+        self.written_ids.update(self.pending.keys())
+        self.n_examples += len(self.pending)
+        self.pending = {}
+
+    def close(self, aggregated: Record):
+        """Write the remaining examples and the aggregated outputs, then seal the file"""
+        assert not self.is_closed, "The writer has already been closed"
+        self.flush()
+        if self.live:
+            if self.file is not None:
+                self.file.close()
+            self.complex_file.close()
+
+        with File(self.outfile, "a") as f:
+            if self.live:
+                del f["aggregated"]
+                self._merge_complex_file(f)
+            self.format._save_aggregated(f, aggregated)
+            self.format._build_sort_indexes(f["individual"])
+
+        if self.live:
+            get_live_marker(self.outfile).unlink(missing_ok=True)
+            self.get_complex_file().unlink()
+        self.is_closed = True
+
+    def _create_live_groups(self, f: File):
+        self.format._create_columnar_group(f)
+        # placeholders so the file can be read before it is sealed
+        f.create_group("/aggregated/primitive", track_order=True)
+        f.create_group("/aggregated/complex", track_order=True)
+
+    def _start_swmr(self, examples: List[ExampleData]):
+        """Write the first batch to a new file, fix the schema and switch the file to SWMR mode,
+        after which datasets and groups can no longer be created. The new file replaces the empty
+        file once it is in SWMR mode and marked as live, so readers never see a file that is open
+        for writing without SWMR."""
+        tmpfile = Path(str(self.outfile) + ".tmp")
+        self.file = File(tmpfile, "w", libver="latest")
+        self._create_live_groups(self.file)
+        ind_group = self.file["individual"]
+        self.format._append_examples(
+            ind_group, examples, self.complex_file["individual/complex"]
+        )
+        n_rows = len(ind_group["id"])
+        prim_group = ind_group["primitive"]
+        mask_group = ind_group["primitive_mask"]
+        int_group = ind_group.require_group("primitive_int")
+        self.schema = {}
+        for key in self.format._iter_column_keys(prim_group):
+            self.schema[key] = prim_group[key].attrs["type"]
+            if self.schema[key] == "float" and key not in int_group:
+                _create_int_flags(ind_group, key, np.zeros((n_rows,), dtype=np.bool_))
+            if key not in mask_group:
+                _require_parent_group(mask_group, key).create_dataset(
+                    key.rsplit("/", 1)[-1],
+                    data=np.full((n_rows,), CELL_PRESENT, dtype=np.int8),
+                    maxshape=(None,),
+                    chunks=(COLUMN_CHUNK_SIZE,),
+                )
+        self.file.swmr_mode = True
+        self.file.flush()
+        get_live_marker(self.outfile).touch()
+        os.replace(tmpfile, self.outfile)
+
+    def _check_schema(self, primitive: NestedPrimitiveOutput):
+        assert self.schema is not None
+        for key, value in self.format._flatten_primitive_columns(
+            primitive, set(self.schema.keys())
+        ):
+            if key not in self.schema:
+                raise ValueError(
+                    f"Cannot add a new primitive output `{key}` to a live run: primitive outputs are fixed by the first batch of examples"
+                )
+            coltype = infer_column_type([value])
+            if (
+                coltype is not None
+                and promote_column_type(self.schema[key], coltype) != self.schema[key]
+            ):
+                raise ValueError(
+                    f"Cannot store a value of type `{coltype}` in the primitive output `{key}` of type `{self.schema[key]}` of a live run"
+                )
+
+    def _merge_complex_file(self, f: File):
+        """Move the complex objects from the side file into the file and index them"""
+        ind_group = f["individual"]
+        with File(self.get_complex_file(), "r") as side:
+            del ind_group["complex"]
+            side.copy(side["individual/complex"], ind_group, name="complex")
+            if "blob_refs" in side:
+                for blob_key in side["blob_refs"].asstr()[()]:
+                    _append_blob_ref(f, blob_key)
+
+        complex_group = ind_group["complex"]
+        if int(complex_group.attrs.get("n_buckets", 0)) > 0:
+            groups = [
+                grp for bucket in complex_group.values() for grp in bucket.values()
+            ]
+        else:
+            groups = list(complex_group.values())
+        name2ref = {grp.name.rsplit("/", 1)[-1]: grp.ref for grp in groups}
+
+        ids = ind_group["id"].asstr()[()]
+        complex_refs = np.empty((len(ids),), dtype=ref_dtype)
+        for i, example_id in enumerate(ids):
+            if example_id in name2ref:
+                complex_refs[i] = name2ref[example_id]
+        ds = ind_group["complex_ref"]
+        ds.resize((len(ids),))
+        if len(ids) > 0:
+            ds[:] = complex_refs
+
+
+class Hdf5FilePool:
+    """A bounded, thread-safe LRU pool of read-only HDF5 file handles.
+
+    Reusing a handle avoids reopening the file and rebuilding its metadata cache on every request.
+    A handle is reopened when the file on disk has changed (different inode or modified time), and
+    `invalidate` must be called when a file is replaced. Evicted or invalidated handles are closed
+    once nobody uses them.
+    """
+
+    def __init__(self, capacity: int = 32):
+        assert capacity > 0, capacity
+        self.capacity = capacity
+        self.entries: OrderedDict[Path, _PooledFile] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @contextmanager
+    def open(self, path: Union[Path, str]) -> Iterator[File]:
+        """Borrow a read-only handle of the file"""
+        path = Path(path)
+        with self.lock:
+            signature = get_file_signature(path)
+            entry = self.entries.get(path, None)
+            if entry is not None and entry.signature != signature:
+                self._remove(path)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                entry = _PooledFile(_open_read_only(path), signature)
+                self.entries[path] = entry
+                while len(self.entries) > self.capacity:
+                    self._remove(next(iter(self.entries)))
+            else:
+                self.hits += 1
+                self.entries.move_to_end(path)
+            entry.n_users += 1
+
+        try:
+            yield entry.file
+        finally:
+            with self.lock:
+                entry.n_users -= 1
+                if entry.is_removed and entry.n_users == 0:
+                    entry.file.close()
+
+    def invalidate(self, path: Union[Path, str]):
+        """Drop the handle of the file (if exists), e.g., because the file is going to be replaced"""
+        with self.lock:
+            if Path(path) in self.entries:
+                self._remove(Path(path))
+
+    def clear(self):
+        with self.lock:
+            for path in list(self.entries.keys()):
+                self._remove(path)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "capacity": self.capacity,
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _remove(self, path: Path):
+        entry = self.entries.pop(path)
+        entry.is_removed = True
+        if entry.n_users == 0:
+            entry.file.close()
+
+
+@dataclass
+class _PooledFile:
+    file: File
+    signature: Tuple[int, int]
+    n_users: int = 0
+    is_removed: bool = False
+
+
+@contextmanager
+def _open_file(infile: Union[Path, str, File]) -> Iterator[File]:
+    """Open the file for reading, or use it directly if it has been opened (e.g., from a pool)"""
+    if isinstance(infile, File):
+        yield infile
+    else:
+        with _open_read_only(infile) as f:
+            yield f
+
+
+def _open_read_only(infile: Union[Path, str]) -> File:
+    """Open the file for reading, in SWMR mode if the file is being written by a live writer"""
+    return File(infile, "r", swmr=is_live_file(infile))
+
+
+def get_live_marker(datafile: Union[Path, str]) -> Path:
+    """Path of the marker file telling that the data file is being written in SWMR mode"""
+    return Path(str(datafile) + ".live")
+
+
+def is_live_file(datafile: Union[Path, str]) -> bool:
+    """Whether the data file is being written by a live writer (see `Hdf5StreamWriter`)"""
+    return get_live_marker(datafile).exists()
+
+
+def _has_id_index(ind_group: Group) -> bool:
+    """Whether the file has an index of example ids covering all rows, which is not the case for
+    files written by previous versions or being written by a live writer"""
+    return "id_index" in ind_group and len(ind_group["id_index/ids"]) == len(
+        ind_group["id"]
+    )
+
+
+def _has_complex_ref(ind_group: Group) -> bool:
+    """Whether the row-ordinal index of complex objects covers all rows, which is not the case
+    while the file is written by a live writer"""
+    return "complex_ref" in ind_group and len(ind_group["complex_ref"]) >= len(
+        ind_group["id"]
+    )
+
+
+def _require_parent_group(group: Group, key: str) -> Group:
+    """Get the parent group of a flattened key, creating missing groups in insertion order"""
+    for name in key.split("/")[:-1]:
+        if name not in group:
+            group = group.create_group(name, track_order=True)
+        else:
+            group = group[name]
+    return group
+
+
+def _create_int_flags(ind_group: Group, key: str, data: np.ndarray):
+    """Create the flags marking the int values of a float column"""
+    int_group = ind_group.require_group("primitive_int")
+    _require_parent_group(int_group, key).create_dataset(
+        key.rsplit("/", 1)[-1],
+        data=data,
+        maxshape=(None,),
+        chunks=(COLUMN_CHUNK_SIZE,),
+    )
+
+
+def _append_blob_ref(f: File, blob_key: str):
+    if "blob_refs" not in f:
+        f.create_dataset(
+            "blob_refs",
+            shape=(0,),
+            maxshape=(None,),
+            dtype=string_dtype(),
+            chunks=(COLUMN_CHUNK_SIZE,),
+        )
+    ds = f["blob_refs"]
+    ds.resize((len(ds) + 1,))
+    ds[-1] = blob_key
+
+
+def _create_array_dataset(
+    group: Group, key: str, value: np.ndarray, compression: Hdf5Compression
+) -> Dataset:
+    """Store an array as a chunked, compressed dataset, arrays of python strings are stored as
+    variable-length strings"""
+    dtype = string_dtype() if value.dtype.kind == "O" else None
+    if value.ndim == 0 or value.size == 0:
+        return group.create_dataset(key, data=value, dtype=dtype)
+    return group.create_dataset(
+        key,
+        data=value,
+        dtype=dtype,
+        chunks=True,
+        compression=compression.method,
+        compression_opts=compression.level,
+        shuffle=compression.shuffle,
+    )
+
+
+def _serialize_complex_object(obj: PyObject) -> Tuple[Any, float]:
+    """Serialize a complex object, returning the value and the time it took"""
+    start = time.perf_counter()
+    value = obj.serialize_hdf5()
+    return value, time.perf_counter() - start
+
+
+def _encode_npz(arrays: Mapping[str, np.ndarray]) -> bytes:
+    """Encode a mapping of arrays as a npz archive. Unlike `np.savez`, the archive does not contain
+    timestamps, so the same arrays are always encoded to the same bytes (for deduplication)."""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, array in arrays.items():
+            array = np.asarray(array)
+            if array.dtype.kind == "O":
+                # arrays of python strings cannot be saved without pickling
+                array = np.asarray(array.tolist(), dtype=np.str_)
+            with zf.open(zipfile.ZipInfo(f"{name}.npy"), "w", force_zip64=True) as f:
+                np.lib.format.write_array(f, array, allow_pickle=False)
+    return buf.getvalue()
+
+
+def _decode_npz(data: bytes) -> Dict[str, np.ndarray]:
+    with np.load(io.BytesIO(data), allow_pickle=False) as npz:
+        return {name: npz[name] for name in npz.files}
+
+
+def _decode_complex_object(
+    raw_object: Tuple[Type[PyObject], Any, Mapping[str, Any]]
+) -> PyObject:
+    """Decode a complex object read by `Hdf5Format._read_raw_complex_object`"""
+    pyobject_class, value, attrs = raw_object
+    return pyobject_class.from_hdf5_with_attrs(value, attrs)
+
+
+class _Hdf5Arrays(Mapping[str, Any]):
+    """Read-only view of a complex object stored as a group of arrays (see
+    `Hdf5Format._write_complex_object`). Datasets are not read until sliced, string datasets are
+    read as python strings."""
+
+    def __init__(self, group: Group):
+        self.group = group
+
+    def __getitem__(self, name: str) -> Any:
+        ds = self.group[name]
+        if ds.dtype.kind == "O":
+            return ds.asstr()
+        return ds
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.group.keys())
+
+    def __len__(self) -> int:
+        return len(self.group)
+
+
+def _encode_column_values(values: List[Any], coltype: ColumnType) -> np.ndarray:
+    """Convert values of a primitive column into a numpy array, None and absent cells are filled
+    by a default value as they are tracked by the mask"""
+    if coltype == "float":
+        return np.asarray(
+            [math.nan if v is None or v is ABSENT else v for v in values],
+            dtype=np.float64,
+        )
+    if coltype == "int":
+        return np.asarray(
+            [0 if v is None or v is ABSENT else v for v in values], dtype=np.int64
+        )
+    if coltype == "bool":
+        return np.asarray(
+            [False if v is None or v is ABSENT else v for v in values],
+            dtype=np.bool_,
+        )
+    if coltype == "str":
+        return np.asarray(
+            ["" if v is None or v is ABSENT else v for v in values],
+            dtype=string_dtype(),
+        )
+    return np.asarray(
+        [
+            "null" if v is None or v is ABSENT else orjson_dumps(v).decode()
+            for v in values
+        ],
+        dtype=string_dtype(),
+    )
+
+
+def _get_bucket_name(example_id: str, n_buckets: int) -> str:
+    """Name of the bucket of an example, the hash must be stable across processes"""
+    return str(zlib.crc32(example_id.encode()) % n_buckets)
+
+
+def _encode_example_json(example: ExampleData) -> bytes:
+    """Serialize an example as returned by the API (i.e., with the number of complex objects)"""
+    obj = example.to_dict()
+    obj["data"]["n_complex"] = len(example.data.complex)
+    return orjson_dumps(obj)
+
+
+def _read_rows(ds, rows: Union[slice, np.ndarray]) -> np.ndarray:
+    """Read values of a dataset at the given rows. The rows can be in any order."""
+    if isinstance(rows, slice):
+        return ds[rows]
+    if len(rows) == 0:
+        return ds[0:0]
+
+    order = np.argsort(rows, kind="stable")
+    sorted_rows = rows[order]
+    lo, hi = int(sorted_rows[0]), int(sorted_rows[-1]) + 1
+    if hi - lo <= 4 * len(rows):
+        # the rows are dense, reading the whole range is cheaper than fancy indexing
+        return ds[lo:hi][rows - lo]
+
+    uniq_rows, inverse = np.unique(sorted_rows, return_inverse=True)
+    values = ds[uniq_rows][inverse]
+    out = np.empty_like(values)
+    out[order] = values
+    return out
@@ -0,0 +1,711 @@
+from __future__ import annotations
+
+import io
+import math
+import struct
+import time
+import zipfile
+from pathlib import Path
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Literal,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
+
+import numpy as np
+import orjson
+from osin.formats.base import (
+    ABSENT,
+    CELL_ABSENT,
+    CELL_NONE,
+    CELL_PRESENT,
+    Column,
+    ColumnType,
+    Predicate,
+    RunDataFormat,
+    SaveTimings,
+    argsort_with_missing,
+    compute_column_stats,
+    encode_filter_column,
+    filter_sort_index,
+    find_parent_keys,
+    infer_column_type,
+    match_predicate,
+    page_sort_index,
+    parse_filter,
+    set_nested_value,
+)
+from osin.misc import orjson_dumps
+from osin.models import ExampleData, ExpRunData, Record
+from osin.models.exp_data import RecordWithComplexSize
+from osin.types import PyObject
+
+# encoding of complex objects in the blob file
+BLOB_BYTES = 0
+BLOB_NDARRAY = 1
+# a mapping of arrays (e.g., columns of a table) stored as a npz archive
+BLOB_NPZ = 2
+
+
+class NpyFormat(RunDataFormat):
+    """A columnar format made of NumPy `.npy` files that are memory-mapped when reading, so reads
+    are zero-copy and served from the page cache.
+
+    All files are stored next to the manifest `data.npyc` (a JSON file describing the columns):
+
+    - `data.id.npy`/`data.name.npy`: utf-8 bytes of ids/names, `data.{id,name}.offsets.npy` are
+      the offsets of each row in the bytes.
+    - `data.c<i>.npy`: values of the i-th flattened primitive key (strings are stored as bytes and
+      offsets similar to ids), `data.c<i>.mask.npy`: status of the cells (see `CELL_*`) if there are
+      None or missing values, `data.c<i>.int.npy`: which values of a float column are ints.
+    - `data.complex.blob`: serialized complex objects, indexed by `data.complex_offsets.npy`. The
+      objects of row i are `data.complex_indptr.npy[i]` to `data.complex_indptr.npy[i + 1]`, and
+      their keys, classes and encodings are in `data.complex_{key,classpath,encoding}.npy`.
+    - `data.s<j>.npy`: persistent sort indexes (see `Hdf5Format`).
+    """
+
+    name = "npy"
+    data_file_name = "data.npyc"
+    extensions = {".npyc", ".npy", ".blob"}
+
+    def save_run_data(
+        self,
+        data: ExpRunData,
+        outfile: Union[Path, str],
+        timings: Optional[SaveTimings] = None,
+    ):
+        """Save the experiment run data to the file, recording the time spent in each stage in
+        `timings` if provided (complex objects are always serialized serially)"""
+        start = time.perf_counter()
+        writer = _NpyFileWriter(Path(outfile))
+        examples = list(data.individual.values())
+        n_examples = len(examples)
+
+        writer.save_strings("id", [example.id for example in examples])
+        writer.save_strings("name", [example.name for example in examples])
+
+        # same columns as `Hdf5Format`: a key having a value in some examples and nested keys in
+        # others is a single json column
+        primitive_objects = [example.data.primitive for example in examples]
+        leaf_keys: Set[str] = set()
+        while True:
+            columns = self._group_primitive_columns(primitive_objects, leaf_keys)
+            conflicts = find_parent_keys(set(columns.keys()))
+            if len(conflicts) == 0:
+                break
+            leaf_keys.update(conflicts)
+
+        manifest_columns = []
+        for i, (key, values) in enumerate(columns.items()):
+            coltype = infer_column_type(values) or "float"
+            column = {"key": key, "type": coltype, "file": f"c{i}", "mask": None}
+            if coltype == "str":
+                writer.save_strings(
+                    column["file"],
+                    ["" if v is None or v is ABSENT else v for v in values],
+                )
+            elif coltype == "json":
+                # absent cells are tracked by the mask
+                writer.save_strings(
+                    column["file"],
+                    [
+                        "null" if v is ABSENT else orjson_dumps(v).decode()
+                        for v in values
+                    ],
+                )
+            else:
+                default = math.nan if coltype == "float" else 0
+                writer.save_array(
+                    column["file"],
+                    np.asarray(
+                        [default if v is None or v is ABSENT else v for v in values],
+                        dtype={"bool": np.bool_, "int": np.int64, "float": np.float64}[
+                            coltype
+                        ],
+                    ),
+                )
+
+            status = np.asarray(
+                [
+                    CELL_ABSENT
+                    if v is ABSENT
+                    else (CELL_NONE if v is None else CELL_PRESENT)
+                    for v in values
+                ],
+                dtype=np.int8,
+            )
+            if not np.all(status == CELL_PRESENT):
+                column["mask"] = f"c{i}.mask"
+                writer.save_array(column["mask"], status)
+            if coltype == "float":
+                is_int = np.asarray(
+                    [isinstance(v, int) for v in values], dtype=np.bool_
+                )
+                if np.any(is_int):
+                    column["int"] = f"c{i}.int"
+                    writer.save_array(column["int"], is_int)
+            manifest_columns.append(column)
+
+        # complex objects of individual examples then aggregated complex objects
+        complex_objects = []
+        indptr = [0]
+        for example in examples:
+            for key, obj in example.data.complex.items():
+                self._validate_key(key)
+                complex_objects.append((key, obj))
+            indptr.append(len(complex_objects))
+        aggregated_complex = []
+        for key, obj in data.aggregated.complex.items():
+            self._validate_key(key)
+            aggregated_complex.append((key, obj.get_classpath(), len(complex_objects)))
+            complex_objects.append((key, obj))
+        complex_keys, complex_classpaths, complex_attrs = writer.save_complex_objects(
+            complex_objects, timings
+        )
+        writer.save_array("complex_indptr", np.asarray(indptr, dtype=np.int64))
+
+        manifest = {
+            "version": 1,
+            "n_examples": n_examples,
+            "aggregated": {
+                "primitive": data.aggregated.primitive,
+                "complex": aggregated_complex,
+            },
+            "columns": manifest_columns,
+            "complex_keys": complex_keys,
+            "complex_classpaths": complex_classpaths,
+            "complex_attrs": complex_attrs,
+            "sort_indexes": {},
+        }
+
+        # build persistent sort indexes from the saved files
+        reader = _NpyFileReader(Path(outfile), manifest)
+        sort_keys = ["id", "name"] + [
+            "primitive/" + column["key"]
+            for column in manifest_columns
+            if column["type"] in ("bool", "int", "float")
+        ]
+        for j, sort_key in enumerate(sort_keys):
+            sort_index, n_valid = reader.compute_sort_index(sort_key)
+            writer.save_array(f"s{j}", sort_index.astype(np.int64))
+            manifest["sort_indexes"][sort_key] = {"file": f"s{j}", "n_valid": n_valid}
+
+        Path(outfile).write_bytes(orjson_dumps(manifest, option=orjson.OPT_INDENT_2))
+
+        if timings is not None:
+            timings.total = time.perf_counter() - start
+            timings.write = timings.total - timings.serialize
+
+    def load_exp_run_data(
+        self,
+        infile: Union[Path, str],
+        fields: Optional[Dict[str, Set[str]]] = None,
+        limit: int = -1,
+        offset: int = 0,
+        sorted_by: Optional[str] = None,
+        sorted_order: Literal["ascending", "descending"] = "ascending",
+        with_complex_size: bool = False,
+        filter: Optional[str] = None,
+    ) -> Tuple[ExpRunData, int]:
+        if fields is None:
+            fields = {
+                "aggregated": {"primitive", "complex"},
+                "individual": {"primitive", "complex"},
+            }
+
+        reader = _NpyFileReader(Path(infile))
+        expdata = ExpRunData()
+        if "aggregated" in fields:
+            if "primitive" in fields["aggregated"]:
+                expdata.aggregated.primitive = reader.manifest["aggregated"][
+                    "primitive"
+                ]
+            if "complex" in fields["aggregated"]:
+                for key, classpath, index in reader.manifest["aggregated"]["complex"]:
+                    expdata.aggregated.complex[key] = reader.read_complex_object(
+                        classpath, index
+                    )
+
+        n_examples = reader.manifest["n_examples"]
+        if filter is not None:
+            selected = reader.filter_rows(parse_filter(filter))
+            n_examples = int(np.count_nonzero(selected))
+        else:
+            selected = None
+
+        if "individual" in fields:
+            if limit <= 0:
+                limit = reader.manifest["n_examples"]
+            if sorted_by is None:
+                if selected is not None:
+                    rows = np.flatnonzero(selected)[offset : offset + limit]
+                else:
+                    rows = np.arange(
+                        min(offset, n_examples), min(offset + limit, n_examples)
+                    )
+            else:
+                sort_key = reader.parse_sort_key(sorted_by)
+                if sort_key in reader.manifest["sort_indexes"]:
+                    sort_index = reader.manifest["sort_indexes"][sort_key]
+                    sort_index, n_valid = (
+                        reader.array(sort_index["file"]),
+                        sort_index["n_valid"],
+                    )
+                else:
+                    sort_index, n_valid = reader.compute_sort_index(sort_key)
+                if selected is not None:
+                    sort_index, n_valid = filter_sort_index(
+                        sort_index, n_valid, selected
+                    )
+                rows = page_sort_index(sort_index, n_valid, offset, limit, sorted_order)
+
+            for example in reader.read_examples(
+                rows, fields["individual"], with_complex_size
+            ):
+                assert example.id not in expdata.individual
+                expdata.individual[example.id] = example
+        return expdata, n_examples
+
+    def get_examples_data(
+        self,
+        infile: Union[Path, str],
+        example_ids: List[str],
+        primitive: bool,
+        complex: bool,
+        with_complex_size: bool = False,
+    ) -> List[ExampleData]:
+        fields = set()
+        if primitive:
+            fields.add("primitive")
+        if complex:
+            fields.add("complex")
+
+        reader = _NpyFileReader(Path(infile))
+        id2row = {}
+        for row, example_id in enumerate(reader.read_strings("id")):
+            id2row.setdefault(example_id, row)
+        rows = np.empty((len(example_ids),), dtype=np.int64)
+        for i, example_id in enumerate(example_ids):
+            if example_id not in id2row:
+                raise KeyError(f"example id `{example_id}` not found")
+            rows[i] = id2row[example_id]
+        return reader.read_examples(rows, fields, with_complex_size)
+
+    def get_stats(
+        self, infile: Union[Path, str], keys: Optional[List[str]] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        reader = _NpyFileReader(Path(infile))
+        if keys is None:
+            keys = [
+                column["key"]
+                for column in reader.manifest["columns"]
+                if column["type"] in ("bool", "int", "float")
+            ]
+        stats = {}
+        for key in keys:
+            if key not in reader.columns or reader.columns[key]["type"] not in (
+                "bool",
+                "int",
+                "float",
+            ):
+                raise KeyError(f"numeric key `data.{key}` not found")
+            stats[key] = compute_column_stats(*reader.read_numeric_column(key))
+        return stats
+
+    @contextmanager
+    def open_complex_array(
+        self, infile: Union[Path, str], example_id: Optional[str], key: str
+    ) -> Iterator[Tuple[Type[PyObject], np.ndarray, Mapping[str, Any]]]:
+        reader = _NpyFileReader(Path(infile))
+        index = reader.find_complex_object(example_id, key)
+        if reader.array("complex_encoding")[index] != BLOB_NDARRAY:
+            raise ValueError(f"complex object `{key}` is not stored as an array")
+        classpath = reader.manifest["complex_classpaths"][
+            reader.array("complex_classpath")[index]
+        ]
+        yield (
+            PyObject.from_classpath(classpath),
+            reader.read_complex_value(index),
+            reader.get_complex_attrs(index),
+        )
+
+    @contextmanager
+    def open_complex_columns(
+        self, infile: Union[Path, str], example_id: Optional[str], key: str
+    ) -> Iterator[Tuple[Type[PyObject], Mapping[str, Any], Mapping[str, Any]]]:
+        reader = _NpyFileReader(Path(infile))
+        index = reader.find_complex_object(example_id, key)
+        if reader.array("complex_encoding")[index] != BLOB_NPZ:
+            raise ValueError(f"complex object `{key}` is not stored in columns")
+        classpath = reader.manifest["complex_classpaths"][
+            reader.array("complex_classpath")[index]
+        ]
+        yield (
+            PyObject.from_classpath(classpath),
+            reader.read_complex_value(index),
+            reader.get_complex_attrs(index),
+        )
+
+    def get_column(self, infile: Union[Path, str], key: str) -> Column:
+        reader = _NpyFileReader(Path(infile))
+        if key not in reader.columns:
+            raise KeyError(f"key `data.{key}` not found")
+        ids = np.asarray(reader.read_strings("id"), dtype=np.str_)
+        return Column(ids, *reader.read_column_array(key))
+
+
+class _NpyFileWriter:
+    def __init__(self, manifest_file: Path):
+        self.dir = manifest_file.parent
+        self.prefix = manifest_file.name[: -len(manifest_file.suffix)]
+
+    def save_array(self, name: str, array: np.ndarray):
+        np.save(self.dir / f"{self.prefix}.{name}.npy", array, allow_pickle=False)
+
+    def save_strings(self, name: str, values: List[str]):
+        encoded_values = [value.encode() for value in values]
+        offsets = np.zeros((len(values) + 1,), dtype=np.int64)
+        np.cumsum([len(value) for value in encoded_values], out=offsets[1:])
+        self.save_array(name, np.frombuffer(b"".join(encoded_values), dtype=np.uint8))
+        self.save_array(f"{name}.offsets", offsets)
+
+    def save_complex_objects(
+        self,
+        objects: List[Tuple[str, PyObject]],
+        timings: Optional[SaveTimings] = None,
+    ) -> Tuple[List[str], List[str], Dict[str, dict]]:
+        """Save the complex objects into the blob file, returning the vocabularies of keys and
+        classpaths, and the extra attributes of the objects (by their index)"""
+        keys, classpaths, attrs = {}, {}, {}
+        key_codes = np.zeros((len(objects),), dtype=np.int32)
+        classpath_codes = np.zeros((len(objects),), dtype=np.int32)
+        encodings = np.zeros((len(objects),), dtype=np.int8)
+        offsets = np.zeros((len(objects) + 1,), dtype=np.int64)
+
+        with open(self.dir / f"{self.prefix}.complex.blob", "wb") as f:
+            for i, (key, obj) in enumerate(objects):
+                key_codes[i] = keys.setdefault(key, len(keys))
+                classpath_codes[i] = classpaths.setdefault(
+                    obj.get_classpath(), len(classpaths)
+                )
+                start = time.perf_counter()
+                value = obj.serialize_hdf5()
+                if timings is not None:
+                    timings.serialize += time.perf_counter() - start
+                if len(obj.get_hdf5_attrs()) > 0:
+                    attrs[str(i)] = obj.get_hdf5_attrs()
+                if isinstance(value, np.ndarray):
+                    encodings[i] = BLOB_NDARRAY
+                    buf = io.BytesIO()
+                    np.save(buf, value, allow_pickle=False)
+                    value = buf.getvalue()
+                elif isinstance(value, Mapping):
+                    encodings[i] = BLOB_NPZ
+                    buf = io.BytesIO()
+                    # arrays of python strings cannot be saved without pickling
+                    np.savez(
+                        buf,
+                        **{
+                            name: np.asarray(array.tolist(), dtype=np.str_)
+                            if array.dtype.kind == "O"
+                            else array
+                            for name, array in value.items()
+                        },
+                    )
+                    value = buf.getvalue()
+                else:
+                    encodings[i] = BLOB_BYTES
+                f.write(value)
+                offsets[i + 1] = offsets[i] + len(value)
+
+        self.save_array("complex_offsets", offsets)
+        self.save_array("complex_key", key_codes)
+        self.save_array("complex_classpath", classpath_codes)
+        self.save_array("complex_encoding", encodings)
+        return list(keys.keys()), list(classpaths.keys()), attrs
+
+
+class _NpyFileReader:
+    def __init__(self, manifest_file: Path, manifest: Optional[dict] = None):
+        self.dir = manifest_file.parent
+        self.prefix = manifest_file.name[: -len(manifest_file.suffix)]
+        if manifest is None:
+            manifest = orjson.loads(manifest_file.read_bytes())
+        self.manifest = manifest
+        self.columns = {column["key"]: column for column in manifest["columns"]}
+        self.arrays: Dict[str, np.ndarray] = {}
+
+    def array(self, name: str) -> np.ndarray:
+        """Memory-map an array"""
+        if name not in self.arrays:
+            self.arrays[name] = np.load(
+                self.dir / f"{self.prefix}.{name}.npy", mmap_mode="r"
+            )
+        return self.arrays[name]
+
+    def blob(self) -> np.ndarray:
+        if "complex.blob" not in self.arrays:
+            file = self.dir / f"{self.prefix}.complex.blob"
+            if file.stat().st_size == 0:
+                self.arrays["complex.blob"] = np.zeros((0,), dtype=np.uint8)
+            else:
+                self.arrays["complex.blob"] = np.memmap(file, dtype=np.uint8, mode="r")
+        return self.arrays["complex.blob"]
+
+    def read_strings(self, name: str, rows: Optional[np.ndarray] = None) -> List[str]:
+        data = self.array(name)
+        offsets = self.array(f"{name}.offsets")
+        if rows is None:
+            rows = np.arange(len(offsets) - 1)
+        starts = offsets[rows]
+        ends = offsets[rows + 1]
+        return [data[start:end].tobytes().decode() for start, end in zip(starts, ends)]
+
+    def read_column(self, key: str, rows: np.ndarray) -> List[Any]:
+        """Read values of a primitive column at the given rows, absent cells are marked with `ABSENT`"""
+        column = self.columns[key]
+        if column["type"] == "str":
+            values = self.read_strings(column["file"], rows)
+        elif column["type"] == "json":
+            values = [
+                orjson.loads(value) for value in self.read_strings(column["file"], rows)
+            ]
+        else:
+            values = self.array(column["file"])[rows].tolist()
+        if column.get("int", None) is not None:
+            for i in np.flatnonzero(self.array(column["int"])[rows]):
+                values[i] = int(values[i])
+
+        if column["mask"] is not None:
+            status = self.array(column["mask"])[rows]
+            for i in np.nonzero(status != CELL_PRESENT)[0]:
+                values[i] = ABSENT if status[i] == CELL_ABSENT else None
+        return values
+
+    def parse_sort_key(self, sorted_by: str) -> str:
+        if sorted_by.find("/") == -1:
+            assert sorted_by in ["id", "name"], sorted_by
+            return sorted_by
+
+        sorted_by_first, sorted_by_remain = sorted_by.split("/", 1)
+        assert sorted_by_first == "data", sorted_by_first
+        if (
+            not sorted_by_remain.startswith("primitive/")
+            or sorted_by_remain[len("primitive/") :] not in self.columns
+        ):
+            raise KeyError(f"sort by key `data.{sorted_by_remain}` not found")
+        return sorted_by_remain
+
+    def compute_sort_index(self, sort_key: str) -> Tuple[np.ndarray, int]:
+        """See `Hdf5Format._compute_sort_index`"""
+        n_examples = self.manifest["n_examples"]
+        if sort_key in ("id", "name"):
+            values = np.asarray(self.read_strings(sort_key), dtype=np.str_)
+            return np.argsort(values, kind="stable"), len(values)
+
+        column = self.columns[sort_key[len("primitive/") :]]
+        if column["type"] in ("bool", "int", "float"):
+            values, is_valid = self.read_numeric_column(column["key"])
+        else:
+            values = self.read_column(column["key"], np.arange(n_examples))
+            is_valid = np.asarray(
+                [v is not None and v is not ABSENT for v in values], dtype=np.bool_
+            )
+            values = np.asarray(
+                [v for v in values if v is not None and v is not ABSENT]
+            )
+        return argsort_with_missing(values, is_valid)
+
+    def read_numeric_column(self, key: str) -> Tuple[np.ndarray, np.ndarray]:
+        """See `Hdf5Format._read_numeric_column`"""
+        column = self.columns[key]
+        values = self.array(column["file"])
+        if column["mask"] is not None:
+            is_valid = self.array(column["mask"]) == CELL_PRESENT
+        else:
+            is_valid = np.ones((len(values),), dtype=np.bool_)
+        if column["type"] == "float":
+            is_valid &= ~np.isnan(values)
+        return values, is_valid
+
+    def filter_rows(self, predicates: List[Predicate]) -> np.ndarray:
+        """See `Hdf5Format._filter_rows`"""
+        selected = np.ones((self.manifest["n_examples"],), dtype=np.bool_)
+        for predicate in predicates:
+            if predicate.key in ("id", "name"):
+                values = np.asarray(self.read_strings(predicate.key), dtype=np.str_)
+                selected &= match_predicate(predicate, "str", values)
+                continue
+
+            key = predicate.key[len("primitive/") :]
+            if key not in self.columns:
+                raise KeyError(f"filter key `data.{key}` not found")
+            selected &= match_predicate(predicate, *self.read_column_array(key))
+        return selected
+
+    def read_column_array(self, key: str) -> Tuple[ColumnType, np.ndarray, np.ndarray]:
+        """See `Hdf5Format._read_column_array`"""
+        column = self.columns[key]
+        n_examples = self.manifest["n_examples"]
+        if column["type"] not in ("bool", "int", "float"):
+            values, status = encode_filter_column(
+                self.read_column(key, np.arange(n_examples)), column["type"]
+            )
+            return column["type"], values, status
+
+        values = self.array(column["file"])
+        if column["mask"] is not None:
+            status = self.array(column["mask"])
+        else:
+            status = np.full((n_examples,), CELL_PRESENT, dtype=np.int8)
+        return column["type"], values, status
+
+    def read_complex_object(self, classpath: str, index: int) -> PyObject:
+        return PyObject.from_classpath(classpath).from_hdf5_with_attrs(
+            self.read_complex_value(index), self.get_complex_attrs(index)
+        )
+
+    def read_complex_value(
+        self, index: int
+    ) -> Union[bytes, np.ndarray, Mapping[str, np.ndarray]]:
+        offsets = self.array("complex_offsets")
+        value = self.blob()[offsets[index] : offsets[index + 1]]
+        encoding = self.array("complex_encoding")[index]
+        if encoding == BLOB_NDARRAY:
+            return _view_npy(value)
+        if encoding == BLOB_NPZ:
+            return _view_npz(value)
+        return value.tobytes()
+
+    def get_complex_attrs(self, index: int) -> dict:
+        return self.manifest.get("complex_attrs", {}).get(str(index), {})
+
+    def find_complex_object(self, example_id: Optional[str], key: str) -> int:
+        """Find index of a complex object of an example (None for aggregated objects)"""
+        if example_id is None:
+            for agg_key, _, index in self.manifest["aggregated"]["complex"]:
+                if agg_key == key:
+                    return index
+            raise KeyError(f"complex object `{key}` not found")
+
+        ids = self.read_strings("id")
+        if example_id not in ids:
+            raise KeyError(f"example id `{example_id}` not found")
+        row = ids.index(example_id)
+        indptr = self.array("complex_indptr")
+        keys = self.manifest["complex_keys"]
+        key_codes = self.array("complex_key")
+        for index in range(indptr[row], indptr[row + 1]):
+            if keys[key_codes[index]] == key:
+                return index
+        raise KeyError(f"complex object `{key}` not found")
+
+    def read_examples(
+        self, rows: np.ndarray, fields: Set[str], with_complex_size: bool
+    ) -> List[ExampleData]:
+        ids = self.read_strings("id", rows)
+        names = self.read_strings("name", rows)
+        indptr = self.array("complex_indptr")
+        starts = indptr[rows].tolist()
+        ends = indptr[rows + 1].tolist()
+
+        examples = []
+        for i, example_id in enumerate(ids):
+            if with_complex_size:
+                data = RecordWithComplexSize(n_complex=ends[i] - starts[i])
+            else:
+                data = Record()
+            examples.append(ExampleData(id=example_id, name=names[i], data=data))
+
+        if "primitive" in fields:
+            for key in self.columns:
+                for example, value in zip(examples, self.read_column(key, rows)):
+                    if value is not ABSENT:
+                        set_nested_value(example.data.primitive, key, value)
+
+        if "complex" in fields:
+            keys = self.manifest["complex_keys"]
+            classpaths = self.manifest["complex_classpaths"]
+            key_codes = self.array("complex_key")
+            classpath_codes = self.array("complex_classpath")
+            for i, example in enumerate(examples):
+                for index in range(starts[i], ends[i]):
+                    example.data.complex[
+                        keys[key_codes[index]]
+                    ] = self.read_complex_object(
+                        classpaths[classpath_codes[index]], index
+                    )
+        return examples
+
+
+def _view_npy(buf: np.ndarray) -> np.ndarray:
+    """View an array saved by `np.save` in a buffer (e.g., a slice of the memory-mapped blob file)
+    without copying its data"""
+    # magic string (6 bytes), version (2 bytes), then the length of the header
+    len_size = 2 if buf[6] == 1 else 4
+    offset = 8 + len_size + int.from_bytes(buf[8 : 8 + len_size].tobytes(), "little")
+    header = io.BytesIO(buf[:offset].tobytes())
+    if np.lib.format.read_magic(header) == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(header)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(header)
+    array = np.frombuffer(buf, dtype=dtype, count=math.prod(shape), offset=offset)
+    return array.reshape(shape, order="F" if fortran_order else "C")
+
+
+def _view_npz(buf: np.ndarray) -> Dict[str, np.ndarray]:
+    """View the arrays of a npz archive in a buffer without copying their data (`np.savez` does
+    not compress the arrays). Only the headers of the archive are read."""
+    arrays = {}
+    with zipfile.ZipFile(_BufferFile(buf)) as zf:
+        for info in zf.infolist():
+            name = info.filename[: -len(".npy")]
+            if info.compress_type != zipfile.ZIP_STORED:
+                arrays[name] = np.load(io.BytesIO(zf.read(info)), allow_pickle=False)
+                continue
+            # the data follows the local file header: 30 bytes, the file name and an extra field
+            header = buf[info.header_offset : info.header_offset + 30].tobytes()
+            name_len, extra_len = struct.unpack("<HH", header[26:30])
+            start = info.header_offset + 30 + name_len + extra_len
+            arrays[name] = _view_npy(buf[start : start + info.file_size])
+    return arrays
+
+
+class _BufferFile(io.RawIOBase):
+    """Read-only file over a buffer, reads only copy the requested bytes"""
+
+    def __init__(self, buf: np.ndarray):
+        self.buf = buf
+        self.pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += len(self.buf)
+        self.pos = offset
+        return offset
+
+    def readinto(self, b) -> int:
+        data = self.buf[self.pos : self.pos + len(b)]
+        memoryview(b)[: len(data)] = data.tobytes()
+        self.pos += len(data)
+        return len(data)
@@ -0,0 +1,56 @@
+import io
+import zlib
+from typing import Callable, Iterable
+
+from werkzeug.wrappers import Response
+
+
+class GzipRequestMiddleware:
+    """WSGI middleware decompressing request bodies sent with `Content-Encoding: gzip`, so the
+    application only sees plain bodies. The decompressed body is limited to `max_size` bytes
+    (413 otherwise) to guard against compression bombs."""
+
+    def __init__(self, app: Callable, max_size: int):
+        self.app = app
+        self.max_size = max_size
+
+    def __call__(self, environ: dict, start_response: Callable) -> Iterable[bytes]:
+        if environ.get("HTTP_CONTENT_ENCODING", "").lower() != "gzip":
+            return self.app(environ, start_response)
+
+        try:
+            body = self._decompress(environ)
+        except zlib.error:
+            return Response("Invalid gzip body", status=400)(environ, start_response)
+        if body is None:
+            return Response("Request body is too large", status=413)(
+                environ, start_response
+            )
+
+        environ = dict(environ)
+        del environ["HTTP_CONTENT_ENCODING"]
+        environ["CONTENT_LENGTH"] = str(len(body))
+        environ["wsgi.input"] = io.BytesIO(body)
+        return self.app(environ, start_response)
+
+    def _decompress(self, environ: dict):
+        """Decompress the body chunk by chunk, returning None as soon as it exceeds the limit"""
+        stream = environ["wsgi.input"]
+        remaining = int(environ.get("CONTENT_LENGTH") or 0)
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunks = []
+        size = 0
+        while remaining > 0:
+            data = stream.read(min(remaining, 64 * 1024))
+            if len(data) == 0:
+                break
+            remaining -= len(data)
+            chunk = decompressor.decompress(data, self.max_size + 1 - size)
+            size += len(chunk)
+            chunks.append(chunk)
+            if size > self.max_size or len(decompressor.unconsumed_tail) > 0:
+                return None
+        chunks.append(decompressor.flush())
+        if size + len(chunks[-1]) > self.max_size:
+            return None
+        return b"".join(chunks)
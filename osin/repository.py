@@ -1,19 +1,53 @@
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional, Union
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, Union
 
+import orjson
 from osin.models.exp import Exp, ExpRun
-from osin.formats import Hdf5Format
+from osin.formats import (
+    BlobStore,
+    Hdf5FilePool,
+    Hdf5Format,
+    RunDataFormat,
+    detect_format,
+    get_allowed_extensions,
+)
+from osin.formats.base import get_file_signature
 from osin.apis.remote_exp import RemoteExp, RemoteExpRun
 from slugify import slugify
 
 
 class OsinRepository:
     instance = None
-    ALLOWED_EXTENSIONS = {".json", ".h5"}
 
-    def __init__(self, osin_dir: Union[Path, str]):
+    def __init__(
+        self,
+        osin_dir: Union[Path, str],
+        n_opened_data_files: int = 32,
+        n_cached_data_stats: int = 256,
+        n_decode_workers: int = 0,
+    ):
         self.osin_dir = Path(osin_dir)
         self.osin_dir.mkdir(exist_ok=True, parents=True)
+        # read-only handles of run data files reused across requests
+        self.data_file_pool = Hdf5FilePool(n_opened_data_files)
+        # statistics of run data, valid until the data file changes
+        self.data_stats_cache: OrderedDict[
+            Tuple[Path, Optional[Tuple[str, ...]]], Tuple[Tuple[int, int], dict]
+        ] = OrderedDict()
+        self.data_stats_cache_size = n_cached_data_stats
+        self.data_stats_lock = threading.Lock()
+        self._blob_store: Optional[BlobStore] = None
+        # threads decoding complex objects of a page of examples in parallel (0 to decode serially)
+        self.decode_executor = (
+            ThreadPoolExecutor(n_decode_workers) if n_decode_workers > 0 else None
+        )
 
     @staticmethod
     def get_instance(osin_dir: Optional[Union[Path, str]] = None) -> "OsinRepository":
@@ -24,6 +58,18 @@ class OsinRepository:
             assert OsinRepository.instance.osin_dir == Path(osin_dir)
         return OsinRepository.instance
 
+    @staticmethod
+    def get_allowed_extensions() -> Set[str]:
+        """Extensions of the files of a run that are uploaded to the server"""
+        return get_allowed_extensions()
+
+    @property
+    def blob_store(self) -> BlobStore:
+        """Content-addressed store of complex objects shared by all runs, see `Hdf5Format.dedup`"""
+        if self._blob_store is None:
+            self._blob_store = BlobStore(self.osin_dir / "blobs")
+        return self._blob_store
+
     def get_db_file(self) -> Path:
         return self.osin_dir / "osin.db"
 
@@ -53,12 +99,123 @@ class OsinRepository:
     def get_exp_run_data_file(
         self, exp: Union[Exp, RemoteExp], exp_run: Union[ExpRun, RemoteExpRun]
     ) -> Path:
-        return self.get_exp_run_dir(exp, exp_run) / "data.h5"
+        return (
+            self.get_exp_run_dir(exp, exp_run)
+            / self.get_exp_run_data_format(exp, exp_run).data_file_name
+        )
 
     def get_exp_run_data_format(
         self, exp: Union[Exp, RemoteExp], exp_run: Union[ExpRun, RemoteExpRun]
-    ) -> Hdf5Format:
-        return Hdf5Format()
+    ) -> RunDataFormat:
+        if isinstance(exp_run, RemoteExpRun) and exp_run.data_format is not None:
+            format = exp_run.data_format
+        else:
+            format = detect_format(self.get_exp_run_dir(exp, exp_run))
+        if isinstance(format, Hdf5Format):
+            if format.blob_store is None:
+                format.blob_store = self.blob_store
+            if format.decode_executor is None:
+                format.decode_executor = self.decode_executor
+        return format
+
+    @contextmanager
+    def open_exp_run_data(
+        self, exp: Union[Exp, RemoteExp], exp_run: Union[ExpRun, RemoteExpRun]
+    ) -> Iterator[Tuple[RunDataFormat, Any]]:
+        """Open the data of a run for reading, yielding its format and the input to pass to the
+        format's methods (a pooled handle for HDF5 files, the file path otherwise)"""
+        format = self.get_exp_run_data_format(exp, exp_run)
+        datafile = self.get_exp_run_dir(exp, exp_run) / format.data_file_name
+        if isinstance(format, Hdf5Format):
+            with self.data_file_pool.open(datafile) as f:
+                yield format, f
+        else:
+            yield format, datafile
+
+    def get_exp_run_data_stats(
+        self,
+        exp: Union[Exp, RemoteExp],
+        exp_run: Union[ExpRun, RemoteExpRun],
+        keys: Optional[List[str]] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        """Get statistics of numeric primitive outputs of individual examples of a run (see
+        `RunDataFormat.get_stats`). The results are cached until the data file changes."""
+        datafile = self.get_exp_run_data_file(exp, exp_run)
+        signature = get_file_signature(datafile)
+        cache_key = (datafile, tuple(keys) if keys is not None else None)
+        with self.data_stats_lock:
+            entry = self.data_stats_cache.get(cache_key, None)
+            if entry is not None and entry[0] == signature:
+                self.data_stats_cache.move_to_end(cache_key)
+                return entry[1]
+
+        with self.open_exp_run_data(exp, exp_run) as (format, f):
+            stats = format.get_stats(f, keys)
+
+        with self.data_stats_lock:
+            self.data_stats_cache[cache_key] = (signature, stats)
+            self.data_stats_cache.move_to_end(cache_key)
+            while len(self.data_stats_cache) > self.data_stats_cache_size:
+                self.data_stats_cache.popitem(last=False)
+        return stats
+
+    def get_exp_run_preview(
+        self,
+        exp: Union[Exp, RemoteExp],
+        exp_run: Union[ExpRun, RemoteExpRun],
+        example_id: Optional[str],
+        key: str,
+        size: int,
+    ) -> Tuple[bytes, str]:
+        """Get a small preview (e.g., a thumbnail) of an array-backed complex object of an example
+        (or of the aggregated outputs if `example_id` is None), returning its content and mimetype.
+
+        Previews are cached in the `.preview` directory of the run until the data file changes.
+        """
+        datafile = self.get_exp_run_data_file(exp, exp_run)
+        signature = get_file_signature(datafile)
+        cache_key = hashlib.sha1(
+            orjson.dumps([signature, example_id, key, size])
+        ).hexdigest()
+        cache_file = datafile.parent / ".preview" / cache_key
+        if cache_file.exists():
+            mimetype, content = cache_file.read_bytes().split(b"\n", 1)
+            return content, mimetype.decode()
+
+        with self.open_exp_run_data(exp, exp_run) as (format, f):
+            with format.open_complex_array(f, example_id, key) as (cls, array, attrs):
+                content, mimetype = cls.make_preview(array, attrs, size)
+
+        cache_file.parent.mkdir(exist_ok=True)
+        tmpfile = cache_file.parent / f".{cache_key}.tmp"
+        tmpfile.write_bytes(mimetype.encode() + b"\n" + content)
+        os.replace(tmpfile, cache_file)
+        return content, mimetype
+
+    def replace_exp_run_file(self, file: Path, tmpfile: Path):
+        """Atomically replace a file of a run with a new version (`tmpfile`) so that readers holding
+        the old file are not affected. References of HDF5 files to the blob store are moved from
+        the old version to the new version.
+
+        Raises:
+            KeyError: if the new version references blobs that are not in the blob store
+        """
+        if file.suffix in Hdf5Format.extensions:
+            new_refs = Hdf5Format().get_blob_refs(tmpfile)
+            old_refs = Hdf5Format().get_blob_refs(file) if file.exists() else []
+        else:
+            new_refs, old_refs = [], []
+
+        if len(new_refs) > 0:
+            missing_refs = self.blob_store.missing(new_refs)
+            if len(missing_refs) > 0:
+                raise KeyError(f"{len(missing_refs)} referenced blobs are not uploaded")
+            self.blob_store.incref(new_refs)
+        self.data_file_pool.invalidate(file)
+        os.replace(tmpfile, file)
+        shutil.rmtree(file.parent / ".preview", ignore_errors=True)
+        if len(old_refs) > 0:
+            self.blob_store.decref(old_refs)
 
     def get_exp_run_success_file(
         self, exp: Union[Exp, RemoteExp], exp_run: Union[ExpRun, RemoteExpRun]
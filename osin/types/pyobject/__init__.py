@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from collections.abc import Mapping
 from dataclasses import dataclass
-from typing import Any, Optional, Sequence, Union
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
 import orjson
@@ -10,36 +10,101 @@ from htbuilder import li, table, tbody, td, th, thead, tr, ul
 from osin.misc import orjson_dumps
 from osin.types.pyobject.base import PyObject
 from osin.types.pyobject.html import OHTML, OListHTML
+from osin.types.pyobject.media import compute_waveform, encode_png, make_thumbnail
+from osin.types.pyobject.table import (
+    decode_table_rows,
+    encode_table_columns,
+    get_table_header,
+    get_table_n_rows,
+)
 
 
 @dataclass
 class OImage(PyObject[np.ndarray]):
+    """An image of shape (height, width) or (height, width, channels) with 1 to 4 channels
+    (grayscale, grayscale + alpha, RGB, RGBA). Values are uint8, or floats in [0, 1].
+
+    The image is stored as a chunked, compressed HDF5 dataset, and only its shape is sent to the
+    browser, which fetches a downsampled thumbnail (see `make_preview`) on demand.
+    """
+
     object: np.ndarray
 
+    def __post_init__(self):
+        if self.object.ndim not in (2, 3) or (
+            self.object.ndim == 3 and self.object.shape[2] not in (1, 2, 3, 4)
+        ):
+            raise ValueError(f"Invalid image shape: {self.object.shape}")
+
     def serialize_hdf5(self) -> np.ndarray:
-        raise NotImplementedError()
+        return np.asarray(self.object)
 
     @staticmethod
     def from_hdf5(value: np.ndarray) -> OImage:
-        raise NotImplementedError()
+        return OImage(value)
+
+    def to_dict(self) -> dict:
+        return {
+            "type": "image",
+            "shape": list(self.object.shape),
+        }
 
-    def to_dict(self) -> Any:
-        raise NotImplementedError()
+    @classmethod
+    def make_preview(
+        cls, value: Any, attrs: Mapping[str, Any], size: int
+    ) -> Tuple[bytes, str]:
+        """Make a PNG thumbnail whose longest side is at most `size` pixels"""
+        return encode_png(make_thumbnail(value, size)), "image/png"
 
 
 @dataclass
 class OAudio(PyObject[np.ndarray]):
+    """An audio of shape (n_samples,) or (n_samples, n_channels).
+
+    The samples are stored as a chunked, compressed HDF5 dataset, and only its metadata is sent to
+    the browser, which fetches a waveform (see `make_preview`) on demand.
+    """
+
     object: np.ndarray
+    sample_rate: int = 16000
+
+    def __post_init__(self):
+        if self.object.ndim not in (1, 2):
+            raise ValueError(f"Invalid audio shape: {self.object.shape}")
 
     def serialize_hdf5(self) -> np.ndarray:
-        raise NotImplementedError()
+        return np.asarray(self.object)
 
     @staticmethod
     def from_hdf5(value: np.ndarray) -> OAudio:
-        raise NotImplementedError()
+        return OAudio(value)
+
+    def get_hdf5_attrs(self) -> dict:
+        return {"sample_rate": self.sample_rate}
+
+    @classmethod
+    def from_hdf5_with_attrs(
+        cls, value: np.ndarray, attrs: Mapping[str, Any]
+    ) -> OAudio:
+        return OAudio(value, int(attrs.get("sample_rate", 16000)))
 
     def to_dict(self) -> dict:
-        raise NotImplementedError()
+        return {
+            "type": "audio",
+            "n_samples": self.object.shape[0],
+            "n_channels": 1 if self.object.ndim == 1 else self.object.shape[1],
+            "sample_rate": self.sample_rate,
+            "duration": self.object.shape[0] / self.sample_rate,
+        }
+
+    @classmethod
+    def make_preview(
+        cls, value: Any, attrs: Mapping[str, Any], size: int
+    ) -> Tuple[bytes, str]:
+        """Make a waveform of `size` buckets (min and max amplitude of each bucket) as JSON"""
+        waveform = compute_waveform(value, size)
+        waveform["sample_rate"] = int(attrs.get("sample_rate", 16000))
+        return orjson_dumps(waveform), "application/json"
 
 
 OTableRow = Mapping[str, Optional[Union[str, float, int, bool, OHTML, OListHTML]]]
@@ -47,44 +112,51 @@ OTableCellTypeToClass: dict[str, type[OHTML] | type[OListHTML]] = {
     "html": OHTML,
     "html-list": OListHTML,
 }
+# number of rows of a table sent with its example, the other rows are fetched by range
+OTABLE_PAGE_SIZE = 20
 
 
 @dataclass
-class OTable(PyObject[bytes]):
+class OTable(PyObject[Mapping[str, np.ndarray]]):
+    """A table whose cells are primitive values or HTML.
+
+    The table is stored in columns (see `osin.types.pyobject.table`), so that a range of rows can
+    be read without decoding the whole table (see `read_rows`). Rows of a table read from storage
+    are decoded when they are accessed.
+    """
+
     rows: Sequence[OTableRow]
 
-    def serialize_hdf5(self) -> bytes:
-        return orjson_dumps(
-            {
-                "rows": [
-                    {
-                        k: c.to_dict() if isinstance(c, PyObject) else c
-                        for k, c in row.items()
-                    }
-                    for row in self.rows
-                ],
-            }
-        )
+    def serialize_hdf5(self) -> Mapping[str, np.ndarray]:
+        return encode_table_columns(self.rows)
 
     @staticmethod
-    def from_hdf5(value: bytes) -> OTable:
+    def from_hdf5(value: Union[bytes, Mapping[str, Any]]) -> OTable:
+        if isinstance(value, bytes):
+            # tables stored as a single JSON document by previous versions
+            return OTable(_decode_table_cells(orjson.loads(value)["rows"]))
+        # the columns are read so the table does not depend on the storage being open
         return OTable(
-            [
-                {
-                    k: OTableCellTypeToClass[c["type"]].from_dict(c)
-                    if isinstance(c, dict)
-                    else c  # type: ignore
-                    for k, c in row.items()
-                }
-                for row in orjson.loads(value)["rows"]
-            ]
+            _OTableRows({name: np.asarray(value[name][()]) for name in value})
         )
 
+    @staticmethod
+    def read_rows(columns: Mapping[str, Any], offset: int, limit: int) -> dict:
+        """Read a range of rows of a table stored in columns, in the same format as `to_dict`.
+        Only the slices of the columns containing the rows are read."""
+        return {
+            "type": "table",
+            "header": get_table_header(columns),
+            "rows": decode_table_rows(columns, offset, offset + limit),
+            "n_rows": get_table_n_rows(columns),
+        }
+
     def to_dict(self) -> dict:
-        if len(self.rows) == 0:
-            header = []
+        """Same as `read_rows` for the first `OTABLE_PAGE_SIZE` rows"""
+        if isinstance(self.rows, _OTableRows):
+            header = self.rows.get_header()
         else:
-            header = list(self.rows[0].keys())
+            header = list(dict.fromkeys(key for row in self.rows for key in row.keys()))
 
         return {
             "type": "table",
@@ -94,8 +166,9 @@ class OTable(PyObject[bytes]):
                     k: c.to_dict() if isinstance(c, PyObject) else c
                     for k, c in row.items()
                 }
-                for row in self.rows
+                for row in self.rows[:OTABLE_PAGE_SIZE]
             ],
+            "n_rows": len(self.rows),
         }
 
     def _repr_html_(self):
@@ -117,6 +190,52 @@ class OTable(PyObject[bytes]):
         return str(table(thead(tr(*(th(header) for header in headers))), tbody(*rows)))
 
 
+class _OTableRows(Sequence[OTableRow]):
+    """Rows of a table stored in columns, decoded when they are accessed"""
+
+    def __init__(self, columns: Mapping[str, np.ndarray]):
+        self.columns = columns
+
+    def get_header(self) -> List[str]:
+        return get_table_header(self.columns)
+
+    def __len__(self) -> int:
+        return get_table_n_rows(self.columns)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return _decode_table_cells(decode_table_rows(self.columns, start, stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("table row index out of range")
+        return _decode_table_cells(decode_table_rows(self.columns, index, index + 1))[0]
+
+    def __iter__(self) -> Iterator[OTableRow]:
+        return iter(self[:])
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (_OTableRows, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+
+def _decode_table_cells(rows: List[Dict[str, Any]]) -> List[OTableRow]:
+    """Convert HTML cells from their dictionary form"""
+    return [
+        {
+            k: OTableCellTypeToClass[c["type"]].from_dict(c)
+            if isinstance(c, dict)
+            else c  # type: ignore
+            for k, c in row.items()
+        }
+        for row in rows
+    ]
+
+
 def from_classpath(classpath: str) -> type[PyObject]:
     # we know that variants of pyobject must be member of this module
     return globals()[classpath.split(".")[-1]]
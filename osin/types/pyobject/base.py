@@ -1,12 +1,13 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from typing import Generic, Type, TypeVar
+from typing import Any, Generic, Mapping, Tuple, Type, TypeVar
 
 import numpy as np
 from osin.types.pyobject_type import PyObjectType
 
-T = TypeVar("T", np.ndarray, bytes)
+# objects are serialized to bytes, an array, or a mapping of arrays (e.g., columns of a table)
+T = TypeVar("T", np.ndarray, bytes, Mapping[str, np.ndarray])
 
 
 class PyObject(ABC, Generic[T]):
@@ -41,3 +42,24 @@ class PyObject(ABC, Generic[T]):
     def to_dict(self) -> dict:
         """Convert the object to a dictionary to send to the client (browser)."""
         pass
+
+    def get_hdf5_attrs(self) -> dict:
+        """Extra attributes stored along with the serialized object (e.g., sample rate of an audio)"""
+        return {}
+
+    @classmethod
+    def from_hdf5_with_attrs(cls, value: T, attrs: Mapping[str, Any]) -> PyObject:
+        """Convert the object from a value stored in HDF5 and its attributes (see `get_hdf5_attrs`)."""
+        return cls.from_hdf5(value)
+
+    @classmethod
+    def make_preview(
+        cls, value: Any, attrs: Mapping[str, Any], size: int
+    ) -> Tuple[bytes, str]:
+        """Make a small preview of an object serialized to an array, without reading the whole
+        array if possible (`value` supports numpy slicing, e.g., a HDF5 dataset).
+
+        Returns:
+            The preview and its mimetype
+        """
+        raise NotImplementedError(f"{cls.__name__} does not support previews")
@@ -0,0 +1,105 @@
+"""Helpers to make small previews of images and audios without shipping full-resolution arrays
+to the browser"""
+
+from __future__ import annotations
+
+import math
+import struct
+import zlib
+from typing import Any, Dict, List
+
+import numpy as np
+
+PNG_COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+# maximum number of audio samples read at once when computing a waveform
+WAVEFORM_BLOCK_SIZE = 1 << 20
+
+
+def to_uint8_image(image: np.ndarray) -> np.ndarray:
+    """Convert an image to uint8: float images are expected to be in [0, 1], integer images in
+    [0, 255]"""
+    if image.dtype == np.uint8:
+        return image
+    if np.issubdtype(image.dtype, np.floating):
+        return (np.clip(np.nan_to_num(image), 0.0, 1.0) * 255).round().astype(np.uint8)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def make_thumbnail(image: Any, size: int) -> np.ndarray:
+    """Downsample an image (height, width[, channels]) so that its longest side is at most `size`.
+
+    Only every k-th pixel is read, so a thumbnail of a chunked HDF5 dataset does not load the whole
+    image in memory.
+    """
+    height, width = image.shape[:2]
+    step = max(1, math.ceil(max(height, width) / size))
+    return to_uint8_image(np.asarray(image[::step, ::step]))
+
+
+def encode_png(image: np.ndarray) -> bytes:
+    """Encode a uint8 image of shape (height, width) or (height, width, channels) with 1 to 4
+    channels as PNG"""
+    if image.ndim == 2:
+        image = image[:, :, None]
+    height, width, n_channels = image.shape
+    if n_channels not in PNG_COLOR_TYPES:
+        raise ValueError(f"Cannot encode an image of {n_channels} channels as PNG")
+
+    # each scanline starts with a filter type byte (0: no filter)
+    scanlines = np.zeros((height, width * n_channels + 1), dtype=np.uint8)
+    scanlines[:, 1:] = np.ascontiguousarray(image, dtype=np.uint8).reshape(height, -1)
+
+    def chunk(chunk_type: bytes, data: bytes) -> bytes:
+        return (
+            struct.pack(">I", len(data))
+            + chunk_type
+            + data
+            + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF)
+        )
+
+    header = struct.pack(
+        ">IIBBBBB", width, height, 8, PNG_COLOR_TYPES[n_channels], 0, 0, 0
+    )
+    return b"".join(
+        [
+            b"\x89PNG\r\n\x1a\n",
+            chunk(b"IHDR", header),
+            chunk(b"IDAT", zlib.compress(scanlines.tobytes(), 6)),
+            chunk(b"IEND", b""),
+        ]
+    )
+
+
+def compute_waveform(audio: Any, width: int) -> Dict[str, List[float]]:
+    """Compute the min and max amplitude (averaged over channels) of `width` buckets of an audio of
+    shape (n_samples,) or (n_samples, n_channels). The audio is read in blocks, so it is never fully
+    loaded in memory."""
+    n_samples = audio.shape[0]
+    width = max(1, min(width, n_samples))
+    if n_samples == 0:
+        return {"min": [], "max": []}
+
+    edges = np.linspace(0, n_samples, width + 1).astype(np.int64)
+    mins = np.zeros((width,), dtype=np.float64)
+    maxs = np.zeros((width,), dtype=np.float64)
+
+    # process consecutive buckets covering about WAVEFORM_BLOCK_SIZE samples at once
+    start_bucket = 0
+    while start_bucket < width:
+        end_bucket = start_bucket + 1
+        while (
+            end_bucket < width
+            and edges[end_bucket + 1] - edges[start_bucket] <= WAVEFORM_BLOCK_SIZE
+        ):
+            end_bucket += 1
+        block = np.asarray(
+            audio[edges[start_bucket] : edges[end_bucket]], dtype=np.float64
+        )
+        if block.ndim > 1:
+            block = block.mean(axis=tuple(range(1, block.ndim)))
+        offsets = edges[start_bucket:end_bucket] - edges[start_bucket]
+        mins[start_bucket:end_bucket] = np.minimum.reduceat(block, offsets)
+        maxs[start_bucket:end_bucket] = np.maximum.reduceat(block, offsets)
+        start_bucket = end_bucket
+
+    return {"min": mins.tolist(), "max": maxs.tolist()}
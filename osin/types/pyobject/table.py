@@ -0,0 +1,202 @@
+"""Columnar encoding of tables: one array per column so that a range of rows can be read and
+decoded without decoding the whole table.
+
+A table is encoded as a mapping of arrays:
+
+    - `header`: names of the columns
+    - `kinds`: kind of each column (see `CELL_KINDS`)
+    - `n_rows`: a single-element array with the number of rows
+    - `c<i>`: values of the i-th column, HTML cells are split into `c<i>` (the HTML) and
+      `c<i>.popover` (the popover, if any, see `c<i>.has_popover`)
+    - `c<i>.status`: status of the cells of the i-th column (`CELL_PRESENT`, `CELL_NONE` or
+      `CELL_ABSENT`), only stored if some cells are missing
+
+Strings are stored as arrays of python strings (dtype object) and may be read back as arrays of
+`np.str_`, depending on the storage.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Mapping, Sequence
+
+import numpy as np
+import orjson
+from osin.misc import orjson_dumps
+from osin.types.pyobject.base import PyObject
+from osin.types.pyobject.html import OHTML
+
+# status of a cell, same values as the status of primitive columns of run data
+CELL_PRESENT = 0
+CELL_NONE = 1
+CELL_ABSENT = 2
+
+# kinds of columns: "json" is for columns mixing types or having other objects (e.g., list of HTML)
+CELL_KINDS = ("bool", "int", "float", "str", "html", "json")
+
+_ABSENT = object()
+
+
+def infer_cell_kind(values: Sequence[Any]) -> str:
+    """Infer the kind of a column from its values (None and absent cells are ignored)"""
+    kinds = set()
+    for value in values:
+        if value is None or value is _ABSENT:
+            continue
+        if isinstance(value, bool):
+            kinds.add("bool")
+        elif isinstance(value, int):
+            kinds.add("int")
+        elif isinstance(value, float):
+            kinds.add("float")
+        elif isinstance(value, str):
+            kinds.add("str")
+        elif isinstance(value, OHTML):
+            kinds.add("html")
+        else:
+            return "json"
+
+    if len(kinds) == 0:
+        return "json"
+    if len(kinds) == 1:
+        return kinds.pop()
+    if kinds == {"int", "float"}:
+        return "float"
+    return "json"
+
+
+def encode_table_columns(rows: Sequence[Mapping[str, Any]]) -> Dict[str, np.ndarray]:
+    """Encode rows of a table into columns, the header is the union of the keys of the rows in
+    the order of their first appearance"""
+    header = list(dict.fromkeys(key for row in rows for key in row.keys()))
+    kinds = []
+    columns: Dict[str, np.ndarray] = {
+        "header": np.asarray(header, dtype=object),
+        "n_rows": np.asarray([len(rows)], dtype=np.int64),
+    }
+
+    for i, name in enumerate(header):
+        values = [row.get(name, _ABSENT) for row in rows]
+        kind = infer_cell_kind(values)
+        kinds.append(kind)
+
+        status = np.asarray(
+            [
+                CELL_ABSENT
+                if value is _ABSENT
+                else (CELL_NONE if value is None else CELL_PRESENT)
+                for value in values
+            ],
+            dtype=np.uint8,
+        )
+        is_present = status == CELL_PRESENT
+        if not np.all(is_present):
+            columns[f"c{i}.status"] = status
+
+        if kind == "html":
+            columns[f"c{i}"] = np.asarray(
+                [value.value if ok else "" for value, ok in zip(values, is_present)],
+                dtype=object,
+            )
+            has_popover = np.asarray(
+                [
+                    ok and value.popover is not None
+                    for value, ok in zip(values, is_present)
+                ],
+                dtype=np.bool_,
+            )
+            if np.any(has_popover):
+                columns[f"c{i}.popover"] = np.asarray(
+                    [
+                        value.popover if has else ""
+                        for value, has in zip(values, has_popover)
+                    ],
+                    dtype=object,
+                )
+                columns[f"c{i}.has_popover"] = has_popover
+        elif kind == "json":
+            columns[f"c{i}"] = np.asarray(
+                [
+                    orjson_dumps(
+                        value.to_dict() if isinstance(value, PyObject) else value
+                    ).decode()
+                    if ok
+                    else ""
+                    for value, ok in zip(values, is_present)
+                ],
+                dtype=object,
+            )
+        elif kind == "str":
+            columns[f"c{i}"] = np.asarray(
+                [value if ok else "" for value, ok in zip(values, is_present)],
+                dtype=object,
+            )
+        else:
+            dtype = {"bool": np.bool_, "int": np.int64, "float": np.float64}[kind]
+            columns[f"c{i}"] = np.asarray(
+                [value if ok else 0 for value, ok in zip(values, is_present)],
+                dtype=dtype,
+            )
+
+    columns["kinds"] = np.asarray(kinds, dtype=object)
+    return columns
+
+
+def get_table_header(columns: Mapping[str, Any]) -> List[str]:
+    return [str(name) for name in np.asarray(columns["header"][()]).tolist()]
+
+
+def get_table_n_rows(columns: Mapping[str, Any]) -> int:
+    return int(columns["n_rows"][0])
+
+
+def decode_table_rows(
+    columns: Mapping[str, Any], start: int, end: int
+) -> List[Dict[str, Any]]:
+    """Decode rows in [start, end) of a table encoded by `encode_table_columns`. Only the slices of
+    the columns are read. HTML cells are decoded to their dictionary form (see `OHTML.to_dict`)."""
+    n_rows = get_table_n_rows(columns)
+    start = max(0, min(start, n_rows))
+    end = max(start, min(end, n_rows))
+    header = get_table_header(columns)
+    kinds = [str(kind) for kind in np.asarray(columns["kinds"][()]).tolist()]
+    rows: List[Dict[str, Any]] = [{} for _ in range(end - start)]
+    if end == start:
+        return rows
+
+    for i, (name, kind) in enumerate(zip(header, kinds)):
+        values = np.asarray(columns[f"c{i}"][start:end]).tolist()
+        if f"c{i}.status" in columns:
+            status = np.asarray(columns[f"c{i}.status"][start:end]).tolist()
+        else:
+            status = [CELL_PRESENT] * len(values)
+
+        if kind == "html":
+            if f"c{i}.has_popover" in columns:
+                has_popover = np.asarray(
+                    columns[f"c{i}.has_popover"][start:end]
+                ).tolist()
+                popovers = [
+                    popover if has else None
+                    for popover, has in zip(
+                        np.asarray(columns[f"c{i}.popover"][start:end]).tolist(),
+                        has_popover,
+                    )
+                ]
+            else:
+                popovers = [None] * len(values)
+            values = [
+                {"type": "html", "value": value, "popover": popover}
+                for value, popover in zip(values, popovers)
+            ]
+        elif kind == "json":
+            values = [
+                orjson.loads(value) if s == CELL_PRESENT else None
+                for value, s in zip(values, status)
+            ]
+
+        for row, value, s in zip(rows, values, status):
+            if s == CELL_PRESENT:
+                row[name] = value
+            elif s == CELL_NONE:
+                row[name] = None
+    return rows
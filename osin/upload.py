@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import os
+import shutil
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+import orjson
+from osin.misc import orjson_dumps
+
+# size of the reads when hashing or receiving data
+READ_SIZE = 1024 * 1024
+
+
+@dataclass
+class ChunkedUploadState:
+    filename: str
+    # size and sha256 (hex) of the whole file
+    size: int
+    checksum: str
+    chunk_size: int
+    # number of chunks received and appended to the data file, and the data file's valid size
+    n_received: int = 0
+    offset: int = 0
+
+    @property
+    def n_chunks(self) -> int:
+        return (self.size + self.chunk_size - 1) // self.chunk_size
+
+
+class ChunkedUpload:
+    """Server side of an upload of a file of a run in numbered chunks, so that the file does not
+    have to fit in one request and an interrupted upload can resume from its last received chunk.
+
+    An upload is stored in a directory (`<rundir>/.uploads/<upload_id>`) with its state
+    (`state.json`) and the received data (`data`). Chunks must be appended in order: chunk `i`
+    covers the bytes `[i * chunk_size, (i + 1) * chunk_size)` of the file. The state is updated
+    after the chunk is written, and bytes past its offset (from an interrupted append) are
+    discarded by the next append. Requests of the same upload take turns through a file lock.
+
+    The id of an upload is derived from the file and its checksum, so initiating the same upload
+    again (e.g., after the client restarts) resumes it.
+    """
+
+    def __init__(self, updir: Path):
+        self.updir = updir
+        self.state_file = updir / "state.json"
+        self.data_file = updir / "data"
+
+    @staticmethod
+    def get_upload_id(filename: str, size: int, checksum: str, chunk_size: int) -> str:
+        key = f"{filename}:{size}:{checksum}:{chunk_size}"
+        return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+    @staticmethod
+    def init(
+        rundir: Path, filename: str, size: int, checksum: str, chunk_size: int
+    ) -> ChunkedUpload:
+        """Start an upload of a file, or get the existing upload of the same file"""
+        upload_id = ChunkedUpload.get_upload_id(filename, size, checksum, chunk_size)
+        upload = ChunkedUpload(rundir / ".uploads" / upload_id)
+        upload.updir.mkdir(parents=True, exist_ok=True)
+        with upload.lock():
+            if not upload.state_file.exists():
+                upload.data_file.touch()
+                upload._write_state(
+                    ChunkedUploadState(filename, size, checksum, chunk_size)
+                )
+        return upload
+
+    @property
+    def upload_id(self) -> str:
+        return self.updir.name
+
+    def exists(self) -> bool:
+        return self.state_file.exists()
+
+    def get_state(self) -> ChunkedUploadState:
+        return ChunkedUploadState(**orjson.loads(self.state_file.read_bytes()))
+
+    def append(self, index: int, stream: BinaryIO, checksum: str) -> ChunkedUploadState:
+        """Append the `index`-th chunk read from the stream. A chunk that is already received
+        (e.g., resent because its response was lost) is ignored.
+
+        Raises:
+            ValueError: if the chunk is out of order, its size is not the expected size, or its
+                content does not match its checksum (sha256 hex)
+        """
+        with self.lock():
+            state = self.get_state()
+            if index < state.n_received:
+                return state
+            if index > state.n_received:
+                raise ValueError(
+                    f"Expect chunk {state.n_received} but got chunk {index}"
+                )
+            if index >= state.n_chunks:
+                raise ValueError(f"The file only has {state.n_chunks} chunks")
+            expected_size = min(state.chunk_size, state.size - state.offset)
+
+            hasher = hashlib.sha256()
+            size = 0
+            with open(self.data_file, "r+b") as f:
+                f.truncate(state.offset)
+                f.seek(state.offset)
+                while size <= expected_size:
+                    data = stream.read(min(READ_SIZE, expected_size + 1 - size))
+                    if len(data) == 0:
+                        break
+                    hasher.update(data)
+                    f.write(data)
+                    size += len(data)
+                if size != expected_size:
+                    raise ValueError(
+                        f"Expect chunk {index} to have {expected_size} bytes but got {size}"
+                    )
+                if hasher.hexdigest() != checksum:
+                    raise ValueError(f"Chunk {index} does not match its checksum")
+                f.flush()
+                os.fsync(f.fileno())
+
+            state.n_received += 1
+            state.offset += size
+            self._write_state(state)
+            return state
+
+    @contextmanager
+    def complete(self) -> Iterator[Path]:
+        """Yield the received file once all chunks are received and the file matches its
+        checksum. The upload is removed if the block exits without errors (the block is expected
+        to move the file).
+
+        Raises:
+            ValueError: if some chunks are missing or the file does not match its checksum
+        """
+        with self.lock():
+            state = self.get_state()
+            if state.n_received < state.n_chunks:
+                raise ValueError(
+                    f"Received {state.n_received} of {state.n_chunks} chunks"
+                )
+            if get_file_checksum(self.data_file, state.offset) != state.checksum:
+                raise ValueError("The uploaded file does not match its checksum")
+            yield self.data_file
+        self.remove()
+
+    def remove(self):
+        shutil.rmtree(self.updir, ignore_errors=True)
+        try:
+            self.updir.parent.rmdir()
+        except OSError:
+            # other uploads in progress
+            pass
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        with open(self.updir / ".lock", "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _write_state(self, state: ChunkedUploadState):
+        tmp_file = self.state_file.with_suffix(".tmp")
+        tmp_file.write_bytes(orjson_dumps(asdict(state)))
+        os.replace(tmp_file, self.state_file)
+
+
+def get_file_checksum(file: Path, size: int = -1) -> str:
+    """Compute the sha256 (hex) of the first `size` bytes of a file (the whole file if negative)"""
+    hasher = hashlib.sha256()
+    with open(file, "rb") as f:
+        remaining = size if size >= 0 else float("inf")
+        while remaining > 0:
+            data = f.read(int(min(READ_SIZE, remaining)))
+            if len(data) == 0:
+                break
+            hasher.update(data)
+            remaining -= len(data)
+    return hasher.hexdigest()
@@ -0,0 +1,94 @@
+"""Compare the write and point-lookup latency of the groups of complex objects of individual
+examples in the flat layout (`/individual/complex/<example_id>`) and the bucketed layout
+(`/individual/complex/<bucket>/<example_id>`).
+
+Usage:
+    python scripts/benchmark_bucketed_layout.py [--sizes 10000,100000,1000000] [--n-lookups 1000]
+
+Examples are written with the stream writer, so the memory usage does not depend on the number of
+examples. A lookup finds the group of an example by its id and reads its complex object.
+
+Results of one run (h5py 3.16, HDF5 2.0, local disk):
+
+    n_examples layout      write (s)  write (us/ex)  lookup (us)
+         10000 flat             5.42          541.6        463.5
+         10000 bucketed         6.55          654.7        756.1
+        100000 flat            55.10          551.0        473.9
+        100000 bucketed        63.42          634.2        697.7
+       1000000 flat           535.85          535.9        655.4
+       1000000 bucketed       636.49          636.5        823.9
+"""
+
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import click
+from h5py import File
+from osin.formats import Hdf5Format
+from osin.models import Record
+from osin.types.pyobject.html import OHTML
+
+LAYOUTS = {
+    "flat": 0,
+    "bucketed": 1024,
+}
+
+
+def write_run(format: Hdf5Format, outfile: Path, n_examples: int) -> float:
+    start = time.perf_counter()
+    writer = format.open_stream_writer(outfile, batch_size=10000)
+    for i in range(n_examples):
+        writer.update_example(
+            f"ex{i:07d}",
+            primitive={"score": i / n_examples},
+            complex={"html": OHTML(f"<b>example {i}</b>")},
+        )
+    writer.close(Record())
+    return time.perf_counter() - start
+
+
+def lookup_examples(format: Hdf5Format, infile: Path, example_ids: list) -> float:
+    """Average latency (in seconds) of looking up the group of an example and reading its
+    complex object"""
+    with File(infile, "r") as f:
+        ind_group = f["individual"]
+        start = time.perf_counter()
+        for example_id in example_ids:
+            grp = format._get_complex_group(ind_group, example_id)
+            assert grp is not None
+            format._read_complex_object(grp, "html", grp["html"])
+        return (time.perf_counter() - start) / len(example_ids)
+
+
+@click.command()
+@click.option(
+    "--sizes",
+    default="10000,100000,1000000",
+    help="comma-separated numbers of examples",
+)
+@click.option("--n-lookups", default=1000, help="number of random point lookups")
+def main(sizes: str, n_lookups: int):
+    print(
+        f"{'n_examples':>10} {'layout':<10} {'write (s)':>10} {'write (us/ex)':>14} {'lookup (us)':>12}"
+    )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n_examples in [int(x) for x in sizes.split(",")]:
+            example_ids = [
+                f"ex{i:07d}"
+                for i in random.Random(42).choices(range(n_examples), k=n_lookups)
+            ]
+            for name, n_buckets in LAYOUTS.items():
+                format = Hdf5Format(n_complex_buckets=n_buckets)
+                outfile = Path(tmpdir) / f"{name}-{n_examples}.h5"
+                write_time = write_run(format, outfile, n_examples)
+                lookup_time = lookup_examples(format, outfile, example_ids)
+                print(
+                    f"{n_examples:>10} {name:<10} {write_time:>10.2f} {write_time / n_examples * 1e6:>14.1f} {lookup_time * 1e6:>12.1f}"
+                )
+                outfile.unlink()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Report the size and latency of storing complex objects with different compression options.
+
+Usage:
+    python scripts/benchmark_compression.py [--data <path to a run's data.h5>] [--n-examples 2000]
+
+Without `--data`, a synthetic run with repetitive HTML outputs is generated.
+"""
+
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+import click
+from osin.formats import Hdf5Compression, Hdf5Format
+from osin.models import ExampleData, ExpRunData, Record
+from osin.types.pyobject import OTable
+from osin.types.pyobject.html import OHTML, OListHTML
+
+OPTIONS = {
+    "none": None,
+    "gzip-1": Hdf5Compression("gzip", 1),
+    "gzip-4": Hdf5Compression("gzip", 4),
+    "gzip-9": Hdf5Compression("gzip", 9),
+    "lzf": Hdf5Compression("lzf"),
+}
+
+
+def make_synthetic_run(n_examples: int) -> ExpRunData:
+    data = ExpRunData()
+    for i in range(n_examples):
+        rows = [
+            {
+                "entity": OHTML(
+                    f'<a href="https://example.org/entity/{i}-{j}">Entity {j}</a>',
+                    f"<p>Description of entity {j} of example {i}</p>",
+                ),
+                "candidates": OListHTML(
+                    [
+                        OHTML(f"<span class='cand'>candidate {k}</span>")
+                        for k in range(5)
+                    ]
+                ),
+                "score": j / 10,
+            }
+            for j in range(20)
+        ]
+        data.individual[f"ex{i:06d}"] = ExampleData(
+            f"ex{i:06d}",
+            "",
+            Record(
+                {"score": i / n_examples},
+                {
+                    "table": OTable(rows),
+                    "context": OHTML(
+                        "<div class='context'>" + "lorem ipsum " * 50 + "</div>"
+                    ),
+                },
+            ),
+        )
+    return data
+
+
+@click.command()
+@click.option("--data", default=None, help="data.h5 of a run to benchmark")
+@click.option("--n-examples", default=2000, help="number of synthetic examples")
+def main(data: Optional[str], n_examples: int):
+    if data is not None:
+        rundata, _ = Hdf5Format().load_exp_run_data(data)
+    else:
+        rundata = make_synthetic_run(n_examples)
+
+    print(
+        f"{'option':<10} {'size (MB)':>10} {'ratio':>7} {'write (s)':>10} {'load (s)':>10} {'page (ms)':>10}"
+    )
+    baseline_size = None
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, compression in OPTIONS.items():
+            format = Hdf5Format(compression=compression)
+            outfile = Path(tmpdir) / f"{name}.h5"
+
+            start = time.perf_counter()
+            format.save_run_data(rundata, outfile)
+            write_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            format.load_exp_run_data(outfile)
+            load_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            format.load_exp_run_data(
+                outfile, limit=20, offset=len(rundata.individual) // 2
+            )
+            page_time = time.perf_counter() - start
+
+            size = outfile.stat().st_size
+            if baseline_size is None:
+                baseline_size = size
+            print(
+                f"{name:<10} {size / 1024 / 1024:>10.2f} {baseline_size / size:>7.2f} {write_time:>10.3f} {load_time:>10.3f} {page_time * 1000:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Compare the latency of loading pages of individual examples having large `OTable`s when their
+complex objects are decoded serially or by a thread pool (`Hdf5Format(decode_executor=...)`).
+
+Usage:
+    python scripts/benchmark_parallel_decode.py [--page-sizes 1,10,50,100] [--n-rows 1000] [--workers 4]
+
+Each example has a table of `n-rows` rows, stored either in the columnar encoding or as a single
+JSON document (the encoding of previous versions).
+
+Results of one run (4 threads, h5py 3.16, orjson 3.13, Python 3.11) on a machine with a single
+CPU, where the threads can only overlap waiting, not decoding; differences are within the noise.
+Decoding holds the GIL for most of its work (building python objects), so a speedup requires
+several cores and large objects:
+
+    encoding  page size  serial (ms)  parallel (ms)  speedup
+    columnar          1         22.2           16.7     1.33
+    columnar         10        151.3          144.6     1.05
+    columnar         50        781.1          688.6     1.13
+    columnar        100       1657.7         1391.1     1.19
+    json              1          8.4            5.8     1.44
+    json             10         73.8           74.6     0.99
+    json             50        357.8          379.5     0.94
+    json            100        769.1          816.5     0.94
+
+A page of one example is always decoded serially, so its difference shows the noise level.
+"""
+
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import click
+from h5py import File
+from osin.formats import Hdf5Format
+from osin.misc import orjson_dumps
+from osin.models import Record
+from osin.types.pyobject import OTable
+from osin.types.pyobject.html import OHTML
+
+
+def make_table(i: int, n_rows: int) -> OTable:
+    return OTable(
+        [
+            {
+                "id": j,
+                "score": j / n_rows,
+                "text": f"example {i} row {j}",
+                "html": OHTML(f"<b>{j}</b>", f"popover {j}"),
+            }
+            for j in range(n_rows)
+        ]
+    )
+
+
+def write_run(outfile: Path, n_examples: int, n_rows: int, encoding: str):
+    writer = Hdf5Format().open_stream_writer(outfile, batch_size=100)
+    for i in range(n_examples):
+        writer.update_example(f"ex{i:05d}", complex={"table": make_table(i, n_rows)})
+    writer.close(Record())
+
+    if encoding == "json":
+        # rewrite the tables as JSON documents
+        format = Hdf5Format()
+        with File(outfile, "a") as f:
+            ind_group = f["individual"]
+            for i in range(n_examples):
+                grp = format._get_complex_group(ind_group, f"ex{i:05d}")
+                assert grp is not None
+                table = format._read_complex_object(grp, "table", grp["table"])
+                del grp["table"]
+                grp["table"] = orjson_dumps(table.to_dict())
+
+
+def load_pages(format: Hdf5Format, infile: Path, page_size: int, n_pages: int) -> float:
+    """Average latency (in seconds) of loading a page of examples"""
+    with File(infile, "r") as f:
+        # warm up the file's metadata cache
+        format.load_exp_run_data(f, limit=page_size)
+        start = time.perf_counter()
+        for i in range(n_pages):
+            format.load_exp_run_data(f, limit=page_size, offset=i * page_size)
+        return (time.perf_counter() - start) / n_pages
+
+
+@click.command()
+@click.option("--page-sizes", default="1,10,50,100", help="comma-separated page sizes")
+@click.option("--n-rows", default=1000, help="number of rows of each table")
+@click.option("--workers", default=4, help="number of decoding threads")
+@click.option("--n-pages", default=5, help="number of pages loaded per measure")
+def main(page_sizes: str, n_rows: int, workers: int, n_pages: int):
+    sizes = [int(x) for x in page_sizes.split(",")]
+    executor = ThreadPoolExecutor(workers)
+    print(
+        f"{'encoding':<9} {'page size':>9} {'serial (ms)':>12} {'parallel (ms)':>14} {'speedup':>8}"
+    )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for encoding in ["columnar", "json"]:
+            outfile = Path(tmpdir) / f"{encoding}.h5"
+            write_run(outfile, max(sizes) * n_pages, n_rows, encoding)
+            for page_size in sizes:
+                serial = load_pages(Hdf5Format(), outfile, page_size, n_pages)
+                parallel = load_pages(
+                    Hdf5Format(decode_executor=executor), outfile, page_size, n_pages
+                )
+                print(
+                    f"{encoding:<9} {page_size:>9} {serial * 1e3:>12.1f} {parallel * 1e3:>14.1f} {serial / parallel:>8.2f}"
+                )
+    executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
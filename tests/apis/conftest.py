@@ -0,0 +1,31 @@
+import threading
+from pathlib import Path
+
+import pytest
+from osin.app import app
+from osin.models import all_tables
+from osin.models.base import db
+from osin.repository import OsinRepository
+from werkzeug.serving import make_server
+
+
+@pytest.fixture
+def osin_server(tmp_path: Path):
+    """Serve a fresh osin server over HTTP, yielding its endpoint. The database is stored in a
+    file, as an in-memory database is not shared by the threads of the server"""
+    (tmp_path / "server").mkdir()
+    db.init(str(tmp_path / "server" / "osin.db"), pragmas={"foreign_keys": 1})
+    db.create_tables(all_tables, safe=True)
+    OsinRepository.instance = OsinRepository(tmp_path / "server")
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        thread.join()
+        OsinRepository.instance = None
+        db.close()
+        db.init(":memory:", pragmas={"foreign_keys": 1})
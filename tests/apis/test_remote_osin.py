@@ -0,0 +1,255 @@
+import json
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import pytest
+import yada
+from click.testing import CliRunner
+from osin.__main__ import cli
+from osin.apis.osin import Osin
+from osin.apis.uploader import UploadJob
+from osin.models.exp import ExpRun
+from osin.repository import OsinRepository
+
+
+@dataclass
+class Args:
+    dataset: str
+    method: str
+
+
+PARAMS = {
+    "": yada.Parser1(Args).parse_args(
+        ["--dataset", "iris", "--method", "Nearest Neighbors"]
+    )
+}
+
+
+def run_experiment(osin: Osin) -> int:
+    exp = osin.init_exp(
+        name="sklearn.classification",
+        version=1,
+        description="Testing sklearn classifiers on some sklearn datasets",
+        params=PARAMS,
+    )
+    exp_run = exp.new_exp_run(PARAMS)
+    exp_run.update_output(
+        primitive=dict(precision=0.6, recall=0.8, support=100)
+    ).update_example_output(
+        "e01", primitive=dict(precision=1.0, recall=0.0)
+    ).update_example_output(
+        "e02", primitive=dict(precision=0.5, recall=0.5)
+    ).finish()
+    return exp_run.id
+
+
+def get_uploaded_files(exprun_id: int):
+    exp_run = ExpRun.get_by_id(exprun_id)
+    rundir = OsinRepository.get_instance().get_exp_run_dir(exp_run.exp, exp_run)
+    return sorted(file.name for file in rundir.iterdir())
+
+
+def test_background_upload(osin_server: str, tmp_path: Path):
+    osin = Osin.remote(osin_server, tmp_path / "client", background_upload=True)
+    exprun_id = run_experiment(osin)
+    assert osin.flush(timeout=10)
+
+    exp_run = ExpRun.get_by_id(exprun_id)
+    assert exp_run.is_finished and exp_run.is_successful
+    assert exp_run.aggregated_primitive_outputs["support"] == 100
+    assert get_uploaded_files(exprun_id) == [
+        "_SUCCESS",
+        "data.h5",
+        "metadata.json",
+        "params.json",
+    ]
+    assert osin.uploader is not None and osin.uploader.list_jobs() == []
+    osin.uploader.close()
+
+
+def test_exit_timeout(osin_server: str, tmp_path: Path):
+    osin = Osin.remote(
+        osin_server, tmp_path / "client", background_upload=True, exit_timeout=0.1
+    )
+    assert osin.uploader is not None
+    release = threading.Event()
+    osin.uploader.upload = lambda job: release.wait(5)
+    osin.uploader.submit(UploadJob(1, "run_001", {}))
+
+    # the upload is not done at exit, it is left in the queue for the next process
+    start = time.time()
+    osin._flush_at_exit()
+    assert time.time() - start < 5
+    assert len(list((tmp_path / "client" / ".upload_queue").glob("*.uploading"))) == 1
+    release.set()
+
+
+def test_live_run(osin_server: str, tmp_path: Path):
+    osin = Osin.remote(osin_server, tmp_path / "client")
+    exp = osin.init_exp(name="sklearn.classification", version=1, params=PARAMS)
+    # the server cannot read the data file written in the client's tmpdir
+    with pytest.raises(ValueError):
+        exp.new_exp_run(PARAMS, stream_batch_size=10, live=True)
+
+
+def test_compressed_requests(osin_server: str, tmp_path: Path):
+    osin = Osin.remote(osin_server, tmp_path / "client", compress_min_size=0)
+    exprun_id = run_experiment(osin)
+    exp_run = ExpRun.get_by_id(exprun_id)
+    assert exp_run.is_finished and exp_run.params == {
+        "": {"dataset": "iris", "method": "Nearest Neighbors"}
+    }
+    assert "data.h5" in get_uploaded_files(exprun_id)
+
+
+def test_resume_chunked_upload(osin_server: str, tmp_path: Path):
+    osin = Osin.remote(osin_server, tmp_path / "client", upload_chunk_size=1024)
+    exprun_id = run_experiment(osin)
+    exp_run = ExpRun.get_by_id(exprun_id)
+    rundir = OsinRepository.get_instance().get_exp_run_dir(exp_run.exp, exp_run)
+    file = tmp_path / "client" / "metadata.json"
+    file.write_text(json.dumps({"values": list(range(1000))}))
+    n_chunks = (file.stat().st_size + 1023) // 1024
+
+    # the connection is lost after uploading two chunks
+    request = osin._request
+    chunks = []
+    is_interrupted = True
+
+    def upload_request(method: str, url: str, **kwargs):
+        if method == "PUT":
+            if is_interrupted and len(chunks) == 2:
+                raise ConnectionError()
+            chunks.append(int(url.rsplit("/", 1)[1]))
+        return request(method, url, **kwargs)
+
+    osin._request = upload_request
+    with pytest.raises(ConnectionError):
+        osin._upload_file(exprun_id, file)
+    assert len(list((rundir / ".uploads").iterdir())) == 1
+
+    # the next attempt continues from the third chunk
+    is_interrupted = False
+    osin._upload_file(exprun_id, file)
+    assert chunks == list(range(n_chunks))
+    assert (rundir / "metadata.json").read_bytes() == file.read_bytes()
+    assert not (rundir / ".uploads").exists()
+
+
+def test_run_round_trips(osin_server: str, tmp_path: Path):
+    osin = Osin.remote(osin_server, tmp_path / "client")
+    urls = []
+    request = osin._request
+
+    def count_request(method: str, url: str, **kwargs):
+        urls.append((method, url))
+        return request(method, url, **kwargs)
+
+    osin._request = count_request
+    exprun_id = run_experiment(osin)
+    assert urls == [
+        ("POST", "/api/exprun/init-and-start-run"),
+        ("POST", f"/api/exprun/{exprun_id}/finish-and-upload"),
+    ]
+
+    exp_run = ExpRun.get_by_id(exprun_id)
+    assert exp_run.is_finished and exp_run.is_successful
+    assert exp_run.params == {"": {"dataset": "iris", "method": "Nearest Neighbors"}}
+    assert not exp_run.has_invalid_agg_output_schema
+    # the schema of the aggregated outputs is inferred by the server from the first run
+    assert exp_run.exp.aggregated_primitive_outputs is not None
+    assert get_uploaded_files(exprun_id) == [
+        "_SUCCESS",
+        "data.h5",
+        "metadata.json",
+        "params.json",
+    ]
+
+    # later runs of the experiment reuse it
+    urls.clear()
+    assert ExpRun.get_by_id(run_experiment(osin)).exp_id == exp_run.exp_id
+    assert [url for _, url in urls][0] == "/api/exprun/init-and-start-run"
+
+    exp = osin.init_exp(name="sklearn.classification", version=1, params=PARAMS)
+    exp.new_exp_run(PARAMS).finish()
+    urls.clear()
+    exp.new_exp_run(PARAMS).finish()
+    assert [url for _, url in urls][0] == "/api/exprun"
+
+    # files that do not fit in the request are uploaded in chunks first
+    osin.upload_chunk_size = 1024
+    urls.clear()
+    exprun_id = run_experiment(osin)
+    assert urls[1][1] == f"/api/exprun/{exprun_id}/uploads"
+    assert urls[-1][1] == f"/api/exprun/{exprun_id}/finish-and-upload"
+    assert "data.h5" in get_uploaded_files(exprun_id)
+
+    exp = osin.init_exp(name="sklearn.classification", version=0, params=PARAMS)
+    with pytest.raises(AssertionError):
+        exp.new_exp_run(PARAMS)
+
+
+def test_spool_and_sync(osin_server: str, tmp_path: Path):
+    # the server cannot be reached while the experiments run
+    osin = Osin.remote("http://127.0.0.1:9", tmp_path / "client", spool=True)
+    provisional_ids = [run_experiment(osin), run_experiment(osin)]
+    exp = osin.init_exp(name="sklearn.classification", version=1, params=PARAMS)
+    for _ in range(2):
+        exp_run = exp.new_exp_run(PARAMS)
+        exp_run.update_output(primitive=dict(precision=0.1, recall=0.2, support=1))
+        provisional_ids.append(exp_run.id)
+        exp_run.finish()
+    assert all(id < 0 for id in provisional_ids)
+    assert ExpRun.select().count() == 0
+
+    result = CliRunner().invoke(
+        cli, ["sync", "-e", osin_server, "-t", str(tmp_path / "client")]
+    )
+    assert result.exit_code == 0, result.output
+    assert "Synced 8 operations" in result.output
+
+    exp_runs = list(ExpRun.select().order_by(ExpRun.id))
+    assert len(exp_runs) == 4
+    assert len({exp_run.exp_id for exp_run in exp_runs}) == 1
+    assert all(exp_run.is_finished and exp_run.is_successful for exp_run in exp_runs)
+    assert exp_runs[-1].aggregated_primitive_outputs["support"] == 1
+    for exp_run in exp_runs:
+        assert "data.h5" in get_uploaded_files(exp_run.id)
+
+    state = osin.spool.read_state()
+    assert [state["exprun"][str(id)] for id in provisional_ids] == [
+        exp_run.id for exp_run in exp_runs
+    ]
+    # runs of a synced experiment spooled later use its server's id
+    exp.new_exp_run(PARAMS).finish()
+    assert Osin.remote(osin_server, tmp_path / "client").sync() == 2
+    assert Osin.remote(osin_server, tmp_path / "client").sync() == 0
+    assert ExpRun.select().count() == 5
+
+
+def test_resume_sync(osin_server: str, tmp_path: Path):
+    osin = Osin.remote(osin_server, tmp_path / "client", spool=True)
+    run_experiment(osin)
+    run_experiment(osin)
+
+    # the sync is interrupted before finishing the second run
+    replay = osin._replay_spooled_op
+    ops = []
+
+    def interrupted_replay(op: dict, state: dict):
+        if len(ops) == 3:
+            raise ConnectionError()
+        ops.append(op["op"])
+        replay(op, state)
+
+    osin._replay_spooled_op = interrupted_replay
+    with pytest.raises(ConnectionError):
+        osin.sync()
+    assert ops == ["start", "finish", "start"]
+    assert [exp_run.is_finished for exp_run in ExpRun.select()] == [True, False]
+
+    osin._replay_spooled_op = replay
+    assert osin.sync() == 1
+    assert [exp_run.is_finished for exp_run in ExpRun.select()] == [True, True]
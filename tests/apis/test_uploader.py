@@ -0,0 +1,96 @@
+import subprocess
+import threading
+from pathlib import Path
+from typing import List
+
+from osin.apis.uploader import CLAIM_SUFFIX, BackgroundUploader, UploadJob, _write_job
+
+
+def test_retry_with_backoff(tmp_path: Path):
+    attempts: List[int] = []
+
+    def upload(job: UploadJob):
+        attempts.append(job.n_attempts)
+        if job.n_attempts < 2:
+            raise ConnectionError("server is unreachable")
+
+    uploader = BackgroundUploader(upload, tmp_path, retry_delay=0.01)
+    uploader.submit(UploadJob(1, "run_001", {"is_finished": True}))
+    assert uploader.wait(timeout=5)
+    assert attempts == [0, 1, 2]
+    assert uploader.list_jobs() == []
+    uploader.close()
+
+    # a job failing too many times is moved aside
+    uploader = BackgroundUploader(
+        lambda job: 1 / 0, tmp_path, max_retries=1, retry_delay=0.01
+    )
+    uploader.submit(UploadJob(2, "run_002", {}))
+    assert uploader.wait(timeout=5)
+    failed_jobs = list((tmp_path / "failed").iterdir())
+    assert [path.name.endswith("-2.json") for path in failed_jobs] == [True]
+    uploader.close()
+
+
+def test_resume_pending_jobs(tmp_path: Path):
+    uploader = BackgroundUploader(lambda job: 1 / 0, tmp_path, retry_delay=60)
+    for exprun_id in [1, 2]:
+        uploader.submit(UploadJob(exprun_id, f"run_{exprun_id:03d}", {}))
+    assert not uploader.wait(timeout=0.1)
+    uploader.close()
+    assert len(uploader.list_jobs()) == 2
+
+    # the next uploader using the queue uploads the jobs in order
+    uploaded = []
+    uploader = BackgroundUploader(lambda job: uploaded.append(job.exprun_id), tmp_path)
+    assert uploader.wait(timeout=5)
+    assert uploaded == [1, 2]
+    assert uploader.list_jobs() == []
+    uploader.close()
+
+
+def test_claim_jobs(tmp_path: Path):
+    # the queue is not locked during an upload, so another uploader takes the next job
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_upload(job: UploadJob):
+        started.set()
+        release.wait(5)
+
+    uploader = BackgroundUploader(slow_upload, tmp_path)
+    uploader.submit(UploadJob(1, "run_001", {}))
+    assert started.wait(5)
+    assert uploader.list_jobs() == []
+    assert len(list(tmp_path.glob(f"*{CLAIM_SUFFIX}"))) == 1
+
+    uploaded = []
+    other_uploader = BackgroundUploader(
+        lambda job: uploaded.append(job.exprun_id), tmp_path, retry_delay=0.01
+    )
+    other_uploader.submit(UploadJob(2, "run_002", {}))
+    assert other_uploader.wait(timeout=5)
+    assert uploaded == [2]
+
+    release.set()
+    assert uploader.wait(timeout=5)
+    assert sorted(path.name for path in tmp_path.iterdir()) == [".lock"]
+    uploader.close()
+    other_uploader.close()
+
+
+def test_requeue_stale_claims(tmp_path: Path):
+    # a job claimed by a process that exited during the upload
+    proc = subprocess.Popen(["true"])
+    proc.wait()
+    _write_job(
+        tmp_path / f"00000000000000000001-1.json.{proc.pid}{CLAIM_SUFFIX}",
+        UploadJob(1, "run_001", {}),
+    )
+
+    uploaded = []
+    uploader = BackgroundUploader(lambda job: uploaded.append(job.exprun_id), tmp_path)
+    assert uploader.wait(timeout=5)
+    assert uploaded == [1]
+    assert uploader.list_jobs() == []
+    uploader.close()
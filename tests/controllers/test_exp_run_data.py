@@ -0,0 +1,329 @@
+import hashlib
+import io
+import os
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pytest
+from flask.testing import FlaskClient
+from osin.apis.remote_exp import RemoteExpRun
+from osin.app import app
+from osin.formats import BlobStore, Hdf5Format
+from osin.models import ExampleData, ExpRunData, Record
+from osin.models.exp import ExpRun
+from osin.repository import OsinRepository
+from osin.types.pyobject import OImage, OTable
+from osin.types.pyobject.html import OHTML
+
+
+@pytest.fixture
+def client(test_db: List[RemoteExpRun]):
+    OsinRepository.instance = test_db[0].osin.osin_keeper
+    try:
+        yield app.test_client()
+    finally:
+        OsinRepository.instance = None
+
+
+def test_fetch_exp_run_data(client: FlaskClient):
+    resp = client.get(
+        "/api/exprun/1/data?limit=1&offset=1&sorted_by=-data.primitive.recall"
+    )
+    assert resp.status_code == 200
+    assert resp.json == {
+        "aggregated": {
+            "primitive": {"precision": 0.6, "recall": 0.8, "support": 100},
+            "complex": [],
+        },
+        "individual": [
+            {
+                "id": "e01",
+                "name": "",
+                "data": {
+                    "primitive": {"precision": 1.0, "recall": 0.0},
+                    "complex": [],
+                    "n_complex": 0,
+                },
+            }
+        ],
+        "n_examples": 2,
+    }
+
+    resp = client.get("/api/exprun/1/data?sorted_by=data.primitive.f1")
+    assert resp.status_code == 400
+
+    resp = client.get("/api/exprun/2/data/individual/e02?fields=primitive")
+    assert resp.status_code == 200
+    assert resp.json["data"]["primitive"] == {"precision": 0.6, "recall": 0.6}
+
+    pool = OsinRepository.get_instance().data_file_pool
+    assert (pool.hits, pool.misses) == (1, 2)
+
+
+def test_fetch_filtered_exp_run_data(client: FlaskClient):
+    resp = client.get(
+        "/api/exprun/2/data",
+        query_string={"filter": "data.recall<0.5&&data.precision>=0.9"},
+    )
+    assert resp.status_code == 200
+    assert resp.json["n_examples"] == 1
+    assert [item["id"] for item in resp.json["individual"]] == ["e01"]
+
+    resp = client.get("/api/exprun/2/data", query_string={"filter": "data.f1<0.5"})
+    assert resp.status_code == 400
+
+    resp = client.get("/api/exprun/2/data", query_string={"filter": "data.recall"})
+    assert resp.status_code == 400
+
+
+def test_fetch_exp_run_data_stats(client: FlaskClient):
+    resp = client.get("/api/exprun/2/data/stats")
+    assert resp.status_code == 200
+    assert list(resp.json.keys()) == ["precision", "recall"]
+    assert resp.json["precision"]["mean"] == pytest.approx(0.75)
+    assert resp.json["recall"]["max"] == pytest.approx(0.6)
+
+    resp = client.get("/api/exprun/2/data/stats?fields=data.primitive.recall")
+    assert resp.status_code == 200
+    assert list(resp.json.keys()) == ["recall"]
+
+    # the second request is served from the cache
+    osin = OsinRepository.get_instance()
+    assert len(osin.data_stats_cache) == 2
+    exp_run = ExpRun.get_by_id(2)
+    assert (
+        osin.get_exp_run_data_stats(exp_run.exp, exp_run, ["recall"])
+        is next(reversed(osin.data_stats_cache.values()))[1]
+    )
+
+    resp = client.get("/api/exprun/2/data/stats?fields=data.f1")
+    assert resp.status_code == 400
+
+
+def test_diff_exp_run_data(client: FlaskClient):
+    resp = client.get("/api/exprun/1/diff/2?field=data.recall&sorted_by=id")
+    assert resp.status_code == 200
+    assert resp.json["n_examples"] == 2
+    assert resp.json["summary"]["n_increased"] == 2
+    assert [(item["id"], item["delta"]) for item in resp.json["items"]] == [
+        ("e01", pytest.approx(0.1)),
+        ("e02", pytest.approx(0.1)),
+    ]
+
+    resp = client.get("/api/exprun/1/diff/2?field=data.precision&changes=decreased")
+    assert resp.status_code == 200
+    assert [item["id"] for item in resp.json["items"]] == ["e01"]
+
+    resp = client.get("/api/exprun/1/diff/2?field=data.f1")
+    assert resp.status_code == 400
+
+
+def test_fetch_exp_run_without_data(client: FlaskClient):
+    osin = OsinRepository.get_instance()
+    exp_run = ExpRun.get_by_id(2)
+    os.remove(osin.get_exp_run_data_file(exp_run.exp, exp_run))
+
+    resp = client.get("/api/exprun/1/diff/2?field=data.recall")
+    assert resp.status_code == 404
+    assert "ExpRun with id 2 does not have data" in resp.text
+    resp = client.post("/api/exprun/2/data/individual", json={"example_ids": ["e01"]})
+    assert resp.status_code == 404
+    assert client.get("/api/exprun/2/data/individual/e01").status_code == 404
+    assert client.get("/api/exprun/2/data").status_code == 404
+
+
+def test_upload_deduplicated_run(client: FlaskClient, tmp_path: Path):
+    data = ExpRunData()
+    for example_id in ["e01", "e02"]:
+        data.individual[example_id] = ExampleData(
+            example_id, "", Record({}, {"gold": OHTML("<table>gold</table>")})
+        )
+    client_store = BlobStore(tmp_path / "client" / "blobs")
+    Hdf5Format(dedup=True, blob_store=client_store).save_run_data(
+        data, tmp_path / "client" / "data.h5"
+    )
+
+    def upload_run():
+        return client.post(
+            "/api/exprun/1/upload",
+            data={"data": (open(tmp_path / "client" / "data.h5", "rb"), "data.h5")},
+        )
+
+    # referenced blobs must be uploaded first
+    assert upload_run().status_code == 400
+
+    keys = Hdf5Format().get_blob_refs(tmp_path / "client" / "data.h5")
+    resp = client.post("/api/blob/missing", json={"keys": keys})
+    assert resp.json["keys"] == keys[:1]
+    resp = client.post(
+        "/api/blob",
+        data={keys[0]: (io.BytesIO(client_store.get(keys[0])), keys[0])},
+    )
+    assert resp.status_code == 200
+    assert upload_run().status_code == 200
+
+    resp = client.get("/api/blob/stats")
+    assert (resp.json["n_blobs"], resp.json["n_refs"]) == (1, 2)
+    assert resp.json["dedup_ratio"] == 2.0
+
+    resp = client.get("/api/exprun/1/data/individual/e02")
+    assert resp.status_code == 200
+    assert len(resp.json["data"]["complex"]) == 1
+
+    # replacing the run's data removes its references, the blob is kept until it is collected
+    (tmp_path / "client" / "data.h5").unlink()
+    Hdf5Format().save_run_data(data, tmp_path / "client" / "data.h5")
+    assert upload_run().status_code == 200
+    resp = client.get("/api/blob/stats")
+    assert (resp.json["n_blobs"], resp.json["n_refs"]) == (1, 0)
+
+
+def test_fetch_examples_data(client: FlaskClient):
+    resp = client.post(
+        "/api/exprun/2/data/individual",
+        json={"example_ids": ["e02", "e01"], "fields": ["primitive"]},
+    )
+    assert resp.status_code == 200
+    assert [item["id"] for item in resp.json["items"]] == ["e02", "e01"]
+    assert resp.json["items"][1]["data"]["primitive"] == {
+        "precision": 0.9,
+        "recall": 0.1,
+    }
+
+    resp = client.post(
+        "/api/exprun/2/data/individual", json={"example_ids": ["e01", "e03"]}
+    )
+    assert resp.status_code == 400
+
+
+def test_fetch_exp_run_data_preview(client: FlaskClient):
+    osin = OsinRepository.get_instance()
+    exp_run = ExpRun.get_by_id(1)
+    data = ExpRunData()
+    data.individual["e01"] = ExampleData(
+        "e01", "", Record({}, {"image": OImage(np.zeros((512, 256), dtype=np.uint8))})
+    )
+    datafile = osin.get_exp_run_data_file(exp_run.exp, exp_run)
+    os.remove(datafile)
+    Hdf5Format().save_run_data(data, datafile)
+
+    resp = client.get("/api/exprun/1/data/preview?example_id=e01&key=image&size=64")
+    assert resp.status_code == 200
+    assert resp.mimetype == "image/png"
+    assert resp.data.startswith(b"\x89PNG")
+    assert len(list((datafile.parent / ".preview").iterdir())) == 1
+    # the second request is served from the cache
+    resp2 = client.get("/api/exprun/1/data/preview?example_id=e01&key=image&size=64")
+    assert resp2.data == resp.data
+
+    resp = client.get("/api/exprun/1/data/preview?example_id=e02&key=image")
+    assert resp.status_code == 404
+    resp = client.get("/api/exprun/1/data/preview?example_id=e01&key=image&size=1")
+    assert resp.status_code == 400
+
+
+def test_fetch_exp_run_data_table_rows(client: FlaskClient):
+    osin = OsinRepository.get_instance()
+    exp_run = ExpRun.get_by_id(1)
+    data = ExpRunData()
+    data.individual["e01"] = ExampleData(
+        "e01",
+        "",
+        Record({}, {"table": OTable([{"a": i, "b": str(i)} for i in range(50)])}),
+    )
+    datafile = osin.get_exp_run_data_file(exp_run.exp, exp_run)
+    os.remove(datafile)
+    Hdf5Format().save_run_data(data, datafile)
+
+    resp = client.get("/api/exprun/1/data/table?example_id=e01&key=table&offset=45")
+    assert resp.status_code == 200
+    assert resp.json["n_rows"] == 50
+    assert resp.json["header"] == ["a", "b"]
+    assert resp.json["rows"] == [{"a": i, "b": str(i)} for i in range(45, 50)]
+
+    resp = client.get("/api/exprun/1/data/table?example_id=e01&key=missing")
+    assert resp.status_code == 404
+
+    # examples only have the first page of their tables
+    resp = client.get("/api/exprun/1/data/individual/e01")
+    table = dict(resp.json["data"]["complex"])["table"]
+    assert table["n_rows"] == 50 and table["header"] == ["a", "b"]
+    assert table["rows"] == [{"a": i, "b": str(i)} for i in range(20)]
+
+
+def test_fetch_exp_run_data_json_cache(client: FlaskClient):
+    osin = OsinRepository.get_instance()
+    exp_run = ExpRun.get_by_id(1)
+    datafile = osin.get_exp_run_data_file(exp_run.exp, exp_run)
+    queries = [
+        "/api/exprun/1/data?limit=1&offset=1",
+        "/api/exprun/1/data?sorted_by=-data.primitive.precision&filter=data.recall<0.6",
+        "/api/exprun/1/data?fields=individual",
+        "/api/exprun/1/data/individual/e02",
+    ]
+    expected = [client.get(query).json for query in queries]
+    assert expected[1]["n_examples"] == 2
+    expected.append(
+        client.post(
+            "/api/exprun/1/data/individual", json={"example_ids": ["e02", "e01"]}
+        ).json
+    )
+
+    data, _ = Hdf5Format().load_exp_run_data(datafile)
+    os.remove(datafile)
+    Hdf5Format(json_cache=True).save_run_data(data, datafile)
+    for query, output in zip(queries, expected):
+        resp = client.get(query)
+        assert resp.status_code == 200
+        assert resp.json == output
+    resp = client.post(
+        "/api/exprun/1/data/individual", json={"example_ids": ["e02", "e01"]}
+    )
+    assert resp.json == expected[-1]
+
+
+def test_chunked_upload(client: FlaskClient):
+    content = b'{"note": "' + b"x" * 2500 + b'"}'
+    chunks = [content[i : i + 1024] for i in range(0, len(content), 1024)]
+    body = {
+        "filename": "metadata.json",
+        "size": len(content),
+        "checksum": hashlib.sha256(content).hexdigest(),
+        "chunk_size": 1024,
+    }
+    resp = client.post("/api/exprun/1/uploads", json=body)
+    assert resp.status_code == 200
+    assert resp.json["n_received"] == 0
+    upload_url = f"/api/exprun/1/uploads/{resp.json['upload_id']}"
+
+    def put_chunk(index: int, data: bytes, checksum=None):
+        return client.put(
+            f"{upload_url}/{index}",
+            query_string={"checksum": checksum or hashlib.sha256(data).hexdigest()},
+            data=data,
+        )
+
+    assert put_chunk(1, chunks[1]).status_code == 409
+    assert put_chunk(0, chunks[0], checksum="0" * 64).status_code == 400
+    assert put_chunk(0, chunks[0][:-1]).status_code == 400
+    assert put_chunk(0, chunks[0]).json["n_received"] == 1
+    # resending a received chunk is ignored
+    assert put_chunk(0, chunks[0]).json["n_received"] == 1
+    assert client.post(f"{upload_url}/commit").status_code == 400
+
+    # initiating the same upload again resumes it
+    assert client.post("/api/exprun/1/uploads", json=body).json["n_received"] == 1
+    for i in range(1, len(chunks)):
+        assert put_chunk(i, chunks[i]).status_code == 200
+    assert client.post(f"{upload_url}/commit").status_code == 200
+    assert client.post(f"{upload_url}/commit").status_code == 404
+
+    osin = OsinRepository.get_instance()
+    exp_run = ExpRun.get_by_id(1)
+    rundir = osin.get_exp_run_dir(exp_run.exp, exp_run)
+    assert (rundir / "metadata.json").read_bytes() == content
+    assert not (rundir / ".uploads").exists()
+
+    body["filename"] = "run.exe"
+    assert client.post("/api/exprun/1/uploads", json=body).status_code == 400
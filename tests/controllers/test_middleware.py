@@ -0,0 +1,53 @@
+import gzip
+from typing import List
+
+import orjson
+import pytest
+from flask.testing import FlaskClient
+from osin.apis.remote_exp import RemoteExpRun
+from osin.app import app
+from osin.middleware import GzipRequestMiddleware
+from osin.repository import OsinRepository
+from werkzeug.test import Client
+from werkzeug.wrappers import Request, Response
+
+
+@pytest.fixture
+def client(test_db: List[RemoteExpRun]):
+    OsinRepository.instance = test_db[0].osin.osin_keeper
+    try:
+        yield app.test_client()
+    finally:
+        OsinRepository.instance = None
+
+
+def test_gzip_request_body(client: FlaskClient):
+    body = orjson.dumps({"example_ids": ["e02"], "fields": ["primitive"]})
+    resp = client.post(
+        "/api/exprun/2/data/individual",
+        data=gzip.compress(body),
+        headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+    )
+    assert resp.status_code == 200
+    assert resp.json["items"][0]["data"]["primitive"] == {
+        "precision": 0.6,
+        "recall": 0.6,
+    }
+
+
+def test_gzip_request_body_limit():
+    @Request.application
+    def echo(request: Request) -> Response:
+        return Response(request.get_data())
+
+    client = Client(GzipRequestMiddleware(echo, max_size=1000))
+    headers = {"Content-Encoding": "gzip"}
+    resp = client.post("/", data=gzip.compress(b"x" * 1000), headers=headers)
+    assert (resp.status_code, resp.data) == (200, b"x" * 1000)
+
+    resp = client.post("/", data=gzip.compress(b"x" * 1001), headers=headers)
+    assert resp.status_code == 413
+    resp = client.post("/", data=b"not gzip", headers=headers)
+    assert resp.status_code == 400
+    # uncompressed bodies are passed through
+    assert client.post("/", data=b"plain").data == b"plain"
@@ -0,0 +1,28 @@
+import pytest
+from osin.models import ExampleData, ExpRunData, Record
+from osin.types.pyobject.html import OHTML
+
+
+@pytest.fixture
+def run_data() -> ExpRunData:
+    data = ExpRunData()
+    data.aggregated.primitive = {"f1": 0.5}
+    data.individual["e01"] = ExampleData(
+        "e01",
+        "first",
+        Record(
+            {"metrics": {"f1": 0.3, "precision": 1}, "label": "cat"},
+            {"html": OHTML("<b>e01</b>")},
+        ),
+    )
+    data.individual["e02"] = ExampleData(
+        "e02",
+        "second",
+        Record({"metrics": {"f1": None, "precision": 2}, "label": "dog", "ok": True}),
+    )
+    data.individual["e03"] = ExampleData(
+        "e03",
+        "third",
+        Record({"metrics": {"f1": 0.1, "precision": 3}, "label": "cat"}),
+    )
+    return data
@@ -0,0 +1,49 @@
+from pathlib import Path
+
+import pytest
+from osin.formats import BlobStore
+
+
+def test_blob_store(tmp_path: Path):
+    store = BlobStore(tmp_path / "blobs")
+    key = store.put(b"<table>gold</table>")
+    assert store.put(b"<table>gold</table>") == key
+    other_key = store.put(b"<p>context</p>")
+    assert store.get(key) == b"<table>gold</table>"
+    assert store.missing([other_key, "0" * 64, key, "0" * 64]) == ["0" * 64]
+
+    stats = store.stats()
+    assert (stats["n_blobs"], stats["n_refs"]) == (2, 3)
+    assert stats["stored_bytes"] == 19 + 14
+    assert stats["dedup_ratio"] == pytest.approx((19 * 2 + 14) / (19 + 14))
+
+    store.decref([key, other_key])
+    assert store.stats()["n_refs"] == 1
+    assert store.gc(grace_period=0) == 1
+    assert store.missing([key, other_key]) == [other_key]
+    with pytest.raises(KeyError):
+        store.get(other_key)
+    with pytest.raises(KeyError):
+        store.incref([other_key])
+
+    # references are persisted
+    assert BlobStore(tmp_path / "blobs").stats()["n_refs"] == 1
+
+
+def test_blob_store_gc(tmp_path: Path):
+    store = BlobStore(tmp_path / "blobs")
+    key = store.put(b"<table>gold</table>")
+    # uploaded by a client for a run it has not uploaded yet
+    pending_key = store.put(b"<p>context</p>", n_refs=0)
+
+    # another client is told that the blob exists, then the only run referencing it is replaced
+    assert store.missing([key]) == []
+    store.decref([key])
+    assert store.gc() == 0
+    # so the client can still upload its run
+    store.incref([key])
+    assert store.get(key) == b"<table>gold</table>"
+    assert store.get(pending_key) == b"<p>context</p>"
+
+    assert store.gc(grace_period=0) == 1
+    assert store.missing([key, pending_key]) == [pending_key]
@@ -0,0 +1,81 @@
+from pathlib import Path
+
+import numpy as np
+from osin.formats import Hdf5Format
+from osin.formats.diff import ColumnDiff
+from osin.models import ExampleData, ExpRunData, Record
+
+
+def make_run(outputs: dict) -> ExpRunData:
+    data = ExpRunData()
+    for example_id, primitive in outputs.items():
+        data.individual[example_id] = ExampleData(example_id, "", Record(primitive))
+    return data
+
+
+def test_column_diff(tmp_path: Path):
+    format = Hdf5Format()
+    format.save_run_data(
+        make_run(
+            {
+                "e1": {"correct": True, "f1": 0.5, "label": "cat"},
+                "e2": {"correct": True, "f1": 0.2, "label": "dog"},
+                "e3": {"correct": False, "label": "cat"},
+                "e4": {"correct": False, "f1": 0.1, "label": "cat"},
+            }
+        ),
+        tmp_path / "a.h5",
+    )
+    format.save_run_data(
+        make_run(
+            {
+                "e5": {"correct": True, "f1": 0.9, "label": "cat"},
+                "e4": {"correct": True, "f1": 0.1, "label": "cat"},
+                "e3": {"correct": False, "f1": 0.3, "label": "dog"},
+                "e2": {"correct": False, "f1": 0.6, "label": "cat"},
+                "e1": {"correct": False, "f1": 0.4, "label": "cat"},
+            }
+        ),
+        tmp_path / "b.h5",
+    )
+
+    diff = ColumnDiff.from_columns(
+        format.get_column(tmp_path / "a.h5", "correct"),
+        format.get_column(tmp_path / "b.h5", "correct"),
+    )
+    summary = diff.summary()
+    assert (summary["n_common"], summary["n_only_a"], summary["n_only_b"]) == (4, 0, 1)
+    assert (summary["n_increased"], summary["n_decreased"]) == (1, 2)
+    positions, n_examples = diff.select(["decreased"], "id", "ascending", 0, 10)
+    assert n_examples == 2
+    assert [item["id"] for item in diff.to_dict(positions)] == ["e1", "e2"]
+    assert diff.to_dict(positions)[0] == {
+        "id": "e1",
+        "a": True,
+        "b": False,
+        "delta": -1.0,
+        "change": "decreased",
+    }
+
+    diff = ColumnDiff.from_columns(
+        format.get_column(tmp_path / "a.h5", "f1"),
+        format.get_column(tmp_path / "b.h5", "f1"),
+    )
+    positions, n_examples = diff.select(
+        ["increased", "decreased", "missing"], "abs_delta", "descending", 0, 2
+    )
+    assert n_examples == 3
+    assert [item["id"] for item in diff.to_dict(positions)] == ["e2", "e1"]
+    # examples without delta stay at the end
+    positions, _ = diff.select(
+        ["increased", "decreased", "missing"], "delta", "ascending", 2, 2
+    )
+    assert diff.to_dict(positions)[0]["id"] == "e3"
+    assert diff.to_dict(positions)[0]["change"] == "missing"
+    assert np.isclose(diff.summary()["mean_delta"], (0.4 - 0.1 + 0) / 3)
+
+    diff = ColumnDiff.from_columns(
+        format.get_column(tmp_path / "a.h5", "label"),
+        format.get_column(tmp_path / "b.h5", "label"),
+    )
+    assert diff.summary()["n_changed"] == 2
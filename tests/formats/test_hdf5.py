@@ -0,0 +1,711 @@
+import struct
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import orjson
+import pytest
+from h5py import File
+from osin.formats import BlobStore, Hdf5Compression, Hdf5FilePool, Hdf5Format
+from osin.formats.base import SaveTimings
+from osin.formats import hdf5
+from osin.formats.hdf5 import is_live_file
+from osin.models import ExampleData, ExpRunData, Record
+from osin.types.pyobject import OTABLE_PAGE_SIZE, OAudio, OImage, OTable
+from osin.types.pyobject.html import OHTML, OListHTML
+
+
+def write_legacy_file(data: ExpRunData, outfile: Path):
+    """Write the data using the previous layout: one group per example"""
+    format = Hdf5Format()
+    with File(outfile, "a") as f:
+        format._update_nested_primitive_object(
+            f.create_group("/aggregated/primitive", track_order=True),
+            data.aggregated.primitive,
+        )
+        f.create_group("/aggregated/complex", track_order=True)
+        ind_group = f.create_group("/individual", track_order=True)
+        for example_id, example in data.individual.items():
+            ex_group = ind_group.create_group(example_id, track_order=True)
+            ex_group.attrs["id"] = example.id
+            ex_group.attrs["name"] = example.name
+            format._update_nested_primitive_object(
+                ex_group.create_group("primitive", track_order=True),
+                example.data.primitive,
+            )
+            grp = ex_group.create_group("complex", track_order=True)
+            for key, obj in example.data.complex.items():
+                grp[key] = obj.serialize_hdf5()
+                grp.attrs[key] = obj.get_classpath()
+
+
+def test_columnar_layout(run_data: ExpRunData, tmp_path: Path):
+    format = Hdf5Format()
+    format.save_run_data(run_data, tmp_path / "data.h5")
+
+    with File(tmp_path / "data.h5", "r") as f:
+        assert f["individual"].attrs["layout"] == "columnar"
+        assert f["individual/primitive/metrics/f1"].shape == (3,)
+        assert f["individual/id"].asstr()[()].tolist() == ["e01", "e02", "e03"]
+
+    data, n_examples = format.load_exp_run_data(tmp_path / "data.h5")
+    assert n_examples == 3
+    assert data.aggregated.primitive == {"f1": 0.5}
+    assert data.individual == run_data.individual
+
+
+def test_irregular_primitive_outputs(tmp_path: Path):
+    outputs = [
+        {"a": 1, "b": 1, "c": {}, "d": {"x": 1}},
+        {"a": {"b": 2}, "b": 0.5, "c": {}, "d": {"x": {}}},
+        {"a": None, "c": {"y": 1}, "d": {"x": {"y": 2.5}}},
+    ]
+    data = ExpRunData()
+    for i, primitive in enumerate(outputs):
+        data.individual[f"e{i:02d}"] = ExampleData(f"e{i:02d}", "", Record(primitive))
+
+    format = Hdf5Format()
+    format.save_run_data(data, tmp_path / "data.h5")
+    loaded, _ = format.load_exp_run_data(tmp_path / "data.h5")
+    assert [e.data.primitive for e in loaded.individual.values()] == outputs
+    assert isinstance(loaded.individual["e00"].data.primitive["b"], int)
+
+    with File(tmp_path / "data.h5", "r") as f:
+        assert f["individual/primitive/a"].attrs["type"] == "json"
+        # ints and floats share a numeric column
+        assert f["individual/primitive/b"].attrs["type"] == "float"
+
+    # the same outputs written one example per batch: columns are merged or converted later
+    writer = format.open_stream_writer(tmp_path / "stream.h5", batch_size=1)
+    for i, primitive in enumerate(outputs):
+        writer.update_example(f"e{i:02d}", primitive=primitive)
+    writer.close(Record())
+    loaded, _ = format.load_exp_run_data(tmp_path / "stream.h5")
+    assert [e.data.primitive for e in loaded.individual.values()] == outputs
+    loaded, _ = format.load_exp_run_data(
+        tmp_path / "stream.h5", sorted_by="data/primitive/b", sorted_order="descending"
+    )
+    assert list(loaded.individual.keys()) == ["e00", "e01", "e02"]
+
+
+@pytest.mark.parametrize("layout", ["columnar", "legacy"])
+def test_load_exp_run_data(run_data: ExpRunData, tmp_path: Path, layout: str):
+    format = Hdf5Format()
+    if layout == "columnar":
+        format.save_run_data(run_data, tmp_path / "data.h5")
+    else:
+        write_legacy_file(run_data, tmp_path / "data.h5")
+
+    data, n_examples = format.load_exp_run_data(tmp_path / "data.h5", limit=2, offset=1)
+    assert n_examples == 3
+    assert list(data.individual.keys()) == ["e02", "e03"]
+
+    data, _ = format.load_exp_run_data(
+        tmp_path / "data.h5", sorted_by="name", sorted_order="descending"
+    )
+    assert list(data.individual.keys()) == ["e03", "e02", "e01"]
+
+    data, _ = format.load_exp_run_data(
+        tmp_path / "data.h5",
+        fields={"individual": {"primitive"}},
+        sorted_by="data/primitive/metrics/precision",
+        sorted_order="descending",
+        limit=1,
+    )
+    assert list(data.individual.keys()) == ["e03"]
+    assert (
+        data.individual["e03"].data.primitive
+        == run_data.individual["e03"].data.primitive
+    )
+    assert data.individual["e03"].data.complex == {}
+
+    example = format.get_example_data(
+        tmp_path / "data.h5", "e01", True, True, with_complex_size=True
+    )
+    assert example.data.primitive == run_data.individual["e01"].data.primitive
+    assert example.data.complex == run_data.individual["e01"].data.complex
+    assert example.to_dict()["data"]["n_complex"] == 1
+
+    with pytest.raises(KeyError):
+        format.get_example_data(tmp_path / "data.h5", "e04", True, True)
+
+    examples = format.get_examples_data(
+        tmp_path / "data.h5", ["e03", "e01", "e03"], True, False
+    )
+    assert [example.id for example in examples] == ["e03", "e01", "e03"]
+    assert examples[1].data.primitive == run_data.individual["e01"].data.primitive
+    assert examples[1].data.complex == {}
+
+
+def test_sort_index(run_data: ExpRunData, tmp_path: Path):
+    format = Hdf5Format()
+    format.save_run_data(run_data, tmp_path / "data.h5")
+
+    with File(tmp_path / "data.h5", "r") as f:
+        assert set(f["individual/sort_index"].keys()) == {"id", "name", "primitive"}
+        assert f["individual/sort_index/primitive/metrics/f1"].attrs["n_valid"] == 2
+        # string columns are sorted on the fly
+        assert "label" not in f["individual/sort_index/primitive"]
+
+    for sorted_order, expected_ids in [
+        ("ascending", ["e03", "e01", "e02"]),
+        ("descending", ["e01", "e03", "e02"]),
+    ]:
+        for offset in range(3):
+            data, _ = format.load_exp_run_data(
+                tmp_path / "data.h5",
+                limit=2,
+                offset=offset,
+                sorted_by="data/primitive/metrics/f1",
+                sorted_order=sorted_order,
+            )
+            assert list(data.individual.keys()) == expected_ids[offset : offset + 2]
+
+    data, _ = format.load_exp_run_data(
+        tmp_path / "data.h5", sorted_by="data/primitive/label"
+    )
+    assert list(data.individual.keys()) == ["e01", "e03", "e02"]
+
+    with pytest.raises(KeyError):
+        format.load_exp_run_data(tmp_path / "data.h5", sorted_by="data/primitive/f2")
+
+
+@pytest.mark.parametrize("layout", ["columnar", "legacy"])
+def test_random_access_pagination(tmp_path: Path, layout: str):
+    run_data = ExpRunData()
+    for i in range(50):
+        run_data.individual[f"e{i:02d}"] = ExampleData(
+            f"e{i:02d}",
+            "",
+            Record(
+                {"index": i},
+                {"html": OHTML(f"<b>{i}</b>")} if i % 3 == 0 else {},
+            ),
+        )
+
+    format = Hdf5Format()
+    if layout == "columnar":
+        format.save_run_data(run_data, tmp_path / "data.h5")
+    else:
+        write_legacy_file(run_data, tmp_path / "data.h5")
+
+    data, n_examples = format.load_exp_run_data(
+        tmp_path / "data.h5", limit=5, offset=40
+    )
+    assert n_examples == 50
+    assert list(data.individual.values()) == [
+        run_data.individual[f"e{i:02d}"] for i in range(40, 45)
+    ]
+
+    data, _ = format.load_exp_run_data(tmp_path / "data.h5", limit=5, offset=48)
+    assert list(data.individual.keys()) == ["e48", "e49"]
+
+
+@pytest.mark.parametrize("layout", ["columnar", "legacy"])
+def test_filter(run_data: ExpRunData, tmp_path: Path, layout: str):
+    format = Hdf5Format()
+    if layout == "columnar":
+        format.save_run_data(run_data, tmp_path / "data.h5")
+    else:
+        write_legacy_file(run_data, tmp_path / "data.h5")
+
+    for filter, expected_ids in [
+        ("data.label==cat", ["e01", "e03"]),
+        ("data.metrics.f1<0.5&&data.label==cat", ["e01", "e03"]),
+        ("data.primitive.metrics.f1>=0.2", ["e01"]),
+        ("data.metrics.f1==null", ["e02"]),
+        ("data.ok==true", ["e02"]),
+        ("data.label!=cat&&name==second", ["e02"]),
+        ("id>e01", ["e02", "e03"]),
+    ]:
+        data, n_examples = format.load_exp_run_data(tmp_path / "data.h5", filter=filter)
+        assert n_examples == len(expected_ids), filter
+        assert list(data.individual.keys()) == expected_ids, filter
+
+    data, n_examples = format.load_exp_run_data(
+        tmp_path / "data.h5",
+        filter="data.metrics.precision>1",
+        sorted_by="data/primitive/metrics/precision",
+        sorted_order="descending",
+        limit=1,
+        offset=1,
+    )
+    assert n_examples == 2
+    assert list(data.individual.keys()) == ["e02"]
+
+    with pytest.raises(KeyError):
+        format.load_exp_run_data(tmp_path / "data.h5", filter="data.f2<1")
+    with pytest.raises(ValueError):
+        format.load_exp_run_data(tmp_path / "data.h5", filter="data.label")
+
+
+@pytest.mark.parametrize("layout", ["columnar", "legacy"])
+def test_get_stats(run_data: ExpRunData, tmp_path: Path, layout: str):
+    format = Hdf5Format()
+    if layout == "columnar":
+        format.save_run_data(run_data, tmp_path / "data.h5")
+    else:
+        write_legacy_file(run_data, tmp_path / "data.h5")
+
+    stats = format.get_stats(tmp_path / "data.h5")
+    assert list(stats.keys()) == ["metrics/f1", "metrics/precision", "ok"]
+    assert stats["metrics/f1"]["count"] == 2
+    assert stats["metrics/f1"]["n_missing"] == 1
+    assert stats["metrics/f1"]["mean"] == pytest.approx(0.2)
+    assert stats["metrics/precision"] == {
+        "count": 3,
+        "n_missing": 0,
+        "mean": 2.0,
+        "std": pytest.approx(0.816496580927726),
+        "min": 1.0,
+        "max": 3.0,
+        "p50": 2.0,
+        "p90": pytest.approx(2.8),
+        "p99": pytest.approx(2.98),
+    }
+    assert stats["ok"]["p50"] == 1.0
+
+    assert list(format.get_stats(tmp_path / "data.h5", ["metrics/precision"])) == [
+        "metrics/precision"
+    ]
+    with pytest.raises(KeyError):
+        format.get_stats(tmp_path / "data.h5", ["label"])
+
+
+@pytest.mark.parametrize("n_buckets", [0, 4])
+def test_bucketed_layout(tmp_path: Path, n_buckets: int):
+    data = ExpRunData()
+    for i in range(20):
+        complex = {"html": OHTML(f"<b>{i}</b>")} if i % 3 != 0 else {}
+        data.individual[f"e{i:02d}"] = ExampleData(f"e{i:02d}", "", Record({}, complex))
+    format = Hdf5Format(n_complex_buckets=n_buckets)
+    format.save_run_data(data, tmp_path / "data.h5")
+
+    with File(tmp_path / "data.h5", "a") as f:
+        complex_group = f["individual/complex"]
+        if n_buckets == 0:
+            assert len(complex_group) == 13
+        else:
+            assert len(complex_group) <= n_buckets
+            assert sum(len(bucket) for bucket in complex_group.values()) == 13
+        # look up the groups by example ids instead of the row-ordinal index
+        del f["individual/complex_ref"]
+
+    for example_id in ["e00", "e01", "e19"]:
+        example = format.get_example_data(tmp_path / "data.h5", example_id, True, True)
+        assert example == data.individual[example_id]
+    # the object is found but is not stored as an array
+    with pytest.raises(ValueError):
+        with format.open_complex_array(tmp_path / "data.h5", "e01", "html"):
+            pass
+
+
+def test_stream_writer(tmp_path: Path):
+    format = Hdf5Format()
+    writer = format.open_stream_writer(tmp_path / "data.h5", batch_size=2)
+    writer.update_example("e01", primitive={"score": 1})
+    writer.update_example("e02", primitive={"score": 2})
+    writer.update_example("e02", "second", complex={"html": OHTML("<b>e02</b>")})
+    # the first batch is written when a new example arrives
+    writer.update_example("e03", primitive={"score": 2.5, "label": "cat"})
+    assert writer.n_examples == 2
+
+    writer.update_example("e04", primitive={"score": None, "label": "dog"})
+    writer.update_example("e05", primitive={"label": "cat"})
+    writer.close(Record(primitive={"score": 1.5}))
+
+    data, n_examples = format.load_exp_run_data(tmp_path / "data.h5")
+    assert n_examples == 5
+    assert data.aggregated.primitive == {"score": 1.5}
+    assert [e.data.primitive for e in data.individual.values()] == [
+        {"score": 1},
+        {"score": 2},
+        {"score": 2.5, "label": "cat"},
+        {"score": None, "label": "dog"},
+        {"label": "cat"},
+    ]
+    assert data.individual["e02"].name == "second"
+    assert data.individual["e02"].data.complex == {"html": OHTML("<b>e02</b>")}
+
+    data, _ = format.load_exp_run_data(
+        tmp_path / "data.h5",
+        sorted_by="data/primitive/score",
+        sorted_order="descending",
+    )
+    assert list(data.individual.keys()) == ["e03", "e02", "e01", "e04", "e05"]
+
+    # the JSON of the examples are written along with each batch
+    (tmp_path / "data.h5").unlink()
+    format = Hdf5Format(json_cache=True)
+    writer = format.open_stream_writer(tmp_path / "data.h5", batch_size=2)
+    for i in range(5):
+        writer.update_example(f"e{i:02d}", primitive={"score": i})
+    writer.close(Record())
+    items, _ = format.load_examples_json(tmp_path / "data.h5", offset=3)  # type: ignore
+    assert [orjson.loads(item)["data"]["primitive"] for item in items] == [
+        {"score": 3},
+        {"score": 4},
+    ]
+
+    # an example cannot be updated after its batch is written, the run can continue
+    (tmp_path / "data.h5").unlink()
+    writer = format.open_stream_writer(tmp_path / "data.h5", batch_size=1)
+    writer.update_example("e01", primitive={"score": 1})
+    writer.update_example("e02", primitive={"score": 2})
+    with pytest.raises(ValueError, match="e01"):
+        writer.update_example("e01", primitive={"score": 3})
+    writer.update_example("e03", primitive={"score": 3})
+    writer.close(Record())
+    data, _ = format.load_exp_run_data(tmp_path / "data.h5")
+    assert [e.data.primitive["score"] for e in data.individual.values()] == [1, 2, 3]
+
+
+READ_LIVE_FILE = """
+import sys, orjson
+from osin.formats import Hdf5Format
+data, n = Hdf5Format().load_exp_run_data(
+    sys.argv[1], sorted_by=sys.argv[2] or None, sorted_order="descending"
+)
+print(orjson.dumps({"n": n, "ids": list(data.individual.keys()),
+    "complex": [len(e.data.complex) for e in data.individual.values()]}).decode())
+"""
+
+
+def test_live_stream_writer(tmp_path: Path):
+    def read_live_file(sorted_by: str = "data/primitive/score"):
+        # HDF5 does not allow a process to open a file twice, so the reader is another process
+        output = subprocess.check_output(
+            [sys.executable, "-c", READ_LIVE_FILE, str(tmp_path / "data.h5"), sorted_by]
+        )
+        return orjson.loads(output)
+
+    format = Hdf5Format()
+    writer = format.open_stream_writer(tmp_path / "data.h5", batch_size=2, live=True)
+    writer.update_example("e01", primitive={"score": 1.0, "label": "cat"})
+    # the file can be read before the first batch is written
+    assert read_live_file(sorted_by="") == {"n": 0, "ids": [], "complex": []}
+    writer.update_example(
+        "e02", primitive={"score": 2.0}, complex={"html": OHTML("<b>e02</b>")}
+    )
+    writer.update_example("e03", primitive={"score": 0.5})
+    assert is_live_file(tmp_path / "data.h5")
+    assert read_live_file() == {"n": 2, "ids": ["e02", "e01"], "complex": [0, 0]}
+
+    # primitive outputs are fixed by the first batch
+    with pytest.raises(ValueError):
+        writer.update_example("e04", primitive={"f1": 0.5})
+    with pytest.raises(ValueError):
+        writer.update_example("e04", primitive={"score": "high"})
+
+    writer.update_example("e04", primitive={"score": 3}, complex={"html": OHTML("e04")})
+    writer.update_example("e05", primitive={"label": "dog"})
+    assert read_live_file() == {
+        "n": 4,
+        "ids": ["e04", "e02", "e01", "e03"],
+        "complex": [0, 0, 0, 0],
+    }
+
+    writer.close(Record(primitive={"score": 1.5}, complex={"html": OHTML("agg")}))
+    assert not is_live_file(tmp_path / "data.h5")
+    assert not writer.get_complex_file().exists()
+    assert read_live_file()["complex"] == [1, 1, 0, 0, 0]
+
+    data, n_examples = format.load_exp_run_data(tmp_path / "data.h5")
+    assert n_examples == 5
+    assert data.aggregated.primitive == {"score": 1.5}
+    assert data.aggregated.complex == {"html": OHTML("agg")}
+    assert [e.data.primitive for e in data.individual.values()] == [
+        {"score": 1.0, "label": "cat"},
+        {"score": 2.0},
+        {"score": 0.5},
+        {"score": 3.0},
+        {"label": "dog"},
+    ]
+    assert data.individual["e02"].data.complex == {"html": OHTML("<b>e02</b>")}
+    assert data.individual["e04"].data.complex == {"html": OHTML("e04")}
+
+
+def test_parallel_decode(run_data: ExpRunData, tmp_path: Path):
+    run_data.aggregated.complex["table"] = OTable([{"a": 1, "b": OHTML("x")}])
+    for i, example in enumerate(run_data.individual.values()):
+        example.data.complex["table"] = OTable([{"a": j} for j in range(i + 3)])
+    Hdf5Format().save_run_data(run_data, tmp_path / "data.h5")
+
+    with ThreadPoolExecutor(2) as executor:
+        format = Hdf5Format(decode_executor=executor)
+        data, _ = format.load_exp_run_data(tmp_path / "data.h5")
+        assert data == Hdf5Format().load_exp_run_data(tmp_path / "data.h5")[0]
+        assert data.aggregated.complex == run_data.aggregated.complex
+        examples = format.get_examples_data(
+            tmp_path / "data.h5", list(run_data.individual.keys())[::-1], True, True
+        )
+    assert examples == list(run_data.individual.values())[::-1]
+
+
+def test_pipelined_serialization(run_data: ExpRunData, tmp_path: Path):
+    run_data.aggregated.complex["table"] = OTable([{"a": 1, "b": OHTML("x")}])
+    for i, example in enumerate(run_data.individual.values()):
+        example.data.complex["table"] = OTable([{"a": j} for j in range(i + 3)])
+    Hdf5Format().save_run_data(run_data, tmp_path / "serial.h5")
+
+    timings = SaveTimings()
+    with ThreadPoolExecutor(2) as executor:
+        Hdf5Format(serialize_executor=executor).save_run_data(
+            run_data, tmp_path / "pipelined.h5", timings
+        )
+    # objects are written in the same order, so the files are the same
+    assert (tmp_path / "serial.h5").read_bytes() == (
+        tmp_path / "pipelined.h5"
+    ).read_bytes()
+    assert timings.serialize > 0 and timings.total >= timings.write > 0
+
+
+def test_id_index(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(hdf5, "ID_INDEX_BLOCK_SIZE", 3)
+    data = ExpRunData()
+    example_ids = [f"ex{i}" for i in [5, 12, 3, 0, 9, 1, 100, 7]]
+    for example_id in example_ids:
+        data.individual[example_id] = ExampleData(
+            example_id, example_id.upper(), Record({"score": len(example_id)})
+        )
+    format = Hdf5Format()
+    format.save_run_data(data, tmp_path / "data.h5")
+
+    with File(tmp_path / "data.h5", "r") as f:
+        index = f["individual/id_index"]
+        assert index["ids"][()].tolist() == sorted(x.encode() for x in example_ids)
+        assert index["fences"][()].tolist() == [b"ex0", b"ex12", b"ex7"]
+
+        query = ["ex7", "ex0", "ex100", "ex12", "ex9"]
+        rows = format._find_rows(f["individual"], query)
+        assert rows.tolist() == [example_ids.index(x) for x in query]
+        for missing in ["ex", "ex10", "ex1000", "a", "zz"]:
+            with pytest.raises(KeyError):
+                format._find_rows(f["individual"], [missing])
+
+    examples = format.get_examples_data(
+        tmp_path / "data.h5", ["ex100", "ex3"], True, False
+    )
+    assert [(e.id, e.name) for e in examples] == [("ex100", "EX100"), ("ex3", "EX3")]
+
+
+def test_json_cache(run_data: ExpRunData, tmp_path: Path):
+    format = Hdf5Format(json_cache=True)
+    format.save_run_data(run_data, tmp_path / "data.h5")
+
+    kwargs = dict(
+        limit=2, sorted_by="data/primitive/metrics/precision", sorted_order="descending"
+    )
+    data, n_examples = format.load_exp_run_data(
+        tmp_path / "data.h5", with_complex_size=True, filter="data.label==cat", **kwargs
+    )
+    items, n_json_examples = format.load_examples_json(
+        tmp_path / "data.h5", filter="data.label==cat", **kwargs
+    )
+    assert n_json_examples == n_examples == 2
+    assert [orjson.loads(item) for item in items] == [
+        orjson.loads(orjson.dumps(example.to_dict()))
+        for example in data.individual.values()
+    ]
+    items = format.get_examples_json(tmp_path / "data.h5", ["e02", "e01"])
+    assert [orjson.loads(item)["id"] for item in items] == ["e02", "e01"]  # type: ignore
+    assert orjson.loads(items[1])["data"]["complex"] == [  # type: ignore
+        ["html", OHTML("<b>e01</b>").to_dict()]
+    ]
+
+    # files without the JSON of their examples fall back to the python objects
+    (tmp_path / "data.h5").unlink()
+    Hdf5Format().save_run_data(run_data, tmp_path / "data.h5")
+    assert format.load_examples_json(tmp_path / "data.h5") is None
+    assert format.get_examples_json(tmp_path / "data.h5", ["e01"]) is None
+
+
+def test_compression(run_data: ExpRunData, tmp_path: Path):
+    run_data.aggregated.complex["html"] = OHTML("<p>aggregated</p>" * 100)
+    format = Hdf5Format(
+        compression=Hdf5Compression("lzf"),
+        compression_by_type={OHTML: Hdf5Compression("gzip", 9)},
+    )
+    format.save_run_data(run_data, tmp_path / "data.h5")
+
+    with File(tmp_path / "data.h5", "r") as f:
+        assert f["aggregated/complex/html"].compression == "gzip"
+        group = format._get_complex_group(f["individual"], "e01")
+        assert group["html"].compression == "gzip"  # type: ignore
+
+    # decompression does not depend on the options of the format
+    data, _ = Hdf5Format().load_exp_run_data(tmp_path / "data.h5")
+    assert data.aggregated.complex == run_data.aggregated.complex
+    assert data.individual == run_data.individual
+
+
+def test_dedup(run_data: ExpRunData, tmp_path: Path):
+    for example in run_data.individual.values():
+        example.data.complex["gold"] = OHTML("<table>gold</table>")
+    store = BlobStore(tmp_path / "blobs")
+    format = Hdf5Format(dedup=True, blob_store=store)
+    format.save_run_data(run_data, tmp_path / "data.h5")
+
+    refs = format.get_blob_refs(tmp_path / "data.h5")
+    assert len(refs) == 4
+    assert store.stats()["n_blobs"] == 2
+
+    data, _ = format.load_exp_run_data(tmp_path / "data.h5")
+    assert data.individual == run_data.individual
+    with pytest.raises(ValueError):
+        Hdf5Format().load_exp_run_data(tmp_path / "data.h5")
+
+
+def test_dedup_table(run_data: ExpRunData, tmp_path: Path):
+    table = OTable([{"id": i, "label": f"l{i}", "html": OHTML("x")} for i in range(10)])
+    table.rows[2]["label"] = None  # type: ignore
+    for example in run_data.individual.values():
+        example.data.complex["table"] = table
+    store = BlobStore(tmp_path / "blobs")
+    format = Hdf5Format(dedup=True, blob_store=store)
+    format.save_run_data(run_data, tmp_path / "data.h5")
+
+    # tables are encoded to the same bytes every time, so they are stored once (the other blob is
+    # the aggregated HTML)
+    assert len(format.get_blob_refs(tmp_path / "data.h5")) == 4
+    assert store.stats()["n_blobs"] == 2
+
+    data, _ = format.load_exp_run_data(tmp_path / "data.h5")
+    assert data.individual == run_data.individual
+    with format.open_complex_columns(tmp_path / "data.h5", "e02", "table") as (
+        cls,
+        columns,
+        _,
+    ):
+        page = cls.read_rows(columns, 1, 2)
+    assert page["n_rows"] == 10
+    assert page["rows"] == [
+        {"id": 1, "label": "l1", "html": OHTML("x").to_dict()},
+        {"id": 2, "label": None, "html": OHTML("x").to_dict()},
+    ]
+
+
+def test_file_pool(run_data: ExpRunData, tmp_path: Path):
+    format = Hdf5Format()
+    for name in ["a.h5", "b.h5"]:
+        format.save_run_data(run_data, tmp_path / name)
+
+    pool = Hdf5FilePool(capacity=1)
+    with pool.open(tmp_path / "a.h5") as f:
+        _, n_examples = format.load_exp_run_data(f, limit=1)
+        assert n_examples == 3
+    with pool.open(tmp_path / "a.h5") as f:
+        # borrowing the file does not close it
+        assert f.id.valid
+        # evict a.h5 while it is being used
+        with pool.open(tmp_path / "b.h5") as f2:
+            assert format.get_example_data(f2, "e01", True, True).id == "e01"
+        assert f.id.valid
+        assert format.get_example_data(f, "e02", True, True).id == "e02"
+    assert not f.id.valid
+    assert pool.stats() == {"capacity": 1, "size": 1, "hits": 1, "misses": 2}
+
+    # replacing the file opens a new handle
+    (tmp_path / "b.h5").unlink()
+    run_data.individual.pop("e01")
+    format.save_run_data(run_data, tmp_path / "b.h5")
+    with pool.open(tmp_path / "b.h5") as f:
+        assert format.load_exp_run_data(f)[1] == 2
+    assert pool.misses == 3
+
+    pool.invalidate(tmp_path / "b.h5")
+    assert pool.stats()["size"] == 0
+
+
+def test_media_objects(tmp_path: Path):
+    image = (
+        np.random.RandomState(1).randint(0, 256, size=(300, 200, 3)).astype(np.uint8)
+    )
+    audio = np.sin(np.linspace(0, 100, 48000)).astype(np.float32)
+    data = ExpRunData()
+    data.individual["e01"] = ExampleData(
+        "e01", "", Record({}, {"image": OImage(image), "audio": OAudio(audio, 48000)})
+    )
+    format = Hdf5Format()
+    format.save_run_data(data, tmp_path / "data.h5")
+
+    output, _ = format.load_exp_run_data(tmp_path / "data.h5")
+    complex = output.individual["e01"].data.complex
+    assert np.array_equal(complex["image"].object, image)
+    assert np.array_equal(complex["audio"].object, audio)
+    assert complex["audio"].sample_rate == 48000
+
+    with format.open_complex_array(tmp_path / "data.h5", "e01", "image") as (
+        cls,
+        value,
+        attrs,
+    ):
+        assert value.chunks is not None and value.compression == "gzip"
+        content, mimetype = cls.make_preview(value, attrs, 64)
+    assert mimetype == "image/png" and content.startswith(b"\x89PNG")
+    # width and height of the thumbnail in the IHDR chunk
+    assert struct.unpack(">II", content[16:24]) == (40, 60)
+
+    with format.open_complex_array(tmp_path / "data.h5", "e01", "audio") as (
+        cls,
+        value,
+        attrs,
+    ):
+        content, mimetype = cls.make_preview(value, attrs, 100)
+    waveform = orjson.loads(content)
+    assert mimetype == "application/json"
+    assert len(waveform["min"]) == len(waveform["max"]) == 100
+    assert waveform["sample_rate"] == 48000
+
+    with pytest.raises(KeyError):
+        with format.open_complex_array(tmp_path / "data.h5", "e02", "image"):
+            pass
+
+
+def test_columnar_table(tmp_path: Path):
+    table = OTable(
+        [
+            {"id": i, "score": i / 10, "label": f"l{i}", "html": OHTML(f"<b>{i}</b>")}
+            for i in range(100)
+        ]
+    )
+    table.rows[3]["html"] = OHTML("<b>3</b>", "popover")  # type: ignore
+    table.rows[5]["label"] = None  # type: ignore
+    table.rows[7]["items"] = OListHTML([OHTML("a"), OHTML("b")], 2)  # type: ignore
+    data = ExpRunData()
+    data.individual["e01"] = ExampleData("e01", "", Record({}, {"table": table}))
+    format = Hdf5Format()
+    format.save_run_data(data, tmp_path / "data.h5")
+
+    with File(tmp_path / "data.h5", "r") as f:
+        group = format._get_complex_group(f["individual"], "e01")["table"]
+        assert group["c1"].dtype == np.float64 and group["c1"].chunks is not None
+
+    output, _ = format.load_exp_run_data(tmp_path / "data.h5")
+    assert output.individual["e01"].data.complex["table"] == table
+    # only the first page of rows is sent with the example
+    page = output.individual["e01"].data.complex["table"].to_dict()
+    assert page == table.to_dict()
+    assert page["n_rows"] == 100 and len(page["rows"]) == OTABLE_PAGE_SIZE
+
+    with format.open_complex_columns(tmp_path / "data.h5", "e01", "table") as (
+        cls,
+        columns,
+        attrs,
+    ):
+        page = cls.read_rows(columns, 3, 5)
+    assert page["n_rows"] == 100
+    assert page["header"] == ["id", "score", "label", "html", "items"]
+    assert [row["id"] for row in page["rows"]] == [3, 4, 5, 6, 7]
+    assert page["rows"][0]["html"] == OHTML("<b>3</b>", "popover").to_dict()
+    assert page["rows"][2]["label"] is None
+    assert "items" not in page["rows"][0]
+    assert page["rows"][4]["items"] == table.rows[7]["items"].to_dict()  # type: ignore
+
+    # tables stored as a single JSON document by previous versions are still readable
+    legacy_value = orjson.dumps(
+        {"rows": [{"a": 1, "b": {"type": "html", "value": "x", "popover": None}}]}
+    )
+    assert OTable.from_hdf5(legacy_value) == OTable([{"a": 1, "b": OHTML("x")}])
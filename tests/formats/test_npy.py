@@ -0,0 +1,141 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+from osin.formats import Hdf5Format, NpyFormat, detect_format
+from osin.models import ExampleData, ExpRunData, Record
+from osin.types.pyobject import OAudio, OTable
+from osin.types.pyobject.html import OHTML
+
+
+def test_round_trip(run_data: ExpRunData, tmp_path: Path):
+    run_data.aggregated.complex["html"] = OHTML("<p>aggregated</p>")
+    format = NpyFormat()
+    format.save_run_data(run_data, tmp_path / format.data_file_name)
+    assert isinstance(detect_format(tmp_path), NpyFormat)
+
+    # columns are memory-mapped
+    assert isinstance(np.load(tmp_path / "data.c0.npy", mmap_mode="r"), np.memmap)
+
+    data, n_examples = format.load_exp_run_data(tmp_path / "data.npyc")
+    assert n_examples == 3
+    assert data.aggregated.primitive == run_data.aggregated.primitive
+    assert data.aggregated.complex == run_data.aggregated.complex
+    assert data.individual == run_data.individual
+
+    # same outputs as the HDF5 format
+    Hdf5Format().save_run_data(run_data, tmp_path / "data.h5")
+    for kwargs in [
+        dict(limit=2, offset=1),
+        dict(sorted_by="name", sorted_order="descending"),
+        dict(sorted_by="data/primitive/metrics/f1", limit=2, offset=1),
+        dict(sorted_by="data/primitive/metrics/f1", sorted_order="descending"),
+        dict(sorted_by="data/primitive/label"),
+        dict(fields={"individual": {"primitive"}}, limit=1),
+        dict(filter="data.label==cat&&data.metrics.precision>1"),
+        dict(filter="data.metrics.f1!=null", sorted_by="name", limit=1, offset=1),
+    ]:
+        npy_data, _ = format.load_exp_run_data(tmp_path / "data.npyc", **kwargs)
+        h5_data, _ = Hdf5Format().load_exp_run_data(tmp_path / "data.h5", **kwargs)
+        assert list(npy_data.individual.values()) == list(h5_data.individual.values())
+
+    with pytest.raises(KeyError):
+        format.load_exp_run_data(tmp_path / "data.npyc", sorted_by="data/primitive/f2")
+
+    assert format.get_stats(tmp_path / "data.npyc") == Hdf5Format().get_stats(
+        tmp_path / "data.h5"
+    )
+
+
+def test_get_examples_data(run_data: ExpRunData, tmp_path: Path):
+    format = NpyFormat()
+    format.save_run_data(run_data, tmp_path / "data.npyc")
+
+    examples = format.get_examples_data(
+        tmp_path / "data.npyc", ["e03", "e01", "e03"], True, False
+    )
+    assert [example.id for example in examples] == ["e03", "e01", "e03"]
+    assert examples[1].data.primitive == run_data.individual["e01"].data.primitive
+    assert examples[1].data.complex == {}
+
+    example = format.get_example_data(
+        tmp_path / "data.npyc", "e01", True, True, with_complex_size=True
+    )
+    assert example.data.complex == run_data.individual["e01"].data.complex
+    assert example.to_dict()["data"]["n_complex"] == 1
+
+    with pytest.raises(KeyError):
+        format.get_example_data(tmp_path / "data.npyc", "e04", True, True)
+
+
+def test_irregular_primitive_outputs(tmp_path: Path):
+    outputs = [
+        {"a": 1, "b": 1, "c": {}, "d": {"x": 1}, "e": {}},
+        {"a": {"b": 2}, "b": 0.5, "c": {}, "d": {"x": {}}},
+        {"a": None, "c": {"y": 1}, "d": {"x": {"y": 2.5}}},
+    ]
+    data = ExpRunData()
+    for i, primitive in enumerate(outputs):
+        data.individual[f"e{i:02d}"] = ExampleData(f"e{i:02d}", "", Record(primitive))
+
+    NpyFormat().save_run_data(data, tmp_path / "data.npyc")
+    Hdf5Format().save_run_data(data, tmp_path / "data.h5")
+    loaded, _ = NpyFormat().load_exp_run_data(tmp_path / "data.npyc")
+    assert [e.data.primitive for e in loaded.individual.values()] == outputs
+    assert isinstance(loaded.individual["e00"].data.primitive["b"], int)
+    # both formats read back the same data
+    assert loaded == Hdf5Format().load_exp_run_data(tmp_path / "data.h5")[0]
+
+
+def test_empty_run(tmp_path: Path):
+    format = NpyFormat()
+    format.save_run_data(ExpRunData(), tmp_path / "data.npyc")
+    data, n_examples = format.load_exp_run_data(tmp_path / "data.npyc", sorted_by="id")
+    assert n_examples == 0
+    assert data.individual == {}
+
+
+def test_media_objects(tmp_path: Path):
+    audio = np.arange(1000, dtype=np.float32).reshape(500, 2)
+    data = ExpRunData()
+    data.individual["e01"] = ExampleData(
+        "e01", "", Record({}, {"audio": OAudio(audio, 8000)})
+    )
+    format = NpyFormat()
+    format.save_run_data(data, tmp_path / format.data_file_name)
+
+    output, _ = format.load_exp_run_data(tmp_path / format.data_file_name)
+    obj = output.individual["e01"].data.complex["audio"]
+    assert np.array_equal(obj.object, audio) and obj.sample_rate == 8000
+
+    with format.open_complex_array(
+        tmp_path / format.data_file_name, "e01", "audio"
+    ) as (cls, value, attrs):
+        assert cls is OAudio
+        assert np.array_equal(value, audio) and attrs == {"sample_rate": 8000}
+        # the array is a read-only view of the memory-mapped blob file
+        assert not value.flags.writeable and not value.flags.owndata
+    with pytest.raises(KeyError):
+        with format.open_complex_array(
+            tmp_path / format.data_file_name, "e01", "image"
+        ):
+            pass
+
+
+def test_columnar_table(tmp_path: Path):
+    table = OTable([{"a": i, "b": OHTML(str(i))} for i in range(10)])
+    data = ExpRunData()
+    data.aggregated.complex["table"] = table
+    format = NpyFormat()
+    format.save_run_data(data, tmp_path / format.data_file_name)
+
+    output, _ = format.load_exp_run_data(tmp_path / format.data_file_name)
+    assert output.aggregated.complex["table"] == table
+    with format.open_complex_columns(
+        tmp_path / format.data_file_name, None, "table"
+    ) as (cls, columns, attrs):
+        page = cls.read_rows(columns, 8, 5)
+        assert not columns["c0"].flags.writeable and not columns["c0"].flags.owndata
+    assert page["rows"] == [
+        {"a": i, "b": OHTML(str(i)).to_dict()} for i in range(8, 10)
+    ]
@@ -15,6 +15,7 @@ import {
   ExperimentRunData,
   ExpRunDataTracker,
 } from "./ExperimentRunData";
+import { PyOTable } from "./pyobject";
 
 export class ExperimentRunStore extends SimpleCRUDStore<number, ExperimentRun> {
   public noRunsOfExperiment: { [expId: number]: number } = {};
@@ -62,6 +63,25 @@ export class ExperimentRunStore extends SimpleCRUDStore<number, ExperimentRun> {
     return resp.data;
   }
 
+  // fetch a range of rows of a table of an example, it doesn't update the store
+  async fetchTableRows(
+    exprun: ExperimentRun,
+    exampleId: string,
+    key: string,
+    offset: number,
+    limit: number
+  ): Promise<PyOTable> {
+    const resp = await axios.get(`${this.remoteURL}/${exprun.id}/data/table`, {
+      params: {
+        example_id: exampleId,
+        key,
+        offset,
+        limit,
+      },
+    });
+    return resp.data;
+  }
+
   fetchExampleData: (
     exprun: ExperimentRun,
     exampleId: string
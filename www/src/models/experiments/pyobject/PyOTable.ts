@@ -3,7 +3,9 @@ import { PyOHtml, PyOListHtml } from "./PyOHtml";
 export interface PyOTable {
   type: "table";
   header: string[];
+  // only the first page of rows, the other rows are fetched by range
   rows: PyOTableRow[];
+  n_rows: number;
 }
 
 export interface PyOTableRow {
@@ -205,6 +205,7 @@ export const ExpandableCell = observer(
                 key={`${record.id}-${key}`}
                 id={`${record.id}-${key}`}
                 object={value}
+                source={{ exprun, exampleId: record.id, key }}
               />
             ),
           };
@@ -1,17 +1,20 @@
 import { PyObject } from "models/experiments/pyobject";
 import { PyObjectHtml, PyObjectListHtml } from "./PyObjectHtml";
-import { PyObjectTable } from "./PyObjectTable";
+import { PyObjectTable, PyObjectSource } from "./PyObjectTable";
 
 export const PyObjectComponent = ({
   id,
   object,
+  source,
 }: {
   id: string;
   object: PyObject;
+  // where the object is stored, to fetch parts of the object that are not sent with it
+  source?: PyObjectSource;
 }) => {
   const type = object.type;
   if (type === "table") {
-    return <PyObjectTable object={object} id={id} />;
+    return <PyObjectTable object={object} id={id} source={source} />;
   }
 
   if (type === "html") {
@@ -8,6 +8,7 @@ import _ from "lodash";
 import memoizeOne from "memoize-one";
 import { action, makeObservable, observable, toJS } from "mobx";
 import { observer } from "mobx-react";
+import { ExperimentRun, useStores } from "models";
 import {
   PyOTable,
   PyOTableCell,
@@ -20,6 +21,12 @@ import { PyObjectComponent } from "./PyObject";
 
 type WrappedPyOTableRow = { id: number; row: PyOTableRow };
 
+export type PyObjectSource = {
+  exprun: ExperimentRun;
+  exampleId: string;
+  key: string;
+};
+
 class PyObjectTableStore {
   rows: PyOTableRow[];
   filteredRows: PyOTableRow[];
@@ -86,8 +93,23 @@ class PyObjectTableStore {
 }
 
 export const PyObjectTable = observer(
-  ({ id, object }: { id: string; object: PyOTable }) => {
+  ({
+    id,
+    object,
+    source,
+  }: {
+    id: string;
+    object: PyOTable;
+    source?: PyObjectSource;
+  }) => {
+    const { expRunStore } = useStores();
     const openStateStore = useContext(OpenStateStore);
+    // only the first page of rows is sent with the table, the other pages are fetched from the
+    // server (searching and sorting are only available when all rows are sent)
+    const isPartial =
+      source !== undefined &&
+      object.n_rows !== undefined &&
+      object.n_rows > object.rows.length;
     let pyObjectTableStore: PyObjectTableStore;
     if ((openStateStore as any).pyobjecttables === undefined) {
       (openStateStore as any).pyobjecttables = new Map();
@@ -104,10 +126,53 @@ export const PyObjectTable = observer(
 
     const tableRef = useRef<TableComponentFunc<WrappedPyOTableRow>>(null);
 
+    const renderCell = (
+      value: PyOTableCell,
+      recordIndex: number,
+      columnIndex: number,
+      query: string
+    ) => {
+      if (typeof value !== "object" || value === null) {
+        const newvalue = Render.auto(value);
+        if (query.length > 0 && typeof newvalue === "string") {
+          return (
+            <Highlighter
+              highlightStyle={{
+                backgroundColor: "#ffc069",
+                padding: 0,
+              }}
+              searchWords={[query]}
+              autoEscape
+              textToHighlight={newvalue}
+            />
+          );
+        }
+        return newvalue;
+      }
+      return (
+        <PyObjectComponent
+          id={`${id}-${recordIndex}-${columnIndex}`}
+          object={value}
+        />
+      );
+    };
+
     let columns =
       object.rows.length === 0
         ? []
         : object.header.map((column, columnIndex) => {
+            if (isPartial) {
+              return {
+                title: column,
+                key: `row.${column}`,
+                dataIndex: ["row", column],
+                render: (
+                  value: PyOTableCell,
+                  record: WrappedPyOTableRow,
+                  recordIndex: number
+                ) => renderCell(value, recordIndex, columnIndex, ""),
+              };
+            }
             const filterProps = getTextSearchFilterProps(
               pyObjectTableStore.queries[columnIndex],
               (query) => {
@@ -131,35 +196,13 @@ export const PyObjectTable = observer(
                 value: PyOTableCell,
                 record: WrappedPyOTableRow,
                 recordIndex: number
-              ) => {
-                if (typeof value !== "object" || value === null) {
-                  const newvalue = Render.auto(value);
-                  if (
-                    pyObjectTableStore.queries[columnIndex].length > 0 &&
-                    typeof newvalue === "string"
-                  ) {
-                    return (
-                      <Highlighter
-                        highlightStyle={{
-                          backgroundColor: "#ffc069",
-                          padding: 0,
-                        }}
-                        searchWords={[pyObjectTableStore.queries[columnIndex]]}
-                        autoEscape
-                        textToHighlight={newvalue}
-                      />
-                    );
-                  }
-                  return newvalue;
-                } else {
-                  return (
-                    <PyObjectComponent
-                      id={`${id}-${recordIndex}-${columnIndex}`}
-                      object={value}
-                    />
-                  );
-                }
-              },
+              ) =>
+                renderCell(
+                  value,
+                  recordIndex,
+                  columnIndex,
+                  pyObjectTableStore.queries[columnIndex]
+                ),
               ...filterProps,
             };
           });
@@ -172,6 +215,28 @@ export const PyObjectTable = observer(
         defaultPageSize={20}
         store={{
           query: async (limit, offset, conditions, sorts) => {
+            if (isPartial) {
+              let rows: PyOTableRow[];
+              if (offset + limit <= object.rows.length) {
+                rows = object.rows.slice(offset, offset + limit);
+              } else {
+                const page = await expRunStore.fetchTableRows(
+                  source!.exprun,
+                  source!.exampleId,
+                  source!.key,
+                  offset,
+                  limit
+                );
+                rows = page.rows;
+              }
+              return {
+                records: rows.map((row, index) => ({
+                  id: offset + index,
+                  row,
+                })),
+                total: object.n_rows,
+              };
+            }
             return {
               records: pyObjectTableStore
                 .sortRecords(